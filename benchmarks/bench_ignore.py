@@ -0,0 +1,107 @@
+"""
+Benchmark of FileSelector.valid_file over a synthetic list of repository paths.
+
+    python benchmarks/bench_ignore.py --paths 500000
+"""
+
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from llm_devtale.config import ParserConfig
+from llm_devtale.files import FileRepo, FileSelector
+
+FOLDER_NAMES = [
+    "src",
+    "lib",
+    "app",
+    "core",
+    "api",
+    "models",
+    "utils",
+    "services",
+    "handlers",
+    "components",
+    "tests",
+    "node_modules",
+    "vendor",
+    "docs",
+    "build",
+]
+EXTENSIONS = [".py", ".js", ".ts", ".go", ".md", ".json", ".png", ".min.js"]
+
+
+def make_paths(count: int, max_depth: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        depth = rng.randint(0, max_depth)
+        folders = [rng.choice(FOLDER_NAMES) for _ in range(depth)]
+        paths.append("/".join(folders + [f"file{i}{rng.choice(EXTENSIONS)}"]))
+    return paths
+
+
+def legacy_valid_file(selector: FileSelector, patterns: List[str]) -> Callable:
+    """valid_file before patterns were compiled, for comparison."""
+
+    def valid_file(file: str) -> bool:
+        path = Path(file)
+        if not selector.valid_extension(file):
+            return False
+        for pattern in patterns:
+            if path.match(pattern) or any(p.match(pattern) for p in path.parents):
+                return False
+        return True
+
+    return valid_file
+
+
+def measure(name: str, valid_file: Callable, paths: List[str]) -> float:
+    start = time.perf_counter()
+    valid = sum(1 for path in paths if valid_file(path))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>10}: {len(paths):>8} paths in {elapsed:8.3f}s "
+        f"({len(paths) / elapsed:>10.0f} paths/s, {valid} valid)"
+    )
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--paths", type=int, default=500000)
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument(
+        "--legacy-paths",
+        type=int,
+        default=20000,
+        help="Paths measured with the legacy implementation (0 to skip)",
+    )
+    args = parser.parse_args()
+
+    config = ParserConfig()
+    paths = make_paths(args.paths, args.max_depth)
+    selector = FileSelector(
+        FileRepo(Path("."), {}),
+        ignore_patterns=config.ignore_patterns,
+        allowed_extensions=config.allowed_extensions,
+    )
+    print(f"{len(config.ignore_patterns)} ignore patterns")
+
+    compiled = measure("compiled", selector.valid_file, paths)
+    if args.legacy_paths:
+        sample = paths[: args.legacy_paths]
+        legacy = measure(
+            "legacy", legacy_valid_file(selector, config.ignore_patterns), sample
+        )
+        estimate = legacy * len(paths) / len(sample)
+        print(
+            f"legacy estimate for {len(paths)} paths: {estimate:.1f}s "
+            f"({estimate / compiled:.0f}x slower)"
+        )
+
+
+if __name__ == "__main__":
+    main()
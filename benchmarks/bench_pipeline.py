@@ -0,0 +1,270 @@
+"""
+End-to-end benchmark of the devtale command on a synthetic git repository,
+with a simulated model instead of a provider, so no network is used.
+
+    python benchmarks/bench_pipeline.py --files 500 --folders 40 --commits 200
+
+The simulated model, registered as `devtale-bench`, answers after a latency
+drawn from a log-normal distribution, streams its answer at a given token
+throughput and fails a fraction of the requests with a transient error.
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import git
+import llm
+from click.testing import CliRunner
+from llm.cli import cli
+from llm.plugins import pm
+
+MODEL_ID: str = "devtale-bench"
+WORDS = ["parse", "cache", "request", "folder", "summary", "token", "node", "tree"]
+
+
+class SimulatedError(Exception):
+    """Transient provider error, retried by the rate limiter."""
+
+    status_code = 503
+
+
+class Simulation:
+    """Latency, errors and throughput of the simulated model, and its usage."""
+
+    def __init__(
+        self,
+        latency: float,
+        latency_sigma: float,
+        error_rate: float,
+        tokens_per_second: float,
+        output_tokens: int,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Sum of the time every request was in flight
+        self.busy = 0.0
+
+    def start(self) -> float:
+        """Register a request, return how long it waits before answering."""
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return self.rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+
+    def fails(self) -> bool:
+        with self.lock:
+            failed = self.rng.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def finish(self, elapsed: float) -> None:
+        with self.lock:
+            self.in_flight -= 1
+            self.busy += elapsed
+
+    def chunks(self) -> List[str]:
+        words = [WORDS[i % len(WORDS)] for i in range(self.output_tokens)]
+        return [" ".join(words[i : i + 10]) + " " for i in range(0, len(words), 10)]
+
+
+class SimulatedModel(llm.Model):
+    model_id = MODEL_ID
+    can_stream = True
+
+    def __init__(self, simulation: Simulation) -> None:
+        self.simulation = simulation
+
+    def execute(self, prompt, stream, response, conversation):
+        started = time.perf_counter()
+        time.sleep(self.simulation.start())
+        try:
+            if self.simulation.fails():
+                raise SimulatedError("Service unavailable")
+            for chunk in self.simulation.chunks():
+                time.sleep(10 / self.simulation.tokens_per_second)
+                yield chunk
+        finally:
+            self.simulation.finish(time.perf_counter() - started)
+
+
+class AsyncSimulatedModel(llm.AsyncModel):
+    model_id = MODEL_ID
+    can_stream = True
+
+    def __init__(self, simulation: Simulation) -> None:
+        self.simulation = simulation
+
+    async def execute(self, prompt, stream, response, conversation):
+        started = time.perf_counter()
+        await asyncio.sleep(self.simulation.start())
+        try:
+            if self.simulation.fails():
+                raise SimulatedError("Service unavailable")
+            for chunk in self.simulation.chunks():
+                await asyncio.sleep(10 / self.simulation.tokens_per_second)
+                yield chunk
+        finally:
+            self.simulation.finish(time.perf_counter() - started)
+
+
+class SimulatedModelPlugin:
+    def __init__(self, simulation: Simulation) -> None:
+        self.simulation = simulation
+
+    @llm.hookimpl
+    def register_models(self, register):
+        register(SimulatedModel(self.simulation), AsyncSimulatedModel(self.simulation))
+
+
+def make_code(rng: random.Random, lines: int) -> str:
+    functions = []
+    for i in range(max(1, lines // 5)):
+        word = rng.choice(WORDS)
+        functions.append(
+            f"def {word}_{i}(value):\n"
+            f"    # {' '.join(rng.choices(WORDS, k=8))}\n"
+            f"    result = value * {rng.randint(1, 100)}\n"
+            f"    return result\n"
+        )
+    return "\n".join(functions)
+
+
+def make_repository(
+    root: Path, files: int, folders: int, commits: int, lines: int, seed: int = 0
+) -> None:
+    """Git repository with files spread over nested folders and random commits."""
+    rng = random.Random(seed)
+    folder_paths: List[str] = ["src"]
+    for i in range(1, folders):
+        folder_paths.append(f"{rng.choice(folder_paths)}/module{i}")
+    file_paths: List[str] = [
+        f"{rng.choice(folder_paths)}/file{i}.py" for i in range(files)
+    ]
+
+    repo = git.Repo.init(root)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "bench")
+        config.set_value("user", "email", "bench@example.com")
+
+    for i in range(max(1, commits)):
+        changed = file_paths if i == 0 else rng.sample(file_paths, k=min(5, files))
+        for file_path in changed:
+            (root / file_path).parent.mkdir(parents=True, exist_ok=True)
+            (root / file_path).write_text(
+                make_code(rng, rng.randint(lines // 2, lines))
+            )
+        repo.index.add(changed)
+        repo.index.commit(f"Commit {i}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--commits", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=60, help="Lines per file")
+    parser.add_argument(
+        "--latency", type=float, default=0.2, help="Median seconds to first token"
+    )
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=500)
+    parser.add_argument("--output-tokens", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "devtale_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments for llm devtale, after --, e.g. -- -j 16 --engine async",
+    )
+    args = parser.parse_args()
+
+    simulation = Simulation(
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        seed=args.seed,
+    )
+    pm.register(SimulatedModelPlugin(simulation), name="devtale-bench")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "repository"
+        start = time.perf_counter()
+        make_repository(
+            root, args.files, args.folders, args.commits, args.lines, args.seed
+        )
+        print(
+            f"Repository: {args.files} files, {args.folders} folders, "
+            f"{args.commits} commits in {time.perf_counter() - start:.1f}s"
+        )
+
+        extra = [arg for arg in args.devtale_args if arg != "--"]
+        output = Path(tmp) / "output.txt"
+        command = [
+            "devtale",
+            str(root),
+            "-m",
+            MODEL_ID,
+            "--no-cache",
+            "-o",
+            str(output),
+        ]
+        command += ["--max-tokens", str(10**9)] + extra
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        result = CliRunner().invoke(cli, command)
+        wall = time.perf_counter() - start
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        if result.exit_code != 0 or not output.exists():
+            print(result.output, file=sys.stderr)
+            sys.exit(1)
+        summarized = sum(
+            1 for line in output.read_text().splitlines() if "(file)" in line
+        )
+
+    print(f"devtale {' '.join(command[2:])}")
+    print(
+        f"Files: {summarized} in {wall:.2f}s wall time "
+        f"({summarized / wall:.1f} files/s)"
+    )
+    print(
+        f"Requests: {simulation.requests}, {simulation.errors} failed "
+        f"({simulation.requests / wall:.1f} requests/s)"
+    )
+    print(
+        f"Concurrency: max {simulation.max_in_flight}, "
+        f"mean {simulation.busy / wall:.1f} requests in flight"
+    )
+    # ru_maxrss is in KiB on Linux
+    print(
+        f"Peak memory: {rss_after / 1024:.0f} MiB "
+        f"(+{(rss_after - rss_before) / 1024:.0f} MiB during the run)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,18 @@
-import logging
-import traceback
-from pathlib import Path
-
 import click
 import llm
-from rich.console import Console
-
-from .config import ParserConfig
-from .files import FileRepo, FileSelector
-from .gitutils import GitRepository
-from .node import Node
-from .parser import ProjectParser
-from .utils import get_llm_model, setup_logging
 
-logger = logging.getLogger("llm_devtale")
-console = Console()
+# Only what the options need: llm imports every plugin on each command, so
+# the modules of a run are imported by the command itself, see cli.py
+from .config import (
+    ENGINE_ASYNC,
+    ENGINE_THREAD,
+    SELECTION_EFFORT,
+    SELECTION_KNAPSACK,
+    SHARD_FOLDER,
+    SHARD_HASH,
+    STREAM_JSONL,
+    STREAM_MARKDOWN,
+)
 
 
 @llm.hookimpl
@@ -36,10 +34,75 @@ def register_commands(cli):
         type=int,
         help="Max tokens per file",
     )
+    @click.option(
+        "--max-tokens-per-prompt",
+        type=int,
+        help="Folder and project summaries whose prompt would be larger are "
+        "summarized in parts first (default: 16000)",
+    )
+    @click.option(
+        "--chunk-large-files",
+        is_flag=True,
+        help="Summarize files over --max-tokens-per-file in chunks split on "
+        "top level definitions, instead of skipping them",
+    )
+    @click.option(
+        "--batch-small-files",
+        is_flag=True,
+        help="Summarize the small files of a folder together, with a single "
+        "request per batch",
+    )
+    @click.option(
+        "--selection",
+        type=click.Choice([SELECTION_KNAPSACK, SELECTION_EFFORT]),
+        default=SELECTION_KNAPSACK,
+        show_default=True,
+        help="Fill the token budget with the files worth the most commits "
+        "(knapsack), or take files by commits until one does not fit (effort)",
+    )
+    @click.option(
+        "--selection-workers",
+        type=int,
+        help="Processes reading, hashing and tokenizing files during the "
+        "selection, 0 for one per core (default: 1)",
+    )
+    @click.option(
+        "--dedup",
+        is_flag=True,
+        help="Summarize duplicate and near duplicate files once, the other "
+        "copies reuse the summary of the file with the most commits",
+    )
+    @click.option(
+        "--dedup-threshold",
+        type=click.FloatRange(0, 1),
+        help="Similarity from which files are near duplicates with --dedup, "
+        "1 for exact copies only (default: 0.9)",
+    )
     @click.option(
         "--output", "-o", type=click.Path(), help="Output file path or directory"
     )
+    @click.option(
+        "--stream",
+        type=click.Choice([STREAM_JSONL, STREAM_MARKDOWN]),
+        help="Write every summary to the output as soon as it is generated, "
+        "instead of the whole tree at the end",
+    )
     @click.option("--model", "-m", help="LLM model to use")
+    @click.option(
+        "--concurrency",
+        "-j",
+        type=int,
+        help="Maximum number of LLM requests in flight for the whole run "
+        "(file requests with the async engine)",
+    )
+    @click.option(
+        "--engine",
+        type=click.Choice([ENGINE_THREAD, ENGINE_ASYNC]),
+        default=ENGINE_THREAD,
+        show_default=True,
+        help="Run LLM requests on a thread pool or on an asyncio event loop. "
+        "Models without an async implementation always use threads",
+    )
     @click.option(
         "--filter-extension",
         "-f",
@@ -58,6 +121,12 @@ def register_commands(cli):
         is_flag=True,
         help="Show hierarchy and files that will be analyzed without using the LLM",
     )
+    @click.option(
+        "--request-latency",
+        type=float,
+        help="Seconds per model request used by --dry-run to estimate the wall "
+        "time (default: 5)",
+    )
     @click.option(
         "--debug",
         "-d",
@@ -70,67 +139,91 @@ def register_commands(cli):
         type=str,
         help="Additional prompt to be included at the end in the summarization instructions",
     )
-    def devtale(
-        directory,
-        exclude,
-        max_tokens,
-        max_tokens_per_file,
-        output,
-        model,
-        filter_extension,
-        filter_folder,
-        dry_run,
-        debug,
-        prompt,
-    ):
-        try:
-            setup_logging(verbose=debug)
-            exclude_patterns = list(exclude)
-            allowed_extensions = list(filter_extension)
-
-            config = ParserConfig(
-                directory=directory,
-                model_name=model,
-                max_tokens_per_file=max_tokens_per_file,
-                max_tokens_per_project=max_tokens,
-                exclude_patterns=exclude_patterns,
-                allowed_extensions=allowed_extensions,
-                dry_run=dry_run,
-                filter_folders=filter_folder,
-                prompt=prompt,
-            )
-            git_repo: GitRepository = GitRepository(directory)
-            effort: dict[str, int] = git_repo.get_git_effort()
-            file_repo: FileRepo = FileRepo(directory, effort)
-
-            file_selector = FileSelector(
-                file_repo,
-                ignore_patterns=config.ignore_patterns,
-                allowed_extensions=config.allowed_extensions,
-            )
-
-            valid_files, token_count = file_selector.get_files_by_token(
-                max_token_count=config.max_tokens_per_project,
-                max_tokens_per_file=config.max_tokens_per_file,
-            )
-            logger.debug(f"Files to be analyzed: {valid_files}")
-            model = get_llm_model(model_name=config.model_name)
-            project_parser: ProjectParser = ProjectParser(
-                parser_config=config, model=model, valid_files=valid_files
-            )
-            node: Node = project_parser.parse()
-
-            click.echo(f"Total file Token count: {token_count}")
-
-            if output:
-                result = node.to_string()
-                output_file = Path(output)
+    @click.option(
+        "--no-cache",
+        is_flag=True,
+        help="Do not read or write the persistent summary cache",
+    )
+    @click.option(
+        "--incremental",
+        type=click.Path(dir_okay=False),
+        help="JSON file with the tree of a previous run. Only nodes whose content "
+        "changed are summarized again, and the file is updated with the new tree",
+    )
+    @click.option(
+        "--resume",
+        is_flag=True,
+        help="Continue an interrupted run, reusing the summaries it checkpointed",
+    )
+    @click.option(
+        "--export-prompts",
+        type=click.Path(dir_okay=False),
+        help="Write the prompts of the summaries missing from the cache to this "
+        "JSONL file instead of sending them to the model",
+    )
+    @click.option(
+        "--import-results",
+        "import_results_file",
+        type=click.Path(exists=True, dir_okay=False),
+        help="JSONL file with the id and summary of exported prompts, stored in "
+        "the cache before the run",
+    )
+    @click.option(
+        "--stats",
+        "show_stats",
+        is_flag=True,
+        help="Print the time spent per stage, model request latencies, tokens, "
+        "retries and cache hits at the end of the run",
+    )
+    @click.option(
+        "--stats-json",
+        type=click.Path(dir_okay=False),
+        help="Write the --stats report to this JSON file",
+    )
+    @click.option(
+        "--rpm", type=int, help="Maximum LLM requests per minute (provider quota)"
+    )
+    @click.option(
+        "--tpm", type=int, help="Maximum LLM prompt tokens per minute (provider quota)"
+    )
+    @click.option(
+        "--max-retries",
+        type=int,
+        help="Retries of a failed LLM request on transient errors (default: 5)",
+    )
+    @click.option(
+        "--tokenizer-file",
+        type=click.Path(exists=True, dir_okay=False),
+        envvar="LLM_DEVTALE_TOKENIZER_FILE",
+        help="Local cl100k_base BPE file used to count tokens, for runs "
+        "without network access",
+    )
+    @click.option(
+        "--follow-renames",
+        is_flag=True,
+        help="Count the commits made to a file before it was renamed",
+    )
+    @click.option(
+        "--shard",
+        metavar="K/N",
+        help="Only summarize the files of shard K of N, without the folder and "
+        "project summaries, and write the partial tree to --output as JSON",
+    )
+    @click.option(
+        "--shard-by",
+        type=click.Choice([SHARD_FOLDER, SHARD_HASH]),
+        default=SHARD_FOLDER,
+        show_default=True,
+        help="Split the files between shards by top level folder or by path hash",
+    )
+    @click.option(
+        "--merge",
+        multiple=True,
+        type=click.Path(exists=True, dir_okay=False),
+        help="Partial tree of a --shard run. The summaries of every shard are "
+        "combined and only the folders and the project are summarized",
+    )
+    def devtale(**kwargs):
+        from .cli import devtale
 
-                with open(output_file, "w") as f:
-                    f.write(result)
-            else:
-                console.print(node.to_tree())
-        except Exception as e:
-            click.secho(f"Error ({e.__class__.__name__}): {e!r}", fg="red")
-            click.secho(traceback.format_exc(), fg="bright_black")
-            raise click.Abort()
+        devtale(**kwargs)
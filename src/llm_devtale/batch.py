@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set, TextIO
+
+from .cache import SummaryCache
+from .node import NodeType
+from .templates import SYSTEM_PROMPT
+
+
+class PendingSummary(Exception):
+    """The summary was exported, it is generated outside of this run."""
+
+
+class PromptExporter:
+    """
+    Writes the prompts of the summaries missing from the cache to a JSONL
+    file, to be sent to an asynchronous batch endpoint instead of the model.
+
+    Every line has a stable id, the summary cache key of the prompt. Once the
+    results are imported into the cache with import_results, the next run
+    finds those summaries and exports the prompts of the level above: files
+    first, then folders, then the project. Nodes whose summary is pending are
+    left without description, and a folder with pending children is not
+    exported until they are done.
+
+    Prompts are written to a .partial file next to path, moved to path only
+    when the run completes, so a failed run never leaves a truncated export
+    that looks complete.
+    """
+
+    def __init__(self, path: Path, model_id: str = "") -> None:
+        self.path: Path = path
+        self.model_id: str = model_id
+        self.partial_path: Path = path.with_name(path.name + ".partial")
+        self.exported: Set[str] = set()
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+
+    def add(self, prompt_id: str, summary_type: NodeType, prompt: str) -> None:
+        with self._lock:
+            # Files with the same content share a prompt
+            if prompt_id in self.exported:
+                return
+            if self._file is None:
+                self._file = open(self.partial_path, "w")
+            self._file.write(
+                json.dumps(
+                    {
+                        "id": prompt_id,
+                        "model": self.model_id,
+                        "summary_type": summary_type.value,
+                        "system": SYSTEM_PROMPT,
+                        "prompt": prompt,
+                    }
+                )
+                + "\n"
+            )
+            self.exported.add(prompt_id)
+
+    def close(self, complete: bool = True) -> None:
+        """Close the export, moved to path when complete, deleted otherwise."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+            if complete:
+                os.replace(self.partial_path, self.path)
+            else:
+                os.remove(self.partial_path)
+
+
+def import_results(path: Path, cache: SummaryCache) -> int:
+    """
+    Store the summaries of a results JSONL file in the summary cache. Every
+    line is an object with the "id" of an exported prompt and its "summary".
+
+    Returns:
+        Number of summaries imported
+    """
+    summaries: Dict[str, str] = {}
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if not isinstance(result.get("id"), str) or not isinstance(
+                result.get("summary"), str
+            ):
+                raise ValueError(
+                    f"{path}:{line_number}: expected an object with id and summary"
+                )
+            summaries[result["id"]] = result["summary"]
+
+    for prompt_id, summary in summaries.items():
+        cache.set(prompt_id, summary)
+    return len(summaries)
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .config import CACHE_MAX_AGE_DAYS, CACHE_MAX_ENTRIES, ParserConfig
+
+logger = logging.getLogger("llm_devtale")
+
+SUMMARY_CACHE_FILE: str = "summaries.db"
+TOKEN_CACHE_FILE: str = "tokens.db"
+# Maximum number of parameters in a single SQLite query
+SQLITE_BATCH_SIZE: int = 500
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """SQLite connection shared between threads, in autocommit and WAL mode."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def hash_content(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
+
+
+def hash_data(data: Any) -> str:
+    return hash_content(json.dumps(data, sort_keys=True, default=str))
+
+
+class SummaryCache:
+    """
+    Persistent, content-addressed store of LLM summaries.
+
+    Entries are keyed by a hash of everything that influences the model output
+    (model id, prompt template, additional prompt and the prompt data), so a
+    cached summary is only reused when the exact same request would be sent.
+    A single SQLite connection is shared between threads behind a lock.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_age_days: int = CACHE_MAX_AGE_DAYS,
+    ) -> None:
+        self.db_path: Path = Path(db_path)
+        self.max_entries: int = max_entries
+        self.max_age_seconds: float = max_age_days * 24 * 60 * 60
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+
+        self._conn = connect(self.db_path)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+        self.evict()
+
+    @staticmethod
+    def make_key(
+        model_id: str, template: str, additional_prompt: str, data: dict
+    ) -> str:
+        return hash_data([model_id, template, additional_prompt or "", data])
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, summary: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, summary, now, now),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Drop entries older than max_age_days, then the least recently used ones
+        until at most max_entries remain.
+
+        Returns:
+            Number of removed entries
+        """
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM summaries WHERE created_at < ?",
+                (time.time() - self.max_age_seconds,),
+            ).rowcount
+            removed += self._conn.execute(
+                """
+                DELETE FROM summaries WHERE key IN (
+                    SELECT key FROM summaries ORDER BY accessed_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            ).rowcount
+        if removed:
+            logger.debug(f"Evicted {removed} entries from the summary cache")
+        return removed
+
+    @classmethod
+    def from_config(cls, config: ParserConfig) -> "SummaryCache":
+        return cls(
+            config.cache_dir / SUMMARY_CACHE_FILE,
+            max_entries=config.cache_max_entries,
+            max_age_days=config.cache_max_age_days,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TokenCache:
+    """
+    Persistent token counts keyed by git blob id and encoding.
+
+    A blob id identifies the content of a file, so counts are shared by every
+    branch and clone using the same cache_dir, and only new content has to be
+    read and tokenized.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path: Path = Path(db_path)
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+
+        self._conn = connect(self.db_path)
+        with self._lock:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tokens (
+                    blob_id TEXT NOT NULL,
+                    encoding TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    PRIMARY KEY (blob_id, encoding)
+                )
+                """
+            )
+
+    def get_many(self, blob_ids: Iterable[str], encoding: str) -> Dict[str, int]:
+        """Token counts of the blobs that are in the cache."""
+        blob_ids = list(dict.fromkeys(blob_ids))
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for start in range(0, len(blob_ids), SQLITE_BATCH_SIZE):
+                batch: List[str] = blob_ids[start : start + SQLITE_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                counts.update(
+                    self._conn.execute(
+                        "SELECT blob_id, tokens FROM tokens"
+                        f" WHERE encoding = ? AND blob_id IN ({placeholders})",
+                        (encoding, *batch),
+                    ).fetchall()
+                )
+            self.hits += len(counts)
+            self.misses += len(blob_ids) - len(counts)
+        return counts
+
+    def set_many(self, counts: Dict[str, int], encoding: str) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tokens (blob_id, encoding, tokens)"
+                " VALUES (?, ?, ?)",
+                [(blob_id, encoding, tokens) for blob_id, tokens in counts.items()],
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    @classmethod
+    def from_config(cls, config: ParserConfig) -> "TokenCache":
+        return cls(config.cache_dir / TOKEN_CACHE_FILE)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
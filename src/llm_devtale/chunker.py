@@ -0,0 +1,87 @@
+import ast
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from .utils import TokenCounter
+
+# A line at column 0 that does not close a block starts a top level
+# definition in most languages: the body of the definition is indented.
+TOP_LEVEL_LINE = re.compile(r"[^\s})\]]")
+
+
+@dataclass
+class Chunk:
+    # 1-based, inclusive
+    start_line: int
+    end_line: int
+    content: str
+
+
+def python_boundaries(code: str) -> List[int]:
+    """0-based first line of every top level statement, decorators included."""
+    tree = ast.parse(code)
+    return [
+        min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+        for node in tree.body
+    ]
+
+
+def boundaries(lines: List[str], file_name: str) -> List[int]:
+    """0-based lines where a top level definition of the file starts."""
+    if file_name.endswith(".py"):
+        try:
+            return python_boundaries("".join(lines))
+        except (SyntaxError, ValueError):
+            pass
+
+    return [i for i, line in enumerate(lines) if TOP_LEVEL_LINE.match(line)]
+
+
+def pack(
+    spans: List[Tuple[int, int]], sizes: List[int], max_tokens: int
+) -> List[Tuple[int, int]]:
+    """Merge consecutive spans of lines while they fit into max_tokens."""
+    packed: List[Tuple[int, int]] = []
+    used: int = 0
+    for (start, end), size in zip(spans, sizes):
+        if packed and used + size <= max_tokens:
+            packed[-1] = (packed[-1][0], end)
+            used += size
+        else:
+            packed.append((start, end))
+            used = size
+    return packed
+
+
+def split_code(code: str, file_name: str, max_tokens: int) -> List[Chunk]:
+    """
+    Split code into chunks of at most max_tokens tokens, on the boundaries
+    of top level definitions (the Python AST, an indentation heuristic for
+    other languages). Definitions larger than max_tokens are split by lines.
+    """
+    lines: List[str] = code.splitlines(keepends=True)
+    if not lines:
+        return []
+
+    starts: List[int] = sorted({0, *boundaries(lines, file_name)})
+    segments: List[Tuple[int, int]] = list(zip(starts, starts[1:] + [len(lines)]))
+    sizes: List[int] = TokenCounter.count_tokens_batch(
+        ["".join(lines[start:end]) for start, end in segments]
+    )
+
+    spans: List[Tuple[int, int]] = []
+    span_sizes: List[int] = []
+    for (start, end), size in zip(segments, sizes):
+        if size <= max_tokens:
+            spans.append((start, end))
+            span_sizes.append(size)
+            continue
+        # Line based fallback
+        spans.extend((line, line + 1) for line in range(start, end))
+        span_sizes.extend(TokenCounter.count_tokens_batch(lines[start:end]))
+
+    return [
+        Chunk(start_line=start + 1, end_line=end, content="".join(lines[start:end]))
+        for start, end in pack(spans, span_sizes, max_tokens)
+    ]
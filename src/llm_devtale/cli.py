@@ -0,0 +1,348 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import traceback
+from pathlib import Path
+from typing import List, Tuple
+
+import click
+from rich.console import Console
+
+from .batch import PromptExporter, import_results
+from .cache import SummaryCache, TokenCache
+from .config import ENGINE_ASYNC, ParserConfig
+from .files import FileRecord, FileRepo, FileSelector
+from .gitutils import GitRepository
+from .journal import Journal
+from .limiter import RateLimiter
+from .node import Node, load_tree, save_tree
+from .parser import ProjectParser
+from .planner import Planner
+from .shard import load_shards, parse_shard, shard_of
+from .stats import stats
+from .stream import NodeStream, fan_out
+from .utils import (
+    TokenCounter,
+    get_async_llm_model,
+    get_llm_model,
+    setup_logging,
+)
+
+logger = logging.getLogger("llm_devtale")
+console = Console()
+
+
+def select_files(config: ParserConfig) -> Tuple[List[FileRecord], int]:
+    """Files worth summarizing within the token budget, by git effort."""
+    git_repo: GitRepository = GitRepository(
+        config.directory, cache_dir=config.cache_dir if config.use_cache else None
+    )
+    effort: dict[str, int] = git_repo.get_git_effort(
+        follow_renames=config.follow_renames
+    )
+    file_repo: FileRepo = FileRepo(config.directory, effort)
+
+    token_cache = TokenCache.from_config(config) if config.use_cache else None
+    file_selector = FileSelector(
+        file_repo,
+        ignore_patterns=config.ignore_patterns,
+        allowed_extensions=config.allowed_extensions,
+        token_cache=token_cache,
+        blob_ids=git_repo.get_blob_ids() if token_cache is not None else None,
+        max_content_bytes=config.max_content_bytes,
+        selection=config.selection,
+        chunk_large_files=config.chunk_large_files,
+        workers=config.selection_workers,
+        dedup_threshold=config.dedup_threshold if config.dedup else None,
+    )
+
+    records, token_count = file_selector.select_files(
+        max_token_count=config.max_tokens_per_project,
+        max_tokens_per_file=config.max_tokens_per_file,
+    )
+    logger.info(str(file_selector.budget_report))
+    if token_cache is not None:
+        logger.debug(
+            f"Token cache: {token_cache.hits} hits, {token_cache.misses} misses"
+        )
+        stats.count("token cache hits", token_cache.hits)
+        stats.count("token cache misses", token_cache.misses)
+        token_cache.close()
+    return records, token_count
+
+
+def devtale(
+    directory,
+    exclude,
+    max_tokens,
+    max_tokens_per_file,
+    max_tokens_per_prompt,
+    chunk_large_files,
+    batch_small_files,
+    selection,
+    selection_workers,
+    dedup,
+    dedup_threshold,
+    output,
+    stream,
+    model,
+    concurrency,
+    engine,
+    filter_extension,
+    filter_folder,
+    dry_run,
+    request_latency,
+    debug,
+    prompt,
+    no_cache,
+    incremental,
+    resume,
+    export_prompts,
+    import_results_file,
+    show_stats,
+    stats_json,
+    rpm,
+    tpm,
+    max_retries,
+    follow_renames,
+    tokenizer_file,
+    shard,
+    shard_by,
+    merge,
+):
+    """The devtale command, see register_commands for its options."""
+    if no_cache and (export_prompts or import_results_file):
+        raise click.UsageError(
+            "--export-prompts and --import-results need the summary cache"
+        )
+    shard_index, shard_count = 0, 1
+    if shard:
+        try:
+            shard_index, shard_count = parse_shard(shard)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--shard")
+        if merge:
+            raise click.UsageError("--merge runs once every --shard run is done")
+        if not output or stream:
+            raise click.UsageError("--shard writes its partial tree to --output")
+    # Files written while the run goes, closed even when it fails
+    resources = contextlib.ExitStack()
+    try:
+        stats.reset()
+        # Usage the model does not report is only counted for the report
+        stats.count_tokens = (
+            TokenCounter.count_tokens_batch if show_stats or stats_json else None
+        )
+        setup_logging(verbose=debug)
+        exclude_patterns = list(exclude)
+        allowed_extensions = list(filter_extension)
+
+        config = ParserConfig(
+            directory=directory,
+            model_name=model,
+            max_concurrency=concurrency,
+            engine=engine,
+            max_tokens_per_file=max_tokens_per_file,
+            max_tokens_per_prompt=max_tokens_per_prompt,
+            chunk_large_files=chunk_large_files,
+            batch_small_files=batch_small_files,
+            max_tokens_per_project=max_tokens,
+            selection=selection,
+            selection_workers=selection_workers,
+            dedup=dedup,
+            dedup_threshold=dedup_threshold,
+            exclude_patterns=exclude_patterns,
+            allowed_extensions=allowed_extensions,
+            dry_run=dry_run,
+            request_latency=request_latency,
+            filter_folders=filter_folder,
+            prompt=prompt,
+            use_cache=not no_cache,
+            requests_per_minute=rpm,
+            tokens_per_minute=tpm,
+            max_retries=max_retries,
+            follow_renames=follow_renames,
+            tokenizer_file=tokenizer_file,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            shard_by=shard_by,
+            # Folders and the project are summarized by --merge
+            skip_folder_readme=bool(shard),
+        )
+        TokenCounter.configure(bpe_file=config.tokenizer_file)
+        if merge:
+            # The files were selected and summarized by the shards
+            shard_nodes = load_shards([Path(path) for path in merge])
+            records: List[FileRecord] = []
+            token_count: int = 0
+            valid_files = [
+                path
+                for path in sorted(shard_nodes)
+                if os.path.isfile(os.path.join(config.directory, path))
+            ]
+        else:
+            records, token_count = select_files(config)
+            if config.shard_count > 1:
+                # Selected as a whole first, so the shards add up to the same
+                # files and budget as a single run
+                records = [
+                    record
+                    for record in records
+                    if shard_of(record.path, config.shard_count, config.shard_by)
+                    == config.shard_index
+                ]
+                token_count = sum(record.tokens for record in records)
+            valid_files = [record.path for record in records]
+        logger.debug(f"Files to be analyzed: {valid_files}")
+        model = get_llm_model(model_name=config.model_name)
+        async_model = None
+        if config.engine == ENGINE_ASYNC:
+            async_model = get_async_llm_model(model_name=config.model_name)
+            if async_model is None:
+                logger.warning(
+                    f"Model {model.model_id} has no async implementation, using threads"
+                )
+            elif concurrency:
+                config.max_async_file_requests = concurrency
+        # Read by --dry-run too, cached summaries take no request
+        cache = SummaryCache.from_config(config) if config.use_cache else None
+        if cache is not None and import_results_file and not config.dry_run:
+            imported: int = import_results(Path(import_results_file), cache)
+            logger.info(f"Imported {imported} summaries from {import_results_file}")
+        exporter = (
+            PromptExporter(Path(export_prompts), model_id=model.model_id)
+            if export_prompts and not config.dry_run
+            else None
+        )
+        if exporter is not None:
+            # No-op once closed as complete below
+            resources.callback(exporter.close, complete=False)
+        limiter = RateLimiter.from_config(
+            config,
+            max_concurrency=(
+                config.max_async_file_requests + config.max_async_folder_requests
+                if async_model is not None
+                else config.max_concurrency
+            ),
+        )
+        previous_tree = load_tree(Path(incremental)) if incremental else None
+        previous_nodes = previous_tree.index() if previous_tree else {}
+        if merge:
+            previous_nodes.update(shard_nodes)
+        journal = None
+        if exporter is None:
+            journal = Journal.from_config(config, model_id=model.model_id)
+            if config.dry_run:
+                # Planned from the checkpoints, the journal is left as is
+                resumed = journal.load() if resume else {}
+                journal = None
+            else:
+                resumed = journal.open(resume=resume)
+            if resume:
+                logger.info(f"Resuming with {len(resumed)} checkpointed summaries")
+            previous_nodes.update(resumed)
+        node_stream = None
+        if stream:
+            node_stream = NodeStream(
+                resources.enter_context(open(output, "w")) if output else sys.stdout,
+                stream_format=stream,
+            )
+        project_parser: ProjectParser = ProjectParser(
+            parser_config=config,
+            model=model,
+            valid_files=valid_files,
+            cache=cache,
+            previous_nodes=previous_nodes,
+            async_model=async_model,
+            limiter=limiter,
+            records={record.path: record for record in records},
+            exporter=exporter,
+            on_node=fan_out(node_stream, journal),
+        )
+        plan = None
+        with stats.stage("parse"):
+            if config.dry_run:
+                plan = Planner(project_parser).plan()
+                node: Node = plan.node
+            elif async_model is not None:
+                node: Node = asyncio.run(project_parser.aparse())
+            else:
+                node: Node = project_parser.parse()
+        if limiter.retries or limiter.throttles:
+            logger.info(
+                f"LLM requests: {limiter.retries} retries, "
+                f"{limiter.throttles} throttled"
+            )
+        if journal is not None:
+            if project_parser.failed:
+                journal.close()
+                logger.warning(
+                    f"{len(project_parser.failed)} files or folders failed, "
+                    "run again with --resume to summarize only what is missing"
+                )
+            else:
+                # Complete, nothing left to resume
+                journal.remove()
+        exported: int = 0
+        if exporter is not None:
+            exporter.close()
+            exported = len(exporter.exported)
+        # Nodes are missing descriptions until the exported prompts are done
+        # A shard tree is partial, the merge updates it
+        if incremental and not config.dry_run and not exported and not shard:
+            save_tree(node, Path(incremental))
+        if cache is not None:
+            logger.debug(f"Summary cache: {cache.hits} hits, {cache.misses} misses")
+            stats.count("summary cache hits", cache.hits)
+            stats.count("summary cache misses", cache.misses)
+            cache.close()
+        stats.count("retries", limiter.retries)
+        stats.count("throttles", limiter.throttles)
+        if show_stats:
+            for table in stats.to_tables():
+                Console(stderr=True).print(table)
+        if stats_json:
+            with open(stats_json, "w") as f:
+                json.dump(stats.to_json(), f, indent=2)
+
+        # Keep the streamed output clean when it goes to stdout
+        to_stderr: bool = node_stream is not None and not output
+        if merge:
+            click.echo(
+                f"Merged {len(shard_nodes)} file summaries from {len(merge)} shards",
+                err=to_stderr,
+            )
+        else:
+            click.echo(f"Total file Token count: {token_count}", err=to_stderr)
+        if plan is not None:
+            click.echo(str(plan), err=to_stderr)
+        if exported:
+            click.echo(
+                f"Exported {exported} prompts to {export_prompts}, "
+                "run again with --import-results once they are processed",
+                err=to_stderr,
+            )
+            return
+
+        if node_stream is not None:
+            logger.debug(f"Streamed {node_stream.count} summaries")
+        elif shard:
+            save_tree(node, Path(output))
+        elif output:
+            result = node.to_string()
+            output_file = Path(output)
+
+            with open(output_file, "w") as f:
+                f.write(result)
+        else:
+            console.print(node.to_tree())
+    except Exception as e:
+        click.secho(f"Error ({e.__class__.__name__}): {e!r}", fg="red")
+        click.secho(traceback.format_exc(), fg="bright_black")
+        raise click.Abort()
+    finally:
+        # The summaries streamed before a failure are kept
+        resources.close()
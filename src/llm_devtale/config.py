@@ -1,7 +1,7 @@
 import os
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 # Extensions to consider as text files
 DEFAULT_TEXT_EXTENSIONS = [
@@ -144,9 +144,49 @@ MIN_CODE_LENGTH: int = 500
 
 MAX_TOKENS_PER_PROJECT: int = 200000
 MAX_TOKENS_PER_FILE: int = 20000
+# Folder and project prompts over this size are summarized in parts
+MAX_TOKENS_PER_PROMPT: int = 16000
+
+# Small files summarized together with batch_small_files
+SMALL_FILE_TOKENS: int = 1000
+MAX_TOKENS_PER_BATCH: int = 8000
+MAX_FILES_PER_BATCH: int = 20
+
+# How files are chosen to fit into max_tokens_per_project
+SELECTION_KNAPSACK: str = "knapsack"
+SELECTION_EFFORT: str = "effort"
+# Estimated similarity of the files summarized once with dedup
+DEDUP_THRESHOLD: float = 0.9
+# Content of the selected files kept in memory for the parsers
+MAX_CONTENT_BYTES: int = 256 * 1024 * 1024
 
 README_VALID_FILES = ["README.md", "Readme.md", "readme.md"]
 
+MAX_CONCURRENCY: int = 8
+MAX_ASYNC_FILE_REQUESTS: int = 256
+MAX_ASYNC_FOLDER_REQUESTS: int = 64
+
+ENGINE_THREAD: str = "thread"
+ENGINE_ASYNC: str = "async"
+
+# Output of every summary as soon as it is generated
+STREAM_JSONL: str = "jsonl"
+STREAM_MARKDOWN: str = "markdown"
+
+MAX_RETRIES: int = 5
+
+# How --shard splits the selected files between runs
+SHARD_FOLDER: str = "folder"
+SHARD_HASH: str = "hash"
+
+# Planning of --dry-run: tokens of a generated description (three sentences)
+# and seconds of a request to the model
+DESCRIPTION_TOKENS: int = 80
+REQUEST_LATENCY: float = 5.0
+
+CACHE_MAX_ENTRIES: int = 100000
+CACHE_MAX_AGE_DAYS: int = 30
+
 
 @dataclass
 class ParserConfig:
@@ -167,15 +207,52 @@ class ParserConfig:
     ignore_patterns: List[str] = field(init=False)  # Will be set in __post_init__
 
     max_tokens_per_file: int = MAX_TOKENS_PER_FILE
+    max_tokens_per_prompt: int = MAX_TOKENS_PER_PROMPT
+    # Summarize files over max_tokens_per_file in chunks instead of skipping them
+    chunk_large_files: bool = False
+    # Summarize the small files of a folder with a single request
+    batch_small_files: bool = False
+    small_file_tokens: int = SMALL_FILE_TOKENS
+    max_tokens_per_batch: int = MAX_TOKENS_PER_BATCH
+    max_files_per_batch: int = MAX_FILES_PER_BATCH
+    max_content_bytes: int = MAX_CONTENT_BYTES
+    selection: str = SELECTION_KNAPSACK
+    # Summarize duplicate files once, near duplicates from dedup_threshold
+    dedup: bool = False
+    dedup_threshold: float = DEDUP_THRESHOLD
+    # Processes reading and tokenizing files during selection, 0 for one per core
+    selection_workers: int = 1
+    # Local copy of the cl100k_base BPE file, to count tokens without network
+    tokenizer_file: Optional[str] = None
     readme_valid_files: List[str] = field(
         default_factory=lambda: README_VALID_FILES.copy()
     )
 
     skip_folder_readme: bool = False
+    # Only the files of a shard are summarized, from 0 to shard_count - 1
+    shard_index: int = 0
+    shard_count: int = 1
+    shard_by: str = SHARD_FOLDER
+    # Count the commits of a file before it was renamed as its own
+    follow_renames: bool = False
+    # Maximum number of summaries generated at the same time in the whole run
+    max_concurrency: int = MAX_CONCURRENCY
+    # asyncio engine: requests in flight per node type, on a single event loop
+    engine: str = ENGINE_THREAD
+    max_async_file_requests: int = MAX_ASYNC_FILE_REQUESTS
+    max_async_folder_requests: int = MAX_ASYNC_FOLDER_REQUESTS
+    # Provider quota, 0 means unlimited
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    max_retries: int = MAX_RETRIES
     cache_dir: Path = field(
         default_factory=lambda: Path(os.path.expanduser("~/.cache/llm_devtale"))
     )
+    use_cache: bool = True
+    cache_max_entries: int = CACHE_MAX_ENTRIES
+    cache_max_age_days: int = CACHE_MAX_AGE_DAYS
     dry_run: bool = False
+    request_latency: float = REQUEST_LATENCY
     filter_folders: List[str] = field(default_factory=list)
     prompt: str = ""
 
@@ -185,6 +262,32 @@ class ParserConfig:
             self.max_tokens_per_project = MAX_TOKENS_PER_PROJECT
         if self.max_tokens_per_file is None:
             self.max_tokens_per_file = MAX_TOKENS_PER_FILE
+        if self.max_tokens_per_prompt is None:
+            self.max_tokens_per_prompt = MAX_TOKENS_PER_PROMPT
+        if self.small_file_tokens is None:
+            self.small_file_tokens = SMALL_FILE_TOKENS
+        if self.max_tokens_per_batch is None:
+            self.max_tokens_per_batch = MAX_TOKENS_PER_BATCH
+        if self.max_files_per_batch is None:
+            self.max_files_per_batch = MAX_FILES_PER_BATCH
+        if self.max_content_bytes is None:
+            self.max_content_bytes = MAX_CONTENT_BYTES
+        if self.dedup_threshold is None:
+            self.dedup_threshold = DEDUP_THRESHOLD
+        if self.selection_workers is None:
+            self.selection_workers = 1
+        elif self.selection_workers == 0:
+            self.selection_workers = os.cpu_count() or 1
+        if self.max_concurrency is None:
+            self.max_concurrency = MAX_CONCURRENCY
+        if self.requests_per_minute is None:
+            self.requests_per_minute = 0
+        if self.tokens_per_minute is None:
+            self.tokens_per_minute = 0
+        if self.max_retries is None:
+            self.max_retries = MAX_RETRIES
+        if self.request_latency is None:
+            self.request_latency = REQUEST_LATENCY
 
         if not self.allowed_extensions:
             self.allowed_extensions = DEFAULT_TEXT_EXTENSIONS.copy()
@@ -0,0 +1,124 @@
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence
+
+# Words per shingle
+SHINGLE_SIZE: int = 5
+# MinHash signature, split into LSH bands of BAND_ROWS values. Files sharing a
+# band are compared, so pairs from about (1 / bands) ** (1 / rows) = 0.42
+# Jaccard similarity are found.
+SIGNATURE_SIZE: int = 128
+BAND_ROWS: int = 4
+# crc32 of a shingle: the high bits choose the bin, the low bits are the value
+BIN_BITS: int = 7
+VALUE_BITS: int = 32 - BIN_BITS
+VALUE_MASK: int = (1 << VALUE_BITS) - 1
+
+
+def shingle_hashes(content: str, size: int = SHINGLE_SIZE) -> set[int]:
+    """crc32 of every run of size words, whitespace is not significant."""
+    words: List[str] = content.split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i : i + size]).encode())
+        for i in range(len(words) - size + 1)
+    }
+
+
+def minhash(hashes: set[int]) -> Optional[List[int]]:
+    """
+    MinHash signature of a set with one permutation hashing: every hash goes
+    to one of SIGNATURE_SIZE bins, which keep their minimum, so a file is
+    hashed once instead of once per permutation. Empty bins take the value of
+    the next bin that is not (densification), shifted by the distance so they
+    do not match by chance.
+
+    Returns:
+        The signature, None for an empty set
+    """
+    if not hashes:
+        return None
+    bins: List[Optional[int]] = [None] * SIGNATURE_SIZE
+    for value in hashes:
+        index: int = value >> VALUE_BITS
+        value &= VALUE_MASK
+        current = bins[index]
+        if current is None or value < current:
+            bins[index] = value
+
+    signature: List[int] = []
+    for index in range(SIGNATURE_SIZE):
+        distance: int = 0
+        while bins[(index + distance) % SIGNATURE_SIZE] is None:
+            distance += 1
+        filled = bins[(index + distance) % SIGNATURE_SIZE]
+        signature.append(filled + (distance << VALUE_BITS))  # type: ignore
+    return signature
+
+
+def similarity(signature: Sequence[int], other: Sequence[int]) -> float:
+    """Estimated Jaccard similarity of the shingles of two signatures."""
+    return sum(a == b for a, b in zip(signature, other)) / len(signature)
+
+
+def find_duplicates(
+    keys: Sequence[str],
+    read: Callable[[int], str],
+    threshold: float,
+) -> Dict[int, int]:
+    """
+    Items that are exact or near duplicates of an earlier one.
+
+    Items with the same key (content hash) are exact duplicates. With a
+    threshold under 1, the other items are compared by MinHash and an item
+    whose shingles are at least threshold similar to those of an earlier
+    representative joins it. Only representatives are indexed, so clusters do
+    not chain into each other.
+
+    Args:
+        keys: Content hash of every item, in order of importance
+        read: Content of the item at an index, only called for near duplicates
+        threshold: Minimum estimated Jaccard similarity of near duplicates
+
+    Returns:
+        Index of the representative of every duplicate, by index
+    """
+    duplicates: Dict[int, int] = {}
+    by_key: Dict[str, int] = {}
+    for i, key in enumerate(keys):
+        if key in by_key:
+            duplicates[i] = by_key[key]
+        else:
+            by_key[key] = i
+    if threshold >= 1:
+        return duplicates
+
+    signatures: Dict[int, List[int]] = {}
+    buckets: Dict[tuple, List[int]] = {}
+    for i in by_key.values():
+        signature = minhash(shingle_hashes(read(i)))
+        if signature is None:
+            continue
+        bands: List[tuple] = [
+            (start, *signature[start : start + BAND_ROWS])
+            for start in range(0, SIGNATURE_SIZE, BAND_ROWS)
+        ]
+        candidates: set[int] = {
+            representative for band in bands for representative in buckets.get(band, ())
+        }
+        best: Optional[int] = max(
+            candidates,
+            key=lambda representative: (
+                similarity(signature, signatures[representative]),
+                -representative,
+            ),
+            default=None,
+        )
+        if best is not None and similarity(signature, signatures[best]) >= threshold:
+            duplicates[i] = best
+            continue
+
+        signatures[i] = signature
+        for band in bands:
+            buckets.setdefault(band, []).append(i)
+    return duplicates
@@ -1,9 +1,74 @@
+import logging
+import multiprocessing
 import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import batched, islice
 from pathlib import Path
-from typing import List, Tuple
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from .cache import TokenCache, hash_content
+from .config import MAX_CONTENT_BYTES, SELECTION_KNAPSACK
+from .dedup import find_duplicates
+from .ignore import IgnoreMatcher
+from .knapsack import knapsack
+from .stats import stats
+from .utils import ESTIMATE_ENCODING, TokenCounter
 
-from .utils import TokenCounter
+logger = logging.getLogger("llm_devtale")
+
+# Files read and tokenized together by get_files_by_token
+TOKEN_BATCH_SIZE: int = 256
+# Batches queued per selection worker, see FileSelector.scan_in_pool
+BATCHES_PER_WORKER: int = 4
+
+
+@dataclass
+class FileRecord:
+    """A selected file, read at most once between selection and summarization."""
+
+    # Relative to the repository root
+    path: str
+    size: int
+    # Git blob id when known, hash of the content otherwise
+    content_hash: str
+    tokens: int
+    # None when it was not read, or is over the memory cap of the selection
+    content: Optional[str] = None
+    # Path of the selected file whose summary is reused for this duplicate
+    duplicate_of: Optional[str] = None
+
+
+@dataclass
+class BudgetReport:
+    """How much of the token budget a selection uses, and what it is worth."""
+
+    budget: int
+    tokens: int
+    files: int
+    # Files tokenized by the selection that fit into max_tokens_per_file
+    candidates: int
+    # Commits of the selected and the candidate files
+    effort: int
+    candidates_effort: int
+    # Selected files summarized with another one, and their tokens
+    duplicates: int = 0
+    duplicate_tokens: int = 0
+
+    def __str__(self) -> str:
+        usage: float = self.tokens / self.budget * 100 if self.budget else 0
+        report: str = (
+            f"Selected {self.files} of {self.candidates} files: "
+            f"{self.tokens} of {self.budget} tokens ({usage:.1f}%), "
+            f"{self.effort} of {self.candidates_effort} commits"
+        )
+        if self.duplicates:
+            report += (
+                f", {self.duplicates} duplicates ({self.duplicate_tokens} tokens) "
+                "reuse the summary of another file"
+            )
+        return report
 
 
 class FileRepo:
@@ -18,10 +83,30 @@ class FileSelector:
         file_repo: FileRepo,
         ignore_patterns: list[str] = [],
         allowed_extensions: list[str] = [],
+        token_cache: Optional[TokenCache] = None,
+        blob_ids: Optional[Dict[str, str]] = None,
+        max_content_bytes: int = MAX_CONTENT_BYTES,
+        selection: str = SELECTION_KNAPSACK,
+        chunk_large_files: bool = False,
+        workers: int = 1,
+        dedup_threshold: Optional[float] = None,
     ) -> None:
-        self.ignore_patterns: List[str] = ignore_patterns
+        self.ignore_patterns = ignore_patterns
         self.allowed_extensions: List[str] = allowed_extensions
         self.file_repo = file_repo
+        # Token counts of unchanged files are looked up by their git blob id
+        self.token_cache: Optional[TokenCache] = token_cache
+        self.blob_ids: Dict[str, str] = blob_ids or {}
+        # Memory used by the content of the selected files
+        self.max_content_bytes: int = max_content_bytes
+        self.selection: str = selection
+        # Large files are summarized in chunks, only the project budget applies
+        self.chunk_large_files: bool = chunk_large_files
+        # Processes reading, hashing and tokenizing files, 1 to do it in place
+        self.workers: int = workers
+        # Similarity of near duplicate files, 1 for exact ones, None to keep them
+        self.dedup_threshold: Optional[float] = dedup_threshold
+        self.budget_report: Optional[BudgetReport] = None
 
     def valid_extension(self, file: str) -> bool:
         if os.path.splitext(file)[1] in self.allowed_extensions:
@@ -29,29 +114,279 @@ class FileSelector:
 
         return False
 
-    def valid_file(self, file: str) -> bool:
-        path = Path(file)
+    @property
+    def ignore_patterns(self) -> List[str]:
+        return self.ignore_matcher.patterns
 
+    @ignore_patterns.setter
+    def ignore_patterns(self, patterns: List[str]) -> None:
+        # Compiled once, valid_file is called for every file in the repository
+        self.ignore_matcher = IgnoreMatcher(patterns)
+
+    def valid_file(self, file: str) -> bool:
         if not self.valid_extension(file):
             return False
 
-        for pattern in self.ignore_patterns:
-            if path.match(pattern) or any(p.match(pattern) for p in path.parents):
-                return False
-        return True
+        return not self.ignore_matcher.is_ignored(file.replace(os.sep, "/"))
 
-    def count_tokens(self, file_path) -> int:
+    def read_file(self, file_path) -> str:
         if not os.path.isabs(file_path):
             file_path = os.path.join(self.file_repo.repo_path, file_path)
 
         try:
             with open(file_path, "r") as f:
-                content: str = f.read()
-                token_count = TokenCounter.count_tokens(content)
+                return f.read()
         except Exception:
-            token_count = 0
+            return ""
+
+    def count_tokens(self, file_path) -> int:
+        content: str = self.read_file(file_path)
+        return TokenCounter.count_tokens(content) if content else 0
 
-        return token_count
+    def file_size(self, file_path: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self.file_repo.repo_path, file_path))
+        except OSError:
+            return 0
+
+    def cached_tokens(self, file_paths: List[str]) -> Dict[str, int]:
+        """Token counts in the token cache by blob id."""
+        if self.token_cache is None:
+            return {}
+        return self.token_cache.get_many(
+            (self.blob_ids[path] for path in file_paths if path in self.blob_ids),
+            TokenCounter.encoding_id(),
+        )
+
+    def store_tokens(self, records: List[FileRecord]) -> None:
+        """Store the token counts of the records read by their blob id."""
+        if self.token_cache is None:
+            return
+        self.token_cache.set_many(
+            {
+                self.blob_ids[record.path]: record.tokens
+                for record in records
+                if record.content is not None and record.path in self.blob_ids
+            },
+            TokenCounter.encoding_id(),
+        )
+
+    def read_records(
+        self, file_paths: List[str], cached: Optional[Dict[str, int]] = None
+    ) -> List[FileRecord]:
+        """
+        Records of the files with their token counts. With a token cache, or
+        the cached counts by blob id, only files without a blob id or whose
+        blob was never counted are read, and only those records carry the
+        content.
+        """
+        if cached is None:
+            cached = self.cached_tokens(file_paths)
+
+        with stats.stage("read files"):
+            contents: Dict[str, str] = {
+                path: self.read_file(path)
+                for path in file_paths
+                if self.blob_ids.get(path) not in cached
+            }
+        with stats.stage("count tokens"):
+            counts: Dict[str, int] = dict(
+                zip(contents, TokenCounter.count_tokens_batch(list(contents.values())))
+            )
+
+        records: List[FileRecord] = []
+        for path in file_paths:
+            if path in contents:
+                content: str = contents[path]
+                records.append(
+                    FileRecord(
+                        path=path,
+                        size=len(content.encode("utf-8", errors="replace")),
+                        content_hash=self.blob_ids.get(path) or hash_content(content),
+                        tokens=counts[path],
+                        content=content,
+                    )
+                )
+            else:
+                records.append(
+                    FileRecord(
+                        path=path,
+                        size=self.file_size(path),
+                        content_hash=self.blob_ids[path],
+                        tokens=cached[self.blob_ids[path]],
+                    )
+                )
+        self.store_tokens(records)
+        return records
+
+    def count_tokens_batch(self, file_paths: List[str]) -> List[int]:
+        return [record.tokens for record in self.read_records(file_paths)]
+
+    def candidate_records(self, max_tokens_per_file: int) -> Iterator[FileRecord]:
+        """
+        Records of the valid files with at most max_tokens_per_file tokens
+        (any size with chunk_large_files), most commits first. Files are read
+        and tokenized lazily, in batches of TOKEN_BATCH_SIZE. The content is
+        kept up to max_content_bytes, so the parsers do not read those files
+        again.
+        """
+        file_paths: List[str] = list(self.file_repo.effort.keys())
+        records: Iterable[FileRecord]
+        if self.workers > 1 and len(file_paths) > TOKEN_BATCH_SIZE:
+            records = self.scan_in_pool(file_paths)
+        else:
+            records = (
+                record
+                for batch in batched(
+                    filter(self.valid_file, file_paths), TOKEN_BATCH_SIZE
+                )
+                for record in self.read_records(list(batch))
+            )
+
+        content_bytes: int = 0
+        for record in records:
+            if record.tokens == 0:
+                continue
+            if record.tokens > max_tokens_per_file and not self.chunk_large_files:
+                continue
+
+            if record.content is not None:
+                if content_bytes + record.size > self.max_content_bytes:
+                    record.content = None
+                else:
+                    content_bytes += record.size
+
+            yield record
+
+    def scan_in_pool(self, file_paths: List[str]) -> Iterator[FileRecord]:
+        """
+        Records of the valid files of file_paths, in order, filtered, read,
+        hashed and tokenized in batches of TOKEN_BATCH_SIZE by a pool of
+        worker processes. Only BATCHES_PER_WORKER batches per worker are
+        queued ahead, so the effort selection stops soon after the budget is
+        full. The token cache stays in this process, and only stores the
+        counts of workers that used the same encoding.
+        """
+        encoding_id: str = TokenCounter.encoding_id()
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            # Not forked from a process with threads (GitPython, tiktoken)
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(
+                self.file_repo.repo_path,
+                self.ignore_patterns,
+                self.allowed_extensions,
+                TokenCounter.bpe_file,
+                encoding_id,
+            ),
+        )
+
+        def submit(batch: Tuple[str, ...]) -> Future:
+            paths: List[str] = list(batch)
+            return executor.submit(
+                scan_batch,
+                paths,
+                {path: self.blob_ids[path] for path in paths if path in self.blob_ids},
+                self.cached_tokens(paths),
+            )
+
+        batches = batched(file_paths, TOKEN_BATCH_SIZE)
+        pending: Deque[Future] = deque(
+            submit(batch)
+            for batch in islice(batches, self.workers * BATCHES_PER_WORKER)
+        )
+        mismatch_logged: bool = False
+        try:
+            while pending:
+                records, worker_encoding_id = pending.popleft().result()
+                for batch in islice(batches, 1):
+                    pending.append(submit(batch))
+                if worker_encoding_id == encoding_id:
+                    self.store_tokens(records)
+                elif not mismatch_logged:
+                    logger.warning(
+                        f"Selection workers counted tokens with {worker_encoding_id} "
+                        f"instead of {encoding_id}, their counts are not cached"
+                    )
+                    mismatch_logged = True
+                yield from records
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    @stats.timed("selection")
+    def select_files(
+        self, max_token_count: int, max_tokens_per_file: int = 20000
+    ) -> Tuple[List[FileRecord], int]:
+        """
+        Records of the files that fit into max_token_count, most commits first.
+
+        With the knapsack strategy every candidate is tokenized and the budget
+        is packed with the files worth the most commits. With the effort
+        strategy files are taken in effort order until the first one that does
+        not fit, so at most one batch is read beyond the last selected file.
+        The budget use is stored in budget_report.
+        """
+        git_effort: dict[str, int] = self.file_repo.effort
+        candidates: List[FileRecord] = []
+        selected: List[FileRecord] = []
+
+        if self.selection == SELECTION_KNAPSACK:
+            candidates = list(self.candidate_records(max_tokens_per_file))
+            chosen: List[int] = knapsack(
+                [git_effort[record.path] for record in candidates],
+                [record.tokens for record in candidates],
+                max_token_count,
+            )
+            selected = [candidates[i] for i in chosen]
+        else:
+            total_token_count: int = 0
+            for record in self.candidate_records(max_tokens_per_file):
+                candidates.append(record)
+                if record.tokens + total_token_count > max_token_count:
+                    break
+
+                total_token_count += record.tokens
+                selected.append(record)
+
+        duplicates: List[FileRecord] = (
+            self.mark_duplicates(selected) if self.dedup_threshold is not None else []
+        )
+        self.budget_report = BudgetReport(
+            budget=max_token_count,
+            tokens=sum(record.tokens for record in selected),
+            files=len(selected),
+            candidates=len(candidates),
+            effort=sum(git_effort[record.path] for record in selected),
+            candidates_effort=sum(git_effort[record.path] for record in candidates),
+            duplicates=len(duplicates),
+            duplicate_tokens=sum(record.tokens for record in duplicates),
+        )
+        return selected, self.budget_report.tokens
+
+    @stats.timed("deduplication")
+    def mark_duplicates(self, records: List[FileRecord]) -> List[FileRecord]:
+        """
+        Set duplicate_of on the records that are duplicates of an earlier one,
+        see find_duplicates, so the file with the most commits is summarized.
+        Files whose content was not kept are read again for near duplicates.
+
+        Returns:
+            The duplicates
+        """
+
+        def read(i: int) -> str:
+            content: Optional[str] = records[i].content
+            return content if content is not None else self.read_file(records[i].path)
+
+        duplicates: Dict[int, int] = find_duplicates(
+            [record.content_hash for record in records],
+            read,
+            threshold=self.dedup_threshold if self.dedup_threshold is not None else 1,
+        )
+        for i, representative in duplicates.items():
+            records[i].duplicate_of = records[representative].path
+        return [records[i] for i in sorted(duplicates)]
 
     def get_files_by_token(
         self, max_token_count: int, max_tokens_per_file: int = 20000
@@ -60,24 +395,49 @@ class FileSelector:
         Returns the files that fir into the max_toke_count, focusing first in the files with most commits,
         assuming that more commits means more importance
         """
-        git_effort: dict[str, int] = self.file_repo.effort
+        records, total_token_count = self.select_files(
+            max_token_count, max_tokens_per_file
+        )
+        return [record.path for record in records], total_token_count
 
-        valid_files = filter(self.valid_file, git_effort.keys())
 
-        total_token_count: int = 0
-        hot_files: List[str] = []
+# Selector of a worker process of FileSelector.scan_in_pool
+_worker_selector: Optional[FileSelector] = None
 
-        for valid_file in valid_files:
-            file_token_count = self.count_tokens(valid_file)
-            if file_token_count == 0:
-                continue
-            if file_token_count > max_tokens_per_file:
-                continue
 
-            if file_token_count + total_token_count > max_token_count:
-                break
+def init_worker(
+    repo_path: Path,
+    ignore_patterns: List[str],
+    allowed_extensions: List[str],
+    bpe_file: Optional[str],
+    encoding_id: str,
+) -> None:
+    global _worker_selector
+    # The pool already uses every core. Without an encoding in the parent,
+    # the workers do not try to load it either.
+    TokenCounter.configure(
+        bpe_file=bpe_file,
+        num_threads=1,
+        estimate=encoding_id == ESTIMATE_ENCODING,
+    )
+    _worker_selector = FileSelector(
+        FileRepo(repo_path, {}),
+        ignore_patterns=ignore_patterns,
+        allowed_extensions=allowed_extensions,
+    )
 
-            total_token_count += file_token_count
-            hot_files.append(valid_file)
 
-        return hot_files, total_token_count
+def scan_batch(
+    file_paths: List[str], blob_ids: Dict[str, str], cached: Dict[str, int]
+) -> Tuple[List[FileRecord], str]:
+    """
+    Records of the valid files of a batch, in a worker process, and the
+    encoding id of their token counts.
+    """
+    selector = _worker_selector
+    assert selector is not None, "init_worker was not called"
+    selector.blob_ids = blob_ids
+    records: List[FileRecord] = selector.read_records(
+        [path for path in file_paths if selector.valid_file(path)], cached=cached
+    )
+    return records, TokenCounter.encoding_id()
@@ -1,37 +1,203 @@
-from git import Repo
-
+import hashlib
+import json
+import logging
+import os
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
+
+from git import BadName, GitCommandError, Repo
+
+from .stats import stats
+
+logger = logging.getLogger("llm_devtale")
+
+# Marks the start of a commit in the log output, before its hash
+COMMIT_MARKER: str = "\x01"
+LOG_CHUNK_SIZE: int = 1 << 16
+EFFORT_INDEX_VERSION: int = 1
 
 
 class GitRepository:
-    def __init__(self, repo_path: Path):
+    def __init__(self, repo_path: Path, cache_dir: Optional[Path] = None):
         self.repo_path: Path = repo_path
         self.repo: Repo = Repo(self.repo_path)
+        # Where the effort index is persisted between runs, if set
+        self.cache_dir: Optional[Path] = Path(cache_dir) if cache_dir else None
 
     def get_commit_count(self) -> int:
         return int(self.repo.git.rev_list("--count", "HEAD"))
 
-    def get_git_effort(self) -> dict[str, int]:
-        result: str = self.repo.git.effort()
+    def get_tracked_files(self) -> set[str]:
+        return {file for file in self.repo.git.ls_files("-z").split("\0") if file != ""}
 
-        res: dict[str, int] = {}
+    @stats.timed("blob ids")
+    def get_blob_ids(self) -> dict[str, str]:
+        """
+        Blob id of every tracked file, from the index. Files whose content in
+        the working tree differs from the index are left out, as their blob id
+        does not describe what is on disk.
+        """
+        modified: set[str] = {
+            file for file in self.repo.git.ls_files("-m", "-z").split("\0") if file
+        }
+        blob_ids: dict[str, str] = {}
+        for entry in self.repo.git.ls_files("-s", "-z").split("\0"):
+            if not entry:
+                continue
+            # <mode> <blob id> <stage>\t<path>
+            info, _, path = entry.partition("\t")
+            mode, blob_id, stage = info.split(" ")
+            # Skip submodules and unmerged paths
+            if mode == "160000" or stage != "0" or path in modified:
+                continue
+            blob_ids[path] = blob_id
+        return blob_ids
 
-        for line in result.split("\n"):
-            words = line.split()
+    def iter_log(self, *args: str) -> Iterator[str]:
+        """
+        Stream the NUL separated tokens of `git log -z` with the changed files
+        of each commit, oldest commit first. Commits start with a token made of
+        COMMIT_MARKER and the commit hash.
+        """
+        process = self.repo.git.log(
+            "--reverse",
+            "-z",
+            "--name-status",
+            f"--format={COMMIT_MARKER}%H",
+            *args,
+            as_process=True,
+        )
+        pending: bytes = b""
+        for chunk in iter(lambda: process.stdout.read(LOG_CHUNK_SIZE), b""):
+            *tokens, pending = (pending + chunk).split(b"\0")
+            for token in tokens:
+                yield token.decode("utf-8", errors="surrogateescape").lstrip("\n")
+        if pending:
+            yield pending.decode("utf-8", errors="surrogateescape").lstrip("\n")
+        process.wait()
 
-            if len(words) < 3:
-                continue
-            if words[1] == "commits":
+    @staticmethod
+    def count_changes(
+        tokens: Iterable[str],
+        counts: Optional[Dict[str, int]] = None,
+        follow_renames: bool = False,
+    ) -> Optional[str]:
+        """
+        Add to counts one commit for every file changed in each commit of the
+        log. With follow_renames the count of a renamed file moves to its new
+        name, as the log is walked from the oldest commit.
+
+        Returns:
+            Hash of the last commit of the log, None if it is empty
+        """
+        counts = counts if counts is not None else {}
+        last_commit: Optional[str] = None
+        tokens = iter(tokens)
+        for token in tokens:
+            if token.startswith(COMMIT_MARKER):
+                last_commit = token[len(COMMIT_MARKER) :]
                 continue
-            if words[0] == "":
+            if not token:
                 continue
 
-            file: str = words[0].split("..")[0]
-            try:
-                commits = int(words[1])
-            except Exception:
-                commits = 1
+            status: str = token[0]
+            if status in ("R", "C"):
+                old_path, path = next(tokens), next(tokens)
+                if status == "R" and follow_renames:
+                    counts[path] = counts.get(path, 0) + counts.pop(old_path, 0)
+            else:
+                path = next(tokens)
+            counts[path] = counts.get(path, 0) + 1
+
+        return last_commit
+
+    @stats.timed("git effort")
+    def get_git_effort(self, follow_renames: bool = False) -> dict[str, int]:
+        """
+        Number of commits that changed each tracked file, computed in a single
+        pass over the history, sorted with the most changed files first.
+
+        When a cache_dir is set, the counts are stored along with the commit
+        they were computed at, and the next run only walks the new commits.
+        """
+        try:
+            head: str = self.repo.head.commit.hexsha
+        except ValueError:
+            # A repository without commits has no history to count
+            return {}
+
+        rename_args = ["-M"] if follow_renames else ["--no-renames"]
+        counts: Optional[Dict[str, int]] = None
+        index = self.load_effort_index(follow_renames)
+        if index is not None and self.is_ancestor(index["commit"], head):
+            counts = index["counts"]
+            if index["commit"] != head:
+                logger.debug(f"Updating effort index from {index['commit']}")
+                self.count_changes(
+                    self.iter_log(*rename_args, f"{index['commit']}..{head}"),
+                    counts,
+                    follow_renames=follow_renames,
+                )
+        if counts is None:
+            counts = {}
+            self.count_changes(
+                self.iter_log(*rename_args, head), counts, follow_renames=follow_renames
+            )
+
+        self.save_effort_index(follow_renames, head, counts)
+        return sort_effort(counts, self.get_tracked_files())
+
+    def is_ancestor(self, commit: str, head: str) -> bool:
+        """False also when the commit no longer exists, e.g. after a force-push."""
+        try:
+            return self.repo.is_ancestor(commit, head)
+        except (GitCommandError, BadName, ValueError):
+            return False
+
+    def effort_index_path(self, follow_renames: bool) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        repo_key: str = hashlib.sha256(
+            os.path.abspath(self.repo.working_dir).encode()
+        ).hexdigest()[:16]
+        suffix: str = "-renames" if follow_renames else ""
+        return self.cache_dir / "effort" / f"{repo_key}{suffix}.json"
+
+    def load_effort_index(self, follow_renames: bool) -> Optional[dict]:
+        path = self.effort_index_path(follow_renames)
+        if path is None or not path.exists():
+            return None
+        try:
+            with open(path, "r") as f:
+                index: dict = json.load(f)
+        except (OSError, ValueError):
+            logger.warning(f"Ignoring unreadable effort index {path}")
+            return None
+        if index.get("version") != EFFORT_INDEX_VERSION:
+            return None
+        return index
+
+    def save_effort_index(
+        self, follow_renames: bool, commit: str, counts: Dict[str, int]
+    ) -> None:
+        path = self.effort_index_path(follow_renames)
+        if path is None:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        index: dict = {
+            "version": EFFORT_INDEX_VERSION,
+            "commit": commit,
+            "counts": counts,
+        }
+        # Write and rename so an interrupted run never leaves a broken index
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
 
-            res[file] = commits
 
-        return dict(sorted(res.items(), key=lambda item: item[1], reverse=True))
+def sort_effort(counts: Dict[str, int], tracked_files: set[str]) -> dict[str, int]:
+    res: dict[str, int] = {
+        file: commits for file, commits in counts.items() if file in tracked_files
+    }
+    return dict(sorted(res.items(), key=lambda item: (-item[1], item[0])))
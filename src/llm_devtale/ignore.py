@@ -0,0 +1,159 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Pattern, Tuple
+
+
+class IgnoreRule(NamedTuple):
+    regex: Pattern[str]
+    dir_only: bool
+    negated: bool
+    # The regex only has to match the last component of the path
+    basename: bool
+
+
+def translate_pattern(pattern: str) -> Optional[IgnoreRule]:
+    """
+    Translate a gitignore pattern into a regular expression matching the
+    whole relative path of a file or folder.
+
+    Returns:
+        The rule, None for blank lines and comments
+    """
+    pattern = pattern.rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negated: bool = pattern.startswith("!")
+    if negated:
+        pattern = pattern[1:]
+    elif pattern.startswith("\\"):
+        # Escaped leading "!" or "#"
+        pattern = pattern[1:]
+
+    dir_only: bool = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # A separator at the beginning or in the middle anchors the pattern to the
+    # root, otherwise it matches the last component at any depth, and so does
+    # a leading "**/" followed by a single component.
+    while pattern.startswith("**/"):
+        pattern = pattern[3:]
+        if "/" in pattern:
+            pattern = "**/" + pattern
+            break
+    basename: bool = "/" not in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    regex: str = ""
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if pattern.startswith("**", i):
+            at_start = i == 0 or pattern[i - 1] == "/"
+            at_end = i + 2 == n or pattern[i + 2] == "/"
+            if at_start and at_end:
+                if i + 2 == n:
+                    # "dir/**" matches everything inside dir
+                    regex += ".*"
+                else:
+                    # "**/" matches zero or more folders
+                    regex += "(?:.*/)?"
+                i += 3
+                continue
+            regex += "[^/]*"
+            i += 2
+        elif char == "*":
+            regex += "[^/]*"
+            i += 1
+        elif char == "?":
+            regex += "[^/]"
+            i += 1
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                regex += re.escape(char)
+                i += 1
+                continue
+            content = pattern[i + 1 : end].replace("\\", "\\\\")
+            if content.startswith("!"):
+                content = "^" + content[1:]
+            regex += f"[{content}]"
+            i = end + 1
+        elif char == "\\" and i + 1 < n:
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(char)
+            i += 1
+
+    return IgnoreRule(re.compile(regex), dir_only, negated, basename)
+
+
+class IgnoreMatcher:
+    """
+    Gitignore-style matcher compiled once for a list of patterns.
+
+    Without negated patterns every rule is merged into a single regular
+    expression. Folder decisions are memoized, and a file inside an ignored
+    folder is ignored without looking at the file itself.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: List[str] = list(patterns)
+        self.rules: List[IgnoreRule] = [
+            rule for rule in map(translate_pattern, self.patterns) if rule is not None
+        ]
+        self.has_negations: bool = any(rule.negated for rule in self.rules)
+        self._dir_cache: Dict[str, bool] = {"": False}
+
+        # Combined regexes by (is_dir, basename)
+        self._regexes: Dict[Tuple[bool, bool], Optional[Pattern[str]]] = {}
+        if not self.has_negations:
+            for is_dir in (True, False):
+                for basename in (True, False):
+                    self._regexes[(is_dir, basename)] = self._combine(
+                        [
+                            rule
+                            for rule in self.rules
+                            if rule.basename == basename
+                            and (is_dir or not rule.dir_only)
+                        ]
+                    )
+
+    @staticmethod
+    def _combine(rules: List[IgnoreRule]) -> Optional[Pattern[str]]:
+        if not rules:
+            return None
+        return re.compile("|".join(f"(?:{rule.regex.pattern})" for rule in rules))
+
+    def _match(self, path: str, is_dir: bool) -> bool:
+        name: str = path.rpartition("/")[2]
+        if not self.has_negations:
+            for basename, target in ((True, name), (False, path)):
+                regex = self._regexes[(is_dir, basename)]
+                if regex is not None and regex.fullmatch(target) is not None:
+                    return True
+            return False
+
+        # The last matching rule wins
+        ignored: bool = False
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.fullmatch(name if rule.basename else path) is not None:
+                ignored = not rule.negated
+        return ignored
+
+    def dir_ignored(self, path: str) -> bool:
+        """Whether the folder, or any folder above it, is ignored."""
+        ignored = self._dir_cache.get(path)
+        if ignored is None:
+            parent, _, _ = path.rpartition("/")
+            ignored = self.dir_ignored(parent) or self._match(path, is_dir=True)
+            self._dir_cache[path] = ignored
+        return ignored
+
+    def is_ignored(self, path: str) -> bool:
+        """Whether the file at path, relative to the repository root, is ignored."""
+        parent, _, _ = path.rpartition("/")
+        return self.dir_ignored(parent) or self._match(path, is_dir=False)
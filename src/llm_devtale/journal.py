@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, TextIO
+
+from .cache import hash_data
+from .config import ParserConfig
+from .node import Node, NodeType
+
+logger = logging.getLogger("llm_devtale")
+
+JOURNAL_DIR: str = "journal"
+
+
+class Journal:
+    """
+    Append-only checkpoint of the nodes summarized by a run, one JSON line per
+    node as soon as its description is set, so an interrupted run can be
+    resumed without summarizing them again.
+
+    The first line identifies the run settings (model, prompt); a journal
+    written with other settings is not resumed. The journal is removed once
+    the run completes.
+    """
+
+    def __init__(self, path: Path, settings: Dict[str, Any]) -> None:
+        self.path: Path = path
+        self.settings: Dict[str, Any] = settings
+        self._file: Optional[TextIO] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: ParserConfig, model_id: str) -> "Journal":
+        """Journal of the project directory, or of a shard, in the cache directory."""
+        directory: str = str(Path(config.directory).resolve())
+        name: str = hash_data(directory)
+        if config.shard_count > 1:
+            # Shards of a run can share a machine
+            name += f"-{config.shard_index + 1}-of-{config.shard_count}"
+        return cls(
+            config.cache_dir / JOURNAL_DIR / f"{name}.jsonl",
+            settings={
+                "directory": directory,
+                "model_id": model_id,
+                "prompt": config.prompt,
+            },
+        )
+
+    def load(self) -> Dict[str, Node]:
+        """
+        Nodes checkpointed by a previous run with the same settings, by path
+        as in Node.index. A line cut by the interruption is skipped.
+        """
+        nodes: Dict[str, Node] = {}
+        if not self.path.exists():
+            return nodes
+
+        with open(self.path, "r") as f:
+            header: Optional[str] = f.readline()
+            try:
+                settings = json.loads(header) if header else None
+            except ValueError:
+                settings = None
+            if settings != self.settings:
+                logger.warning(f"Journal {self.path} is from another run, not resuming")
+                return nodes
+
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    nodes[entry["path"]] = Node(
+                        name=entry["name"],
+                        description=entry["description"],
+                        node_type=NodeType(entry["node_type"]),
+                        content_hash=entry["content_hash"],
+                    )
+                except (ValueError, KeyError):
+                    logger.debug(f"Skipping incomplete journal entry {line!r}")
+        return nodes
+
+    def open(self, resume: bool = False) -> Dict[str, Node]:
+        """
+        Start journaling. With resume, the nodes of the previous journal are
+        returned and new nodes are appended to it, otherwise it is replaced.
+        """
+        nodes: Dict[str, Node] = self.load() if resume else {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write(json.dumps(self.settings) + "\n")
+            # Rewritten without incomplete lines
+            for node_path, node in nodes.items():
+                f.write(self.entry(node_path, node))
+        self._file = open(self.path, "a")
+        return nodes
+
+    @staticmethod
+    def entry(node_path: str, node: Node) -> str:
+        return (
+            json.dumps(
+                {
+                    "path": node_path,
+                    "name": node.name,
+                    "description": node.description,
+                    "node_type": node.node_type.value,
+                    "content_hash": node.content_hash,
+                }
+            )
+            + "\n"
+        )
+
+    def __call__(self, node_path: str, node: Node) -> None:
+        """Checkpoint a node, used as the on_node callback of the parsers."""
+        line: str = self.entry(node_path, node)
+        with self._lock:
+            if self._file is None:
+                return
+            # Flushed to the OS, it survives the process being killed
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove(self) -> None:
+        """Close and delete the journal, once the run it checkpoints is complete."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,107 @@
+import math
+from typing import List, Sequence
+
+# Items around the first one greedy can not fit, solved exactly
+CORE_SIZE: int = 64
+# Capacity buckets of the dynamic programming table
+DP_RESOLUTION: int = 2000
+
+
+def knapsack(
+    values: Sequence[int],
+    weights: Sequence[int],
+    capacity: int,
+    core_size: int = CORE_SIZE,
+    resolution: int = DP_RESOLUTION,
+) -> List[int]:
+    """
+    Approximate 0/1 knapsack: choose the items with the highest total value
+    whose total weight fits into capacity.
+
+    Items are sorted by value per unit of weight. The best ones, that greedy
+    would take anyway, are kept, and the items around the first one greedy can
+    not fit (the core) are solved with dynamic programming, with the weights
+    rounded up to `capacity / resolution` so the result never overflows. The
+    capacity left is then filled greedily with the remaining items. The best
+    single item is used instead if it alone is worth more.
+
+    Returns:
+        Indices of the chosen items, in ascending order
+    """
+    candidates: List[int] = [
+        i for i, weight in enumerate(weights) if 0 < weight <= capacity
+    ]
+    if not candidates:
+        return []
+
+    # Stable sort, ties keep the input order
+    order: List[int] = sorted(candidates, key=lambda i: -values[i] / weights[i])
+
+    # First item greedy can not fit
+    used: int = 0
+    split: int = len(order)
+    for position, i in enumerate(order):
+        if used + weights[i] > capacity:
+            split = position
+            break
+        used += weights[i]
+    if split == len(order):
+        return sorted(order)
+
+    core_start: int = max(0, split - core_size // 2)
+    core_end: int = min(len(order), split + core_size // 2)
+    chosen: List[int] = order[:core_start]
+    remaining: int = capacity - sum(weights[i] for i in chosen)
+
+    chosen += solve_exact(
+        order[core_start:core_end], values, weights, remaining, resolution
+    )
+    remaining = capacity - sum(weights[i] for i in chosen)
+    for i in order[core_end:]:
+        if weights[i] <= remaining:
+            chosen.append(i)
+            remaining -= weights[i]
+
+    best_single: int = max(candidates, key=lambda i: values[i])
+    if values[best_single] > sum(values[i] for i in chosen):
+        return [best_single]
+
+    return sorted(chosen)
+
+
+def solve_exact(
+    items: List[int],
+    values: Sequence[int],
+    weights: Sequence[int],
+    capacity: int,
+    resolution: int,
+) -> List[int]:
+    """Dynamic programming over the items, with capacity in at most resolution buckets."""
+    if capacity <= 0 or not items:
+        return []
+
+    bucket: int = max(1, math.ceil(capacity / resolution))
+    slots: int = capacity // bucket
+    scaled: List[int] = [math.ceil(weights[i] / bucket) for i in items]
+
+    best: List[int] = [0] * (slots + 1)
+    # taken[n][c]: item n improved the best value for capacity c
+    taken: List[bytearray] = []
+    for n, i in enumerate(items):
+        improved = bytearray(slots + 1)
+        weight: int = scaled[n]
+        for c in range(slots, weight - 1, -1):
+            value = best[c - weight] + values[i]
+            if value > best[c]:
+                best[c] = value
+                improved[c] = 1
+        taken.append(improved)
+
+    chosen: List[int] = []
+    c: int = slots
+    for n in range(len(items) - 1, -1, -1):
+        if taken[n][c]:
+            chosen.append(items[n])
+            c -= scaled[n]
+
+    return chosen
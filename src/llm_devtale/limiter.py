@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from .config import ParserConfig
+
+logger = logging.getLogger("llm_devtale")
+
+R = TypeVar("R")
+
+THROTTLE_STATUS_CODES = {429}
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+THROTTLE_MESSAGES = ("rate limit", "ratelimit", "too many requests", "quota")
+TRANSIENT_NAMES = (
+    "timeout",
+    "connection",
+    "overloaded",
+    "unavailable",
+    "internalserver",
+    "ratelimit",
+)
+
+# Seconds between two checks of a free concurrency slot in the async path
+ASYNC_POLL_INTERVAL: float = 0.05
+# Seconds between two checks of the result of the half open probe
+PROBE_POLL_INTERVAL: float = 1.0
+
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "status", "http_status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(exc, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle(exc: BaseException) -> bool:
+    if get_status_code(exc) in THROTTLE_STATUS_CODES:
+        return True
+    name: str = type(exc).__name__.lower()
+    message: str = str(exc).lower()
+    return "ratelimit" in name or any(text in message for text in THROTTLE_MESSAGES)
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (TimeoutError, ConnectionError)) or is_throttle(exc):
+        return True
+    if get_status_code(exc) in TRANSIENT_STATUS_CODES:
+        return True
+    name: str = type(exc).__name__.lower()
+    return any(text in name for text in TRANSIENT_NAMES)
+
+
+class TokenBucket:
+    """
+    Budget of units per minute, refilled continuously.
+
+    Reservations may drive the bucket negative: the caller is told how long to
+    wait for its share, so concurrent callers queue up instead of racing.
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float]) -> None:
+        self.per_minute: int = per_minute
+        self.clock = clock
+        self.available: float = float(per_minute)
+        self.updated_at: float = clock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take amount units from the bucket.
+
+        Returns:
+            Seconds to wait before the units are actually available
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        now = self.clock()
+        rate = self.per_minute / 60.0
+        self.available = min(
+            float(self.per_minute), self.available + (now - self.updated_at) * rate
+        )
+        self.updated_at = now
+        # A single request larger than the whole budget waits for a full bucket
+        self.available -= min(amount, float(self.per_minute))
+        return max(0.0, -self.available / rate)
+
+
+class RateLimiter:
+    """
+    Gatekeeper for every LLM request.
+
+    - Enforces requests/min and tokens/min budgets with token buckets.
+    - Retries transient errors with jittered exponential backoff.
+    - Adapts the number of requests in flight with AIMD: the limit grows by
+      one request per window of successes and is halved on throttling.
+    - Opens a circuit breaker after consecutive failures. Requests wait until
+      reset_timeout has passed, then a single probe request is sent (half
+      open) and the others wait for it: its success closes the breaker, its
+      failure opens it again.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.max_retries: int = max_retries
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.max_concurrency: int = max(1, max_concurrency)
+        self.min_concurrency: int = max(1, min(min_concurrency, self.max_concurrency))
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.clock = clock
+        self.sleep = sleep
+
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.concurrency: float = float(self.max_concurrency)
+        self.in_flight: int = 0
+        self.consecutive_failures: int = 0
+        self.opened_at: Optional[float] = None
+        self.probing: bool = False
+
+        self.retries: int = 0
+        self.throttles: int = 0
+
+        self._lock = threading.Lock()
+        self._slot_released = threading.Condition(self._lock)
+
+    @classmethod
+    def from_config(cls, config: ParserConfig, max_concurrency: int) -> "RateLimiter":
+        return cls(
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            max_retries=config.max_retries,
+            max_concurrency=max_concurrency,
+        )
+
+    @property
+    def tokens_per_minute(self) -> int:
+        return self.tokens.per_minute
+
+    def call(self, fn: Callable[..., R], *args: Any, tokens: int = 0, **kwargs) -> R:
+        """Call fn(*args, **kwargs) within the limits, retrying transient errors."""
+        attempt = 0
+        while True:
+            while (wait := self._circuit_wait()) > 0:
+                self.sleep(wait)
+            self.sleep(self._reserve(tokens))
+            with self._slot_released:
+                while not self._try_acquire_slot():
+                    self._slot_released.wait()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._release_slot()
+                delay = self._on_failure(e, attempt)
+                attempt += 1
+                self.sleep(delay)
+                continue
+
+            self._release_slot()
+            self._on_success()
+            return result
+
+    async def acall(
+        self, fn: Callable[..., Awaitable[R]], *args: Any, tokens: int = 0, **kwargs
+    ) -> R:
+        """Async version of call, for coroutine functions."""
+        attempt = 0
+        while True:
+            while (wait := self._circuit_wait()) > 0:
+                await asyncio.sleep(wait)
+            await asyncio.sleep(self._reserve(tokens))
+            while True:
+                with self._lock:
+                    if self._try_acquire_slot():
+                        break
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                self._release_slot()
+                delay = self._on_failure(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self._release_slot()
+            self._on_success()
+            return result
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter exponential backoff."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _circuit_wait(self) -> float:
+        """
+        Seconds to wait before checking the circuit breaker again, 0 when the
+        request can be sent. Once reset_timeout has passed, the first caller
+        is the probe.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            if self.probing:
+                return PROBE_POLL_INTERVAL
+            remaining: float = self.reset_timeout - (self.clock() - self.opened_at)
+            if remaining > 0:
+                return remaining
+            self.probing = True
+            # The next failure opens it again
+            self.consecutive_failures = self.failure_threshold - 1
+            return 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _try_acquire_slot(self) -> bool:
+        """Must be called holding the lock."""
+        if self.in_flight >= int(self.concurrency):
+            return False
+        self.in_flight += 1
+        return True
+
+    def _release_slot(self) -> None:
+        with self._slot_released:
+            self.in_flight -= 1
+            self._slot_released.notify_all()
+
+    def _on_success(self) -> None:
+        with self._slot_released:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.concurrency = min(
+                float(self.max_concurrency), self.concurrency + 1 / self.concurrency
+            )
+            self._slot_released.notify_all()
+
+    def _on_failure(self, exc: Exception, attempt: int) -> float:
+        """
+        Record a failed attempt.
+
+        Returns:
+            Seconds to wait before retrying
+
+        Raises:
+            The original exception when it is not worth retrying
+        """
+        with self._lock:
+            throttled = is_throttle(exc)
+            if self.probing:
+                self.probing = False
+                # The provider answered, even if the request itself is refused
+                if throttled or not is_transient(exc):
+                    self.opened_at = None
+            if throttled:
+                self.throttles += 1
+                self.concurrency = max(
+                    float(self.min_concurrency), self.concurrency / 2
+                )
+                logger.debug(f"Throttled, concurrency lowered to {self.concurrency}")
+            elif is_transient(exc):
+                self.consecutive_failures += 1
+                if self.consecutive_failures >= self.failure_threshold:
+                    logger.warning(
+                        f"{self.consecutive_failures} consecutive LLM failures, "
+                        f"pausing requests for {self.reset_timeout}s"
+                    )
+                    self.opened_at = self.clock()
+
+            if not is_transient(exc) or attempt >= self.max_retries:
+                raise exc
+            self.retries += 1
+
+        delay = self.backoff(attempt)
+        retry_after = get_retry_after(exc)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        logger.debug(f"Retrying LLM request in {delay:.1f}s after {exc!r}")
+        return delay
@@ -1,6 +1,9 @@
-from dataclasses import asdict, dataclass, field
+import json
+import os
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Dict, List
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 from rich.tree import Tree
 
@@ -18,9 +21,62 @@ class Node:
     node_type: NodeType
 
     children: List["Node"] = field(default_factory=list)
+    # Hash of the data the description was generated from. Folder and project
+    # data embed the children descriptions, so hashes form a Merkle tree.
+    content_hash: str = ""
 
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        """Dictionary used as prompt context, without bookkeeping fields."""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "node_type": self.node_type,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def to_summary_dict(self) -> Dict[str, Any]:
+        """Prompt context of the node alone, its description covers its children."""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "node_type": self.node_type.value,
+        }
+
+    def to_json(self) -> Dict[str, Any]:
+        """JSON serializable dictionary, loadable with Node.from_json."""
+        return {
+            "name": self.name,
+            "description": self.description,
+            "node_type": self.node_type.value,
+            "content_hash": self.content_hash,
+            "children": [child.to_json() for child in self.children],
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Node":
+        return cls(
+            name=data["name"],
+            description=data.get("description", ""),
+            node_type=NodeType(data["node_type"]),
+            content_hash=data.get("content_hash", ""),
+            children=[cls.from_json(child) for child in data.get("children", [])],
+        )
+
+    def index(self, path: str = "") -> Dict[str, "Node"]:
+        """
+        Map every node of the tree to its path relative to the repository.
+
+        Folder names are already relative paths, file names are joined to the
+        folder that contains them and the repository node gets an empty path.
+        """
+        nodes: Dict[str, Node] = {path: self}
+        for child in self.children:
+            if child.node_type == NodeType.FILE:
+                child_path = os.path.normpath(os.path.join(path, child.name))
+            else:
+                child_path = child.name
+            nodes.update(child.index(child_path))
+        return nodes
 
     def to_string(self, indent: int = 0) -> str:
         spacer = " " * indent
@@ -39,6 +95,19 @@ class Node:
         self.children.append(children)
 
 
+def load_tree(path: Path) -> Optional[Node]:
+    """Load a tree saved with save_tree, None if the file does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return Node.from_json(json.load(f))
+
+
+def save_tree(node: Node, path: Path) -> None:
+    with open(path, "w") as f:
+        json.dump(node.to_json(), f, indent=2)
+
+
 def get_icon(node_type: NodeType):
     return {
         NodeType.FILE: "📄",
@@ -1,16 +1,94 @@
+import asyncio
+import concurrent.futures
+import functools
 import logging
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 
 import llm
 
+from .batch import PendingSummary, PromptExporter
+from .cache import SummaryCache, hash_data
+from .chunker import Chunk, split_code
 from .config import ParserConfig
+from .files import FileRecord
+from .limiter import RateLimiter
 from .node import Node, NodeType
-from .utils import generate_summary, parallel_process
+from .scheduler import PRIORITY_ROLLUP, Scheduler
+from .stats import stats
+from .templates import SYSTEM_PROMPT
+from .utils import (
+    CHARS_PER_TOKEN,
+    TokenCounter,
+    agenerate_file_batch,
+    agenerate_summary,
+    generate_file_batch,
+    generate_summary,
+    get_prompt,
+    parallel_process,
+    parse_batch_response,
+    render_batch_prompt,
+    render_prompt,
+)
 
 logger = logging.getLogger("llm_devtale")
 
+# Relative path of the project root folder
+ROOT_FOLDER: str = "."
+# Key of the children in the summary data of folders and projects
+ROLLUP_KEYS: Dict[NodeType, str] = {
+    NodeType.FOLDER: "folder_content",
+    NodeType.REPOSITORY: "project_content",
+}
+
+
+class MapStep(NamedTuple):
+    """Parts of data summarized separately, and how to rebuild data from them."""
+
+    parts: List[dict]
+    summary_type: NodeType
+    combine: Callable[[List[str]], dict]
+
+
+def flatten(results: Iterable[Any]) -> List[Optional[Node]]:
+    """Nodes of file tasks, which return lists, and of folders."""
+    nodes: List[Optional[Node]] = []
+    for result in results:
+        if isinstance(result, list):
+            nodes.extend(result)
+        else:
+            nodes.append(result)
+    return nodes
+
+
+def find_node(nodes: Iterable[Optional[Node]], path: str) -> Optional[Node]:
+    """Node of the file at path among the nodes of its task."""
+    name: str = os.path.basename(path)
+    return next(
+        (node for node in nodes if node is not None and node.name == name), None
+    )
+
+
+def part_name(name: str, index: int, parts: int) -> str:
+    return f"{name or ROOT_FOLDER} (part {index + 1} of {parts})"
+
+
+def partial_data(name: str, entries: List[dict]) -> dict:
+    """Folder summary data of a batch of children of a large folder or project."""
+    return {"folder_name": name, "folder_content": entries}
+
+
+def rollup_entries(parts: List[dict], descriptions: List[str]) -> List[dict]:
+    return [
+        {
+            "name": part["folder_name"],
+            "description": description,
+            "node_type": NodeType.FOLDER.value,
+        }
+        for part, description in zip(parts, descriptions)
+    ]
+
 
 class Parser:
     def __init__(
@@ -20,6 +98,16 @@ class Parser:
         item_path: str = "./",
         folder_full_name: str = "",
         valid_files: list = [],
+        cache: Optional[SummaryCache] = None,
+        previous_nodes: Optional[Dict[str, Node]] = None,
+        async_model: Optional[llm.AsyncModel] = None,
+        semaphores: Optional[Dict[NodeType, asyncio.Semaphore]] = None,
+        limiter: Optional[RateLimiter] = None,
+        records: Optional[Dict[str, FileRecord]] = None,
+        exporter: Optional[PromptExporter] = None,
+        on_node: Optional[Callable[[str, Node], None]] = None,
+        failed: Optional[List[str]] = None,
+        scheduler: Optional[Scheduler] = None,
     ):
         self.parser_config: ParserConfig = parser_config
         self.model = model
@@ -27,6 +115,346 @@ class Parser:
         self.item_path: str = item_path
         self.folder_full_name: str = folder_full_name
         self.valid_files = valid_files
+        self.cache: Optional[SummaryCache] = cache
+        # Nodes of a previous run indexed by path, see Node.index
+        self.previous_nodes: Dict[str, Node] = previous_nodes or {}
+        # Only used by the asyncio engine (aparse)
+        self.async_model: Optional[llm.AsyncModel] = async_model
+        self.semaphores: Dict[NodeType, asyncio.Semaphore] = semaphores or {}
+        # Rate limits, retries and circuit breaker in front of every LLM call
+        self.limiter: Optional[RateLimiter] = limiter
+        # Selected files by relative path, with the content read during selection
+        self.records: Dict[str, FileRecord] = records or {}
+        # Cache misses are exported for a batch endpoint instead of generated
+        self.exporter: Optional[PromptExporter] = exporter
+        # Called with the path and the node of every description once it is set
+        self.on_node: Optional[Callable[[str, Node], None]] = on_node
+        # Files and folders left out of the tree by an error, shared by every
+        # parser of the run
+        self.failed: List[str] = failed if failed is not None else []
+        # Scheduler of the run, the parts of map-reduce steps are queued on it
+        self.scheduler: Optional[Scheduler] = scheduler
+
+    def child_kwargs(self) -> dict:
+        """Arguments shared by every parser created while walking the project."""
+        return {
+            "parser_config": self.parser_config,
+            "model": self.model,
+            "valid_files": self.valid_files,
+            "cache": self.cache,
+            "previous_nodes": self.previous_nodes,
+            "async_model": self.async_model,
+            "semaphores": self.semaphores,
+            "limiter": self.limiter,
+            "records": self.records,
+            "exporter": self.exporter,
+            "on_node": self.on_node,
+            "failed": self.failed,
+            "scheduler": self.scheduler,
+        }
+
+    def reuse_previous(self, node: Node, data: dict, node_path: str) -> bool:
+        """
+        Set the node content hash from its summary data. When a previous run
+        produced a node with the same content hash at the same path its
+        description is reused and True is returned.
+        """
+        node.content_hash = hash_data(data)
+        previous: Optional[Node] = self.previous_nodes.get(node_path)
+        if (
+            previous is not None
+            and previous.description
+            and previous.content_hash == node.content_hash
+        ):
+            logger.debug(f"Reusing previous description of {node_path or '.'}")
+            node.description = previous.description
+            return True
+
+        return False
+
+    def pending(self, node: Node) -> bool:
+        """Whether a child summary was exported and the node has to wait for it."""
+        return self.exporter is not None and any(
+            not child.description for child in node.children
+        )
+
+    def representative(self, node_path: str) -> Optional[str]:
+        """
+        Path of the file whose summary the duplicate at node_path reuses, None
+        if it is not a duplicate or that file is not parsed in this run.
+        """
+        record: Optional[FileRecord] = self.records.get(node_path)
+        if record is None or record.duplicate_of not in self.records:
+            return None
+        return record.duplicate_of
+
+    def fail(self, *paths: str) -> None:
+        """Log the current exception, the nodes of paths are missing from the tree."""
+        logger.exception(f"failed parsing {', '.join(paths)}")
+        self.failed.extend(
+            os.path.relpath(os.path.join(self.root_path, path), self.root_path)
+            for path in paths
+        )
+        stats.count("failed nodes", len(paths))
+
+    def emit(self, node: Node, node_path: str) -> None:
+        if self.on_node is not None and node.description:
+            self.on_node(node_path, node)
+
+    def describe(self, node: Node, data: dict, node_path: str) -> None:
+        """Set the node description, summarizing data if it changed."""
+        if self.pending(node):
+            return
+        if not self.reuse_previous(node, data, node_path):
+            try:
+                data = self.reduce(node.name, data, node.node_type)
+                node.description = self.summarize(data, summary_type=node.node_type)
+            except PendingSummary:
+                return
+        self.emit(node, node_path)
+
+    async def adescribe(self, node: Node, data: dict, node_path: str) -> None:
+        if self.pending(node):
+            return
+        if not self.reuse_previous(node, data, node_path):
+            try:
+                data = await self.areduce(node.name, data, node.node_type)
+                node.description = await self.asummarize(
+                    data, summary_type=node.node_type
+                )
+            except PendingSummary:
+                return
+        self.emit(node, node_path)
+
+    def export(self, cache_key: str, data: dict, summary_type: NodeType) -> None:
+        """Export the prompt of a summary missing from the cache, see PromptExporter."""
+        assert self.exporter is not None
+        self.exporter.add(
+            cache_key or self.cache_key(data, summary_type),
+            summary_type,
+            render_prompt(data, summary_type, self.parser_config.prompt),
+        )
+        raise PendingSummary(cache_key)
+
+    def cache_key(self, data: dict, summary_type: NodeType) -> str:
+        return SummaryCache.make_key(
+            model_id=getattr(self.model, "model_id", ""),
+            template=get_prompt(summary_type) + SYSTEM_PROMPT,
+            additional_prompt=self.parser_config.prompt,
+            data=data,
+        )
+
+    def prompt_tokens(self, data: dict, summary_type: NodeType) -> int:
+        prompt: str = render_prompt(data, summary_type, self.parser_config.prompt)
+        return TokenCounter.count_tokens(SYSTEM_PROMPT + prompt)
+
+    def estimate_tokens(self, data: dict, summary_type: NodeType) -> int:
+        """Prompt tokens of a request, only counted when there is a token budget."""
+        if self.limiter is None or not self.limiter.tokens_per_minute:
+            return 0
+        return self.prompt_tokens(data, summary_type)
+
+    def split_rollup(
+        self, data: dict, summary_type: NodeType
+    ) -> Optional[List[List[dict]]]:
+        """
+        Split the children of folder or project data into batches whose
+        prompts fit into max_tokens_per_prompt.
+
+        Returns:
+            The batches, None if the whole data already fits
+        """
+        key: Optional[str] = ROLLUP_KEYS.get(summary_type)
+        limit: int = self.parser_config.max_tokens_per_prompt
+        if key is None or not limit or len(data[key]) < 2:
+            return None
+
+        entries: List[dict] = data[key]
+        sizes: List[int] = TokenCounter.count_tokens_batch(
+            [str(entry) for entry in entries]
+        )
+        if self.prompt_tokens({**data, key: []}, summary_type) + sum(sizes) <= limit:
+            return None
+
+        budget: int = limit - self.prompt_tokens(partial_data("", []), NodeType.FOLDER)
+        batches: List[List[dict]] = [[]]
+        used: int = 0
+        for entry, size in zip(entries, sizes):
+            if batches[-1] and used + size > budget:
+                batches.append([])
+                used = 0
+            batches[-1].append(entry)
+            used += size
+        return batches
+
+    def split_file(self, name: str, data: dict) -> Optional[MapStep]:
+        """
+        With chunk_large_files, split file data over max_tokens_per_file on
+        the boundaries of its top level definitions. The file summary is then
+        made from the summaries of the chunks.
+        """
+        max_tokens: int = self.parser_config.max_tokens_per_file
+        code: Optional[str] = data.get("file_content")
+        if not self.parser_config.chunk_large_files or code is None:
+            return None
+        # A token is at least one character
+        if len(code) <= max_tokens or TokenCounter.count_tokens(code) <= max_tokens:
+            return None
+
+        chunks: List[Chunk] = split_code(code, name, max_tokens)
+        if len(chunks) < 2:
+            return None
+
+        def combine(descriptions: List[str]) -> dict:
+            return {
+                "file_name": name,
+                "file_parts": [
+                    {
+                        "lines": f"{chunk.start_line}-{chunk.end_line}",
+                        "description": description,
+                    }
+                    for chunk, description in zip(chunks, descriptions)
+                ],
+            }
+
+        parts: List[dict] = [
+            {
+                "file_name": f"{name} (lines {chunk.start_line}-{chunk.end_line})",
+                "file_content": chunk.content,
+            }
+            for chunk in chunks
+        ]
+        return MapStep(parts, NodeType.FILE, combine)
+
+    def map_step(
+        self, name: str, data: dict, summary_type: NodeType
+    ) -> Optional[MapStep]:
+        """Next map step to make data fit into a prompt, None if it already fits."""
+        if summary_type == NodeType.FILE:
+            return self.split_file(name, data)
+
+        batches = self.split_rollup(data, summary_type)
+        if batches is None:
+            return None
+        key: str = ROLLUP_KEYS[summary_type]
+        if len(batches) == len(data[key]):
+            logger.warning(
+                f"Children of {name or '.'} do not fit into "
+                f"{self.parser_config.max_tokens_per_prompt} prompt tokens"
+            )
+            return None
+
+        parts: List[dict] = [
+            partial_data(part_name(name, i, len(batches)), batch)
+            for i, batch in enumerate(batches)
+        ]
+        return MapStep(
+            parts,
+            NodeType.FOLDER,
+            lambda descriptions: {**data, key: rollup_entries(parts, descriptions)},
+        )
+
+    def reduce(self, name: str, data: dict, summary_type: NodeType) -> dict:
+        """
+        Map-reduce data until it fits into a prompt: the children of folders
+        and projects over max_tokens_per_prompt are summarized in batches, and
+        large files in chunks. The partial descriptions replace them.
+        """
+        while (step := self.map_step(name, data, summary_type)) is not None:
+            logger.debug(f"Summarizing {name or '.'} in {len(step.parts)} parts")
+            summarize_part = functools.partial(
+                self.summarize, summary_type=step.summary_type
+            )
+            # In order, and a failed part fails the whole node. On the workers
+            # of the run, within max_concurrency.
+            descriptions: List[str] = (
+                self.scheduler.map(summarize_part, step.parts)
+                if self.scheduler is not None
+                else [summarize_part(part) for part in step.parts]
+            )
+            data = step.combine(descriptions)
+
+        return data
+
+    async def areduce(self, name: str, data: dict, summary_type: NodeType) -> dict:
+        while (step := self.map_step(name, data, summary_type)) is not None:
+            logger.debug(f"Summarizing {name or '.'} in {len(step.parts)} parts")
+            descriptions: List[str] = await asyncio.gather(
+                *[
+                    self.asummarize(part, summary_type=step.summary_type)
+                    for part in step.parts
+                ]
+            )
+            data = step.combine(descriptions)
+
+        return data
+
+    def summarize(self, data: dict, summary_type: NodeType) -> str:
+        """Return the summary for data, asking the model only on a cache miss."""
+        cache_key: str = ""
+        if self.cache is not None:
+            cache_key = self.cache_key(data, summary_type)
+            cached_summary = self.cache.get(cache_key)
+            if cached_summary is not None:
+                return cached_summary
+        if self.exporter is not None:
+            self.export(cache_key, data, summary_type)
+
+        with stats.stage(f"summarize {summary_type.value}"):
+            if self.limiter is not None:
+                summary: str = self.limiter.call(
+                    generate_summary,
+                    self.model,
+                    data,
+                    summary_type=summary_type,
+                    additional_prompt=self.parser_config.prompt,
+                    tokens=self.estimate_tokens(data, summary_type),
+                )
+            else:
+                summary: str = generate_summary(
+                    self.model,
+                    data,
+                    summary_type=summary_type,
+                    additional_prompt=self.parser_config.prompt,
+                )
+        if self.cache is not None:
+            self.cache.set(cache_key, summary)
+
+        return summary
+
+    async def asummarize(self, data: dict, summary_type: NodeType) -> str:
+        """Async version of summarize, limited by the semaphore of the node type."""
+        cache_key: str = ""
+        if self.cache is not None:
+            cache_key = self.cache_key(data, summary_type)
+            cached_summary = self.cache.get(cache_key)
+            if cached_summary is not None:
+                return cached_summary
+        if self.exporter is not None:
+            self.export(cache_key, data, summary_type)
+
+        with stats.stage(f"summarize {summary_type.value}"):
+            async with self.semaphores[summary_type]:
+                if self.limiter is not None:
+                    summary: str = await self.limiter.acall(
+                        agenerate_summary,
+                        self.async_model,
+                        data,
+                        summary_type=summary_type,
+                        additional_prompt=self.parser_config.prompt,
+                        tokens=self.estimate_tokens(data, summary_type),
+                    )
+                else:
+                    summary: str = await agenerate_summary(
+                        self.async_model,  # type: ignore
+                        data,
+                        summary_type=summary_type,
+                        additional_prompt=self.parser_config.prompt,
+                    )
+        if self.cache is not None:
+            self.cache.set(cache_key, summary)
+
+        return summary
 
     def _should_ignore(self, path, root_path) -> bool:
         path = Path(path)
@@ -55,153 +483,555 @@ class ProjectParser(Parser):
 
         return original_readme_content
 
-    def parse(
-        self,
-    ) -> Node:
-        """It creates a dev tale for each file in the repository, and it
-        generates a README for the whole repository.
+    def get_folder_tree(self) -> Dict[str, List[str]]:
+        """
+        Subfolders of every folder to summarize, by path relative to the root,
+        parents before their children. The root is ROOT_FOLDER.
+
+        Folders without files of their own and with a single subfolder are
+        left out, their subfolder takes their place.
         """
+        folders: set[str] = {
+            os.path.normpath(os.path.dirname(file_path))
+            for file_path in self.valid_files
+        }
+        if self.parser_config.filter_folders:
+            # Only the files directly inside the selected folders
+            selected = sorted(
+                os.path.relpath(
+                    os.path.normpath(os.path.join(self.root_path, folder)),
+                    self.root_path,
+                )
+                for folder in self.parser_config.filter_folders
+            )
+            return {
+                ROOT_FOLDER: [folder for folder in selected if folder != ROOT_FOLDER],
+                **{folder: [] for folder in selected if folder != ROOT_FOLDER},
+            }
 
+        subfolders: Dict[str, set[str]] = {}
+        for folder in folders:
+            while folder != ROOT_FOLDER:
+                parent: str = os.path.dirname(folder) or ROOT_FOLDER
+                subfolders.setdefault(parent, set()).add(folder)
+                folder = parent
+
+        def kept_subfolders(folder: str) -> List[str]:
+            kept: List[str] = []
+            for subfolder in sorted(subfolders.get(folder, ())):
+                if subfolder in folders or len(subfolders.get(subfolder, ())) > 1:
+                    kept.append(subfolder)
+                else:
+                    kept.extend(kept_subfolders(subfolder))
+            return kept
+
+        tree: Dict[str, List[str]] = {}
+        pending: List[str] = [ROOT_FOLDER]
+        while pending:
+            folder = pending.pop(0)
+            tree[folder] = kept_subfolders(folder)
+            pending.extend(tree[folder])
+        return tree
+
+    def get_folder_parsers(
+        self, tree: Dict[str, List[str]]
+    ) -> Dict[str, "FolderParser"]:
+        # The files of every folder are known from the selection, so folders
+        # do not need to be listed again.
+        files_by_folder: Dict[str, List[str]] = {}
+        for file_path in self.valid_files:
+            folder_name: str = os.path.normpath(os.path.dirname(file_path))
+            files_by_folder.setdefault(folder_name, []).append(file_path)
+
+        folder_parsers: Dict[str, "FolderParser"] = {}
+        for folder_full_name in tree:
+            # Fix folder path to avoid issues with file system.
+            folder_path: str = os.path.join(self.root_path, folder_full_name, "")
+            if self.valid_files:
+                file_paths: Optional[List[str]] = files_by_folder.get(
+                    folder_full_name, []
+                )
+            elif folder_full_name == ROOT_FOLDER:
+                # Nothing selected, only filter_folders are listed
+                file_paths = []
+            else:
+                file_paths = None
+            folder_parsers[folder_full_name] = FolderParser(
+                item_path=folder_path,
+                folder_full_name=folder_full_name,
+                file_paths=file_paths,
+                **self.child_kwargs(),
+            )
+        return folder_parsers
+
+    def make_node(self, children: Iterable[Optional[Node]]) -> Node:
         repository_name: str = os.path.basename(os.path.abspath(self.root_path))
         project_node = Node(
             name=repository_name,
             description="",
             node_type=NodeType.REPOSITORY,
         )
-        # Get the project tree before modify it along with the complete list of files
-        # that the repository has.
-        file_paths = list(
-            map(lambda x: os.path.join(self.root_path, x), self.valid_files)
-        )
+        # Files and top level folders, sorted to keep the project hash stable.
+        for child in sorted(filter(None, children), key=lambda node: node.name):
+            project_node.add_children(child)
 
-        # Extract the folder paths from files list. This allows to avoid processing
-        # folders that should be ignored, and to use the process_folder logic.
-        folders = list(set([os.path.dirname(file_path) for file_path in file_paths]))
+        return project_node
 
-        if self.parser_config.filter_folders:
-            folders = [
-                os.path.normpath(os.path.join(self.root_path, f))
-                for f in self.parser_config.filter_folders
-            ]
+    def summary_data(self, project_node: Node) -> Optional[dict]:
+        if (
+            not project_node.children
+            or self.parser_config.skip_folder_readme
+            or self.parser_config.dry_run
+        ):
+            return None
 
-        # sort to always have the root folder at the beggining of the list.
-        folders: List[str] = sorted(folders, key=lambda path: path.count("/"))
+        return self.prompt_data(project_node)
 
-        # Get the folder's README section of each folder while it create a dev tale
-        # for each file.
-        for folder_path in folders:
-            folder_full_name: str = ""
-            try:
-                # Fix folder path to avoid issues with file system.
-                if not folder_path.endswith("/"):
-                    folder_path += "/"
-
-                folder_full_name = os.path.relpath(folder_path, self.root_path)
-
-                # folder's summary
-                folder_parser = FolderParser(
-                    parser_config=self.parser_config,
-                    model=self.model,
-                    item_path=folder_path,
-                    folder_full_name=folder_full_name,
-                    valid_files=self.valid_files,
+    def prompt_data(self, project_node: Node) -> dict:
+        return {
+            "project_name": project_node.name,
+            "project_content": [
+                child.to_summary_dict() for child in project_node.children
+            ],
+            "project_readme": self.get_readme(),
+        }
+
+    def parse(
+        self,
+    ) -> Node:
+        """It creates a dev tale for each file in the repository, and it
+        generates a README for the whole repository.
+        """
+        # Every file of every folder is queued at once in a single scheduler.
+        # Each folder summary starts as soon as its files and subfolders are
+        # done, so folders are summarized bottom-up.
+        tree: Dict[str, List[str]] = self.get_folder_tree()
+        folder_futures: Dict[str, concurrent.futures.Future] = {}
+        root_futures: List[concurrent.futures.Future] = []
+        with Scheduler(self.parser_config.max_concurrency) as scheduler:
+            self.scheduler = scheduler
+            folder_parsers = self.get_folder_parsers(tree)
+            # Files first, so duplicates can wait for the file they reuse
+            file_futures: Dict[str, List[concurrent.futures.Future]] = {}
+            path_futures: Dict[str, concurrent.futures.Future] = {}
+            for folder_name in reversed(tree):
+                folder_parser = folder_parsers[folder_name]
+                file_futures[folder_name] = []
+                for file_paths in folder_parser.get_file_tasks():
+                    future = scheduler.submit(folder_parser.parse_files, file_paths)
+                    file_futures[folder_name].append(future)
+                    for path in file_paths:
+                        path_futures[os.path.relpath(path, self.root_path)] = future
+
+            # Subfolders are submitted before the folders that contain them
+            for folder_name in reversed(tree):
+                folder_parser = folder_parsers[folder_name]
+                child_futures = file_futures[folder_name]
+                for path, representative in folder_parser.get_duplicates():
+                    future = path_futures.get(representative)
+                    child_futures.append(
+                        scheduler.submit(
+                            folder_parser.parse_duplicate,
+                            path,
+                            representative,
+                            future,
+                            after=[future] if future is not None else [],
+                        )
+                    )
+                child_futures += [
+                    folder_futures[subfolder] for subfolder in tree[folder_name]
+                ]
+                if folder_name == ROOT_FOLDER:
+                    root_futures = child_futures
+                    continue
+
+                folder_futures[folder_name] = scheduler.submit(
+                    folder_parser.build_from,
+                    child_futures,
+                    after=child_futures,
+                    priority=PRIORITY_ROLLUP,
                 )
 
-                folder_tale = folder_parser.parse()
-            except Exception:
-                logger.exception(f"failed parsing folder {folder_path}")
-                folder_tale = None
+            project_node: Node = scheduler.submit(
+                self.build_from,
+                root_futures,
+                after=root_futures,
+                priority=PRIORITY_ROLLUP,
+            ).result()
+        self.scheduler = None
 
-            # Create a dictionary with the folder's info that serves as context for
-            # generating the main repository summary
-            if folder_tale:
-                project_node.add_children(folder_tale)
+        return project_node
 
-        project_summary = ""
-        if (
-            project_node.children
-            and not self.parser_config.skip_folder_readme
-            and not self.parser_config.dry_run
-        ):
-            original_readme = self.get_readme()
-            project_data: dict = {
-                "project_name": repository_name,
-                "project_content": project_node.to_dict(),
-                "project_readme": original_readme,
+    def build_from(self, futures: List[concurrent.futures.Future]) -> Node:
+        """Create the project node once its children are done and summarize it."""
+        project_node = self.make_node(flatten(future.result() for future in futures))
+        project_data = self.summary_data(project_node)
+        if project_data is not None:
+            self.describe(project_node, project_data, node_path="")
+
+        return project_node
+
+    async def aparse(self) -> Node:
+        """
+        Same as parse, but every summary is a coroutine on a single event loop
+        using the async model. Concurrency is limited by one semaphore per
+        node type instead of a number of threads.
+        """
+        if not self.semaphores:
+            self.semaphores = {
+                NodeType.FILE: asyncio.Semaphore(
+                    self.parser_config.max_async_file_requests
+                ),
+                NodeType.FOLDER: asyncio.Semaphore(
+                    self.parser_config.max_async_folder_requests
+                ),
+                NodeType.REPOSITORY: asyncio.Semaphore(1),
             }
-            project_summary = generate_summary(
-                self.model,
-                project_data,
-                summary_type=NodeType.REPOSITORY,
-                additional_prompt=self.parser_config.prompt,
+
+        tree: Dict[str, List[str]] = self.get_folder_tree()
+        folder_parsers = self.get_folder_parsers(tree)
+        # Files first, so duplicates can wait for the file they reuse
+        file_tasks: Dict[str, List[asyncio.Task]] = {}
+        path_tasks: Dict[str, asyncio.Task] = {}
+        for folder_name in tree:
+            folder_parser = folder_parsers[folder_name]
+            file_tasks[folder_name] = []
+            for file_paths in folder_parser.get_file_tasks():
+                task = asyncio.create_task(folder_parser.aparse_files(file_paths))
+                file_tasks[folder_name].append(task)
+                for path in file_paths:
+                    path_tasks[os.path.relpath(path, self.root_path)] = task
+
+        async def parse_children(folder_name: str) -> List[Optional[Node]]:
+            folder_parser = folder_parsers[folder_name]
+            return flatten(
+                await asyncio.gather(
+                    *file_tasks[folder_name],
+                    *[
+                        folder_parser.aparse_duplicate(
+                            path, representative, path_tasks.get(representative)
+                        )
+                        for path, representative in folder_parser.get_duplicates()
+                    ],
+                    *[parse_folder(subfolder) for subfolder in tree[folder_name]],
+                )
             )
-            project_node.description = project_summary
+
+        async def parse_folder(folder_name: str) -> Optional[Node]:
+            try:
+                return await folder_parsers[folder_name].abuild(
+                    await parse_children(folder_name)
+                )
+            except Exception:
+                self.fail(folder_name)
+                return None
+
+        project_node = self.make_node(await parse_children(ROOT_FOLDER))
+        project_data = self.summary_data(project_node)
+        if project_data is not None:
+            await self.adescribe(project_node, project_data, node_path="")
 
         return project_node
 
 
 class FolderParser(Parser):
+    def __init__(self, *args, file_paths: Optional[List[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Files of the folder relative to the root, the folder is listed if None
+        self.file_paths: Optional[List[str]] = file_paths
+
     def parse(self) -> Node:
         """It creates a dev tale for each file in the directory without exploring
         subdirectories, and it generates a summary section for the folder.
         """
-        folder_path: str = self.item_path
-        node_dir = Node(
-            name=self.folder_full_name, description="", node_type=NodeType.FOLDER
+        # Duplicates of files in other folders are summarized on their own
+        file_tales = parallel_process(
+            self.get_file_tasks() + [[path] for path, _ in self.get_duplicates()],
+            self.parse_files,
+            max_workers=self.parser_config.max_concurrency,
+        )
+        return self.build(flatten(file_tales))
+
+    async def aparse(self) -> Node:
+        file_tales = await asyncio.gather(
+            *[
+                self.aparse_files(paths)
+                for paths in self.get_file_tasks()
+                + [[path] for path, _ in self.get_duplicates()]
+            ]
         )
+        return await self.abuild(flatten(file_tales))
+
+    def get_file_paths(self) -> List[str]:
+        if self.file_paths is not None:
+            return [
+                os.path.join(self.root_path, file_path) for file_path in self.file_paths
+            ]
 
-        file_paths = [
+        folder_path: str = self.item_path
+        return [
             os.path.join(folder_path, fn)
             for fn in os.listdir(folder_path)
             if os.path.isfile(os.path.join(folder_path, fn))
             and not self._should_ignore(os.path.join(folder_path, fn), self.root_path)
         ]
 
-        def make_parser(path: str) -> Optional[Node]:
-            try:
-                return FileParser(
-                    parser_config=self.parser_config,
-                    model=self.model,
-                    item_path=path,
-                    valid_files=self.valid_files,
-                ).parse()
-            except Exception:
-                logger.exception(f"failed parsing {path}")
-                return None
+    def file_tokens(self, path: str) -> int:
+        record: Optional[FileRecord] = self.records.get(
+            os.path.relpath(path, self.root_path)
+        )
+        if record is not None:
+            return record.tokens
+        return os.path.getsize(path) // CHARS_PER_TOKEN
+
+    def get_file_tasks(self) -> List[List[str]]:
+        """
+        Files of the folder summarized together, without duplicates, see
+        get_duplicates. With batch_small_files, files of at most
+        small_file_tokens tokens are packed up to max_tokens_per_batch and
+        max_files_per_batch, other files are alone.
+        """
+        file_paths: List[str] = [
+            path
+            for path in self.get_file_paths()
+            if self.representative(os.path.relpath(path, self.root_path)) is None
+        ]
+        if not self.parser_config.batch_small_files:
+            return [[path] for path in file_paths]
 
-        file_tales = parallel_process(file_paths, make_parser, max_workers=8)
-        for tale in filter(None, file_tales):
-            node_dir.add_children(tale)
+        tasks: List[List[str]] = []
+        batches: List[List[str]] = []
+        used: int = 0
+        for path in file_paths:
+            tokens: int = self.file_tokens(path)
+            if tokens > self.parser_config.small_file_tokens:
+                tasks.append([path])
+                continue
+            if (
+                not batches
+                or used + tokens > self.parser_config.max_tokens_per_batch
+                or len(batches[-1]) >= self.parser_config.max_files_per_batch
+            ):
+                batches.append([])
+                used = 0
+            batches[-1].append(path)
+            used += tokens
+        return tasks + batches
 
-        if (
-            node_dir.children
-            and not self.parser_config.skip_folder_readme
-            and not self.parser_config.dry_run
-        ):
-            # Generate a folder one-line description using the folder's readme as context.
-            folder_data: dict = {
-                "folder_name": self.folder_full_name,
-                "folder_content": node_dir.to_dict(),
-            }
+    def get_duplicates(self) -> List[Tuple[str, str]]:
+        """Duplicate files of the folder and the path of the file they reuse."""
+        duplicates: List[Tuple[str, str]] = []
+        for path in self.get_file_paths():
+            representative = self.representative(os.path.relpath(path, self.root_path))
+            if representative is not None:
+                duplicates.append((path, representative))
+        return duplicates
 
-            folder_summary = generate_summary(
-                self.model,
-                folder_data,
-                summary_type=NodeType.FOLDER,
-                additional_prompt=self.parser_config.prompt,
+    def parse_files(self, paths: List[str]) -> List[Optional[Node]]:
+        if len(paths) == 1:
+            return [self.parse_file(paths[0])]
+        try:
+            return FileBatchParser(file_paths=paths, **self.child_kwargs()).parse()
+        except Exception:
+            self.fail(*paths)
+            return []
+
+    async def aparse_files(self, paths: List[str]) -> List[Optional[Node]]:
+        if len(paths) == 1:
+            return [await self.aparse_file(paths[0])]
+        try:
+            return await FileBatchParser(
+                file_paths=paths, **self.child_kwargs()
+            ).aparse()
+        except Exception:
+            self.fail(*paths)
+            return []
+
+    def parse_file(self, path: str) -> Optional[Node]:
+        try:
+            return FileParser(item_path=path, **self.child_kwargs()).parse()
+        except Exception:
+            self.fail(path)
+            return None
+
+    async def aparse_file(self, path: str) -> Optional[Node]:
+        try:
+            return await FileParser(item_path=path, **self.child_kwargs()).aparse()
+        except Exception:
+            self.fail(path)
+            return None
+
+    def parse_duplicate(
+        self,
+        path: str,
+        representative: str,
+        future: Optional[concurrent.futures.Future],
+    ) -> Optional[Node]:
+        """Parse a duplicate once the future of the task of its representative is done."""
+        try:
+            nodes: List[Optional[Node]] = future.result() if future is not None else []
+            return FileParser(item_path=path, **self.child_kwargs()).parse_duplicate(
+                find_node(nodes, representative)
             )
-            node_dir.description = folder_summary
+        except Exception:
+            self.fail(path)
+            return None
+
+    async def aparse_duplicate(
+        self, path: str, representative: str, task: Optional[asyncio.Task]
+    ) -> Optional[Node]:
+        try:
+            nodes: List[Optional[Node]] = await task if task is not None else []
+            return await FileParser(
+                item_path=path, **self.child_kwargs()
+            ).aparse_duplicate(find_node(nodes, representative))
+        except Exception:
+            self.fail(path)
+            return None
+
+    def build(self, children: Iterable[Optional[Node]]) -> Node:
+        """Create the folder node from its file and subfolder nodes and summarize it."""
+        node_dir = self.make_node(children)
+        folder_data = self.summary_data(node_dir)
+        if folder_data is not None:
+            self.describe(node_dir, folder_data, node_path=self.folder_full_name)
+
+        return node_dir
+
+    def build_from(self, futures: List[concurrent.futures.Future]) -> Optional[Node]:
+        """Build the folder once the futures of its children are done."""
+        try:
+            return self.build(flatten(future.result() for future in futures))
+        except Exception:
+            self.fail(self.item_path)
+            return None
+
+    async def abuild(self, children: Iterable[Optional[Node]]) -> Node:
+        node_dir = self.make_node(children)
+        folder_data = self.summary_data(node_dir)
+        if folder_data is not None:
+            await self.adescribe(node_dir, folder_data, node_path=self.folder_full_name)
 
         return node_dir
 
+    def make_node(self, children: Iterable[Optional[Node]]) -> Node:
+        node_dir = Node(
+            name=self.folder_full_name, description="", node_type=NodeType.FOLDER
+        )
+        # Children finish in any order, sort to keep the folder hash stable.
+        for child in sorted(filter(None, children), key=lambda node: node.name):
+            node_dir.add_children(child)
+
+        return node_dir
+
+    def summary_data(self, node_dir: Node) -> Optional[dict]:
+        if (
+            not node_dir.children
+            or self.parser_config.skip_folder_readme
+            or self.parser_config.dry_run
+        ):
+            return None
+
+        return self.prompt_data(node_dir)
+
+    def prompt_data(self, node_dir: Node) -> dict:
+        # Generate a folder one-line description from the descriptions of its
+        # files and subfolders, the subfolders already summarize their content.
+        return {
+            "folder_name": self.folder_full_name,
+            "folder_content": [child.to_summary_dict() for child in node_dir.children],
+        }
+
 
 class FileParser(Parser):
     def parse(self) -> Optional[Node | None]:
+        file_tale = self.read()
+        if file_tale is None:
+            return None
+
+        file_node, file_data = file_tale
+        if not self.parser_config.dry_run:
+            self.describe(file_node, file_data, node_path=self.node_path())
+
+        return file_node
+
+    async def aparse(self) -> Optional[Node]:
+        file_tale = await asyncio.to_thread(self.read)
+        if file_tale is None:
+            return None
+
+        file_node, file_data = file_tale
+        if not self.parser_config.dry_run:
+            await self.adescribe(file_node, file_data, node_path=self.node_path())
+
+        return file_node
+
+    def parse_duplicate(self, representative: Optional[Node]) -> Optional[Node]:
+        """Parse the file, reusing the description of representative if set."""
+        file_tale = self.read()
+        if file_tale is None:
+            return None
+
+        file_node, file_data = file_tale
+        if not self.parser_config.dry_run and not self.reuse(
+            representative, file_node, file_data
+        ):
+            self.describe(file_node, file_data, node_path=self.node_path())
+
+        return file_node
+
+    async def aparse_duplicate(self, representative: Optional[Node]) -> Optional[Node]:
+        file_tale = await asyncio.to_thread(self.read)
+        if file_tale is None:
+            return None
+
+        file_node, file_data = file_tale
+        if not self.parser_config.dry_run and not self.reuse(
+            representative, file_node, file_data
+        ):
+            await self.adescribe(file_node, file_data, node_path=self.node_path())
+
+        return file_node
+
+    def reuse(
+        self, representative: Optional[Node], file_node: Node, file_data: dict
+    ) -> bool:
+        """
+        Set the description of the duplicate file_node from its representative.
+        While the representative summary is exported, the duplicate waits for
+        it. Returns False when the file has to be summarized on its own.
+        """
+        if representative is None or (
+            not representative.description and self.exporter is None
+        ):
+            return False
+
+        file_node.content_hash = hash_data(file_data)
+        file_node.description = representative.description
+        if file_node.description:
+            stats.count("duplicate summaries reused")
+            self.emit(file_node, self.node_path())
+        return True
+
+    def node_path(self) -> str:
+        return os.path.relpath(
+            os.path.join(self.root_path, self.item_path), self.root_path
+        )
+
+    @stats.timed("read file")
+    def read(self) -> Optional[Tuple[Node, dict]]:
+        """Read the file and return its node along with the data to summarize."""
         file_path: str = self.item_path
         file_name: str = os.path.basename(file_path)
 
-        with open(file_path, "r") as file:
-            code: str = file.read()
+        record: Optional[FileRecord] = self.records.get(self.node_path())
+        if record is not None and record.content is not None:
+            code: str = record.content
+            # Only needed until the prompt data is built
+            record.content = None
+        else:
+            with open(file_path, "r") as file:
+                code: str = file.read()
 
         # # Return empty devtale if the input file is empty.
         if not code or len(code) < self.parser_config.min_code_lenght:
@@ -212,13 +1042,147 @@ class FileParser(Parser):
             "file_name": file_name,
             "file_content": code,
         }
-        if not self.parser_config.dry_run:
-            file_summary = generate_summary(
-                self.model,
-                file_data,
-                summary_type=NodeType.FILE,
-                additional_prompt=self.parser_config.prompt,
+        return file_node, file_data
+
+
+class FileBatchParser(Parser):
+    """
+    Summarize several small files of a folder with a single request that
+    answers with a JSON object of summaries by file name. Files the response
+    does not cover are summarized on their own.
+    """
+
+    def __init__(self, *args, file_paths: List[str], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.file_paths: List[str] = file_paths
+
+    def read(self) -> Tuple[List[Optional[Node]], List[Tuple[FileParser, Node, dict]]]:
+        """
+        Nodes of the files, and the files that still need a summary: those
+        whose description could not be reused from a previous run or the cache.
+        """
+        nodes: List[Optional[Node]] = []
+        pending: List[Tuple[FileParser, Node, dict]] = []
+        for path in self.file_paths:
+            file_parser = FileParser(item_path=path, **self.child_kwargs())
+            file_tale = file_parser.read()
+            if file_tale is None:
+                nodes.append(None)
+                continue
+
+            file_node, file_data = file_tale
+            nodes.append(file_node)
+            if self.parser_config.dry_run:
+                continue
+            if file_parser.reuse_previous(
+                file_node, file_data, node_path=file_parser.node_path()
+            ):
+                self.emit(file_node, file_parser.node_path())
+                continue
+            if self.cache is not None:
+                cached_summary = self.cache.get(
+                    self.cache_key(file_data, NodeType.FILE)
+                )
+                if cached_summary is not None:
+                    file_node.description = cached_summary
+                    self.emit(file_node, file_parser.node_path())
+                    continue
+            pending.append((file_parser, file_node, file_data))
+
+        return nodes, pending
+
+    def batch_tokens(self, files: List[dict]) -> int:
+        if self.limiter is None or not self.limiter.tokens_per_minute:
+            return 0
+        return TokenCounter.count_tokens(
+            SYSTEM_PROMPT + render_batch_prompt(files, self.parser_config.prompt)
+        )
+
+    def apply(
+        self, pending: List[Tuple[FileParser, Node, dict]], response: str
+    ) -> List[Tuple[FileParser, Node, dict]]:
+        """
+        Set the descriptions found in the response.
+
+        Returns:
+            The pending files without a description in the response
+        """
+        summaries: Dict[str, str] = parse_batch_response(
+            response, [file_node.name for _, file_node, _ in pending]
+        )
+        missing: List[Tuple[FileParser, Node, dict]] = []
+        for file_parser, file_node, file_data in pending:
+            summary: Optional[str] = summaries.get(file_node.name)
+            if summary is None:
+                missing.append((file_parser, file_node, file_data))
+                continue
+            file_node.description = summary
+            if self.cache is not None:
+                self.cache.set(self.cache_key(file_data, NodeType.FILE), summary)
+            self.emit(file_node, file_parser.node_path())
+        if missing:
+            logger.debug(
+                f"Batch response without {[node.name for _, node, _ in missing]}, "
+                "summarizing them one by one"
             )
-            file_node.description = file_summary
+        return missing
 
-        return file_node
+    def parse(self) -> List[Optional[Node]]:
+        nodes, pending = self.read()
+        # Exported prompts are cached per file, so they are not batched
+        if len(pending) > 1 and self.exporter is None:
+            files: List[dict] = [file_data for _, _, file_data in pending]
+            try:
+                if self.limiter is not None:
+                    response: str = self.limiter.call(
+                        generate_file_batch,
+                        self.model,
+                        files,
+                        additional_prompt=self.parser_config.prompt,
+                        tokens=self.batch_tokens(files),
+                    )
+                else:
+                    response: str = generate_file_batch(
+                        self.model, files, additional_prompt=self.parser_config.prompt
+                    )
+            except Exception:
+                logger.exception(f"failed batch of {self.file_paths}")
+                response = ""
+            pending = self.apply(pending, response)
+
+        for file_parser, file_node, file_data in pending:
+            file_parser.describe(file_node, file_data, file_parser.node_path())
+        return nodes
+
+    async def aparse(self) -> List[Optional[Node]]:
+        nodes, pending = await asyncio.to_thread(self.read)
+        if len(pending) > 1 and self.exporter is None:
+            files: List[dict] = [file_data for _, _, file_data in pending]
+            try:
+                async with self.semaphores[NodeType.FILE]:
+                    if self.limiter is not None:
+                        response: str = await self.limiter.acall(
+                            agenerate_file_batch,
+                            self.async_model,
+                            files,
+                            additional_prompt=self.parser_config.prompt,
+                            tokens=self.batch_tokens(files),
+                        )
+                    else:
+                        response: str = await agenerate_file_batch(
+                            self.async_model,  # type: ignore
+                            files,
+                            additional_prompt=self.parser_config.prompt,
+                        )
+            except Exception:
+                logger.exception(f"failed batch of {self.file_paths}")
+                response = ""
+            pending = self.apply(pending, response)
+
+        await asyncio.gather(
+            *[
+                file_parser.adescribe(file_node, file_data, file_parser.node_path())
+                for file_parser, file_node, file_data in pending
+            ]
+        )
+        return nodes
@@ -0,0 +1,406 @@
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .cache import hash_data
+from .config import DESCRIPTION_TOKENS, ENGINE_ASYNC
+from .files import FileRecord
+from .node import Node, NodeType
+from .parser import ROOT_FOLDER, FolderParser, ProjectParser
+from .templates import SYSTEM_PROMPT
+from .utils import TokenCounter, render_batch_prompt
+
+# Stands for a description not generated yet, one token per word
+PLACEHOLDER: str = " ".join(["summary"] * DESCRIPTION_TOKENS)
+
+
+@dataclass
+class LevelPlan:
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass
+class Plan:
+    """Requests, tokens and wall time a run would take, see Planner."""
+
+    node: Node
+    levels: Dict[NodeType, LevelPlan] = field(
+        default_factory=lambda: {node_type: LevelPlan() for node_type in NodeType}
+    )
+    files: int = 0
+    # Files whose prompt was rendered with their content
+    exact_files: int = 0
+    # Files that reuse the summary of another one, without requests
+    duplicates: int = 0
+    # Summaries found in the cache, a previous run or the journal
+    reused: int = 0
+    wall_seconds: float = 0.0
+    concurrency: int = 0
+    request_latency: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return sum(level.requests for level in self.levels.values())
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(level.input_tokens for level in self.levels.values())
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(level.output_tokens for level in self.levels.values())
+
+    def __str__(self) -> str:
+        lines: List[str] = [
+            f"{node_type.value}: {level.requests} requests, "
+            f"{level.input_tokens} input tokens, {level.output_tokens} output tokens"
+            for node_type, level in self.levels.items()
+        ]
+        minutes, seconds = divmod(round(self.wall_seconds), 60)
+        lines += [
+            f"Total: {self.requests} requests, {self.input_tokens} input tokens, "
+            f"{self.output_tokens} output tokens "
+            f"({self.exact_files} of {self.files} file prompts from their content"
+            + (f", {self.duplicates} duplicates" if self.duplicates else "")
+            + (f", {self.reused} summaries reused" if self.reused else "")
+            + ")",
+            f"Estimated wall time: {minutes}m {seconds}s with {self.concurrency} "
+            f"concurrent requests of {self.request_latency:g}s",
+        ]
+        return "\n".join(lines)
+
+
+class Planner:
+    """
+    Plan of a run for --dry-run, without reading the selected files again.
+
+    The real prompts are rendered with the templates, SYSTEM_PROMPT and the
+    additional prompt, and counted. File prompts use the content kept by the
+    selection; files counted from the token cache have their content tokens
+    added to the rendered prompt of an empty file instead. Descriptions that
+    do not exist yet are DESCRIPTION_TOKENS long. Folders and the project go
+    through the same map-reduce steps as a real run. Summaries a run would
+    reuse, from the summary cache or the previous nodes of --incremental and
+    --resume, take no request and keep their description.
+
+    Wall time assumes every level waits for the one below, with the requests
+    of a level spread over the concurrency of the engine, and is bounded by
+    the rate limits.
+    """
+
+    def __init__(self, project_parser: ProjectParser) -> None:
+        self.project_parser: ProjectParser = project_parser
+        self.parser_config = project_parser.parser_config
+        self.records: Dict[str, FileRecord] = project_parser.records
+        # Requests by phase, phases run one after the other
+        self.phases: Dict[int, int] = {}
+        # Planned file descriptions by path, for their duplicates
+        self.descriptions: Dict[str, str] = {}
+
+    def add_request(
+        self,
+        plan: Plan,
+        level: NodeType,
+        phase: int,
+        input_tokens: int,
+        outputs: int = 1,
+    ) -> None:
+        plan.levels[level].requests += 1
+        plan.levels[level].input_tokens += input_tokens
+        plan.levels[level].output_tokens += DESCRIPTION_TOKENS * outputs
+        self.phases[phase] = self.phases.get(phase, 0) + 1
+
+    def previous_description(self, path: str, data: dict) -> Optional[str]:
+        """Description reused from the previous nodes, see Parser.reuse_previous."""
+        previous: Optional[Node] = self.project_parser.previous_nodes.get(path)
+        if (
+            previous is not None
+            and previous.description
+            and previous.content_hash == hash_data(data)
+        ):
+            return previous.description
+        return None
+
+    def cached_description(self, data: dict, summary_type: NodeType) -> Optional[str]:
+        parser = self.project_parser
+        if parser.cache is None:
+            return None
+        return parser.cache.get(parser.cache_key(data, summary_type))
+
+    def plan_request(
+        self,
+        plan: Plan,
+        level: NodeType,
+        data: dict,
+        summary_type: NodeType,
+        phase: int,
+    ) -> str:
+        """Request of Parser.summarize for data, none on a cache hit."""
+        description: Optional[str] = self.cached_description(data, summary_type)
+        if description is not None:
+            plan.reused += 1
+            return description
+        self.add_request(
+            plan,
+            level,
+            phase,
+            self.project_parser.prompt_tokens(data, summary_type),
+        )
+        return PLACEHOLDER
+
+    def plan_summary(
+        self,
+        plan: Plan,
+        path: str,
+        name: str,
+        data: dict,
+        summary_type: NodeType,
+        phase: int,
+    ) -> str:
+        """
+        Requests of Parser.describe for the data of the node at path.
+
+        Returns:
+            The description the run would reuse, PLACEHOLDER if it is generated
+        """
+        description: Optional[str] = self.previous_description(path, data)
+        if description is not None:
+            plan.reused += 1
+            return description
+        parser = self.project_parser
+        while (step := parser.map_step(name, data, summary_type)) is not None:
+            data = step.combine(
+                [
+                    self.plan_request(
+                        plan, summary_type, part, step.summary_type, phase
+                    )
+                    for part in step.parts
+                ]
+            )
+        return self.plan_request(plan, summary_type, data, summary_type, phase)
+
+    def file_data(self, path: str) -> Optional[dict]:
+        """File data from the selection, None when only its token count is known."""
+        record: Optional[FileRecord] = self.records.get(path)
+        if record is not None and record.content is None:
+            return None
+        if record is not None:
+            content: Optional[str] = record.content
+        else:
+            with open(os.path.join(self.parser_config.directory, path), "r") as f:
+                content = f.read()
+        return {"file_name": os.path.basename(path), "file_content": content}
+
+    def file_size(self, path: str) -> int:
+        record: Optional[FileRecord] = self.records.get(path)
+        if record is not None:
+            return record.size
+        return os.path.getsize(os.path.join(self.parser_config.directory, path))
+
+    def data_tokens(self, path: str, data: Optional[dict]) -> int:
+        """Tokens of the file data in a prompt."""
+        if data is not None:
+            return TokenCounter.count_tokens(str(data))
+        empty: dict = {"file_name": os.path.basename(path), "file_content": ""}
+        return TokenCounter.count_tokens(str(empty)) + self.records[path].tokens
+
+    def plan_file(self, plan: Plan, path: str, data: Optional[dict]) -> str:
+        """Requests of a file summarized on its own, see plan_summary."""
+        parser = self.project_parser
+        name: str = os.path.basename(path)
+        if data is not None:
+            return self.plan_summary(plan, path, name, data, NodeType.FILE, phase=0)
+
+        # Only the token count is known, chunks are assumed of the same size
+        tokens: int = self.records[path].tokens
+        empty_tokens: int = parser.prompt_tokens(
+            {"file_name": name, "file_content": ""}, NodeType.FILE
+        )
+        max_tokens: int = self.parser_config.max_tokens_per_file
+        if not self.parser_config.chunk_large_files or tokens <= max_tokens:
+            self.add_request(plan, NodeType.FILE, 0, empty_tokens + tokens)
+            return PLACEHOLDER
+
+        chunks: int = math.ceil(tokens / max_tokens)
+        for _ in range(chunks):
+            self.add_request(
+                plan, NodeType.FILE, 0, empty_tokens + math.ceil(tokens / chunks)
+            )
+        combined: dict = {
+            "file_name": name,
+            "file_parts": [{"lines": "1-1", "description": PLACEHOLDER}] * chunks,
+        }
+        self.add_request(
+            plan, NodeType.FILE, 0, parser.prompt_tokens(combined, NodeType.FILE)
+        )
+        return PLACEHOLDER
+
+    def plan_files(self, plan: Plan, paths: List[str]) -> List[Node]:
+        """File nodes of a task of FolderParser.get_file_tasks and their requests."""
+        paths = [
+            path
+            for path in paths
+            if self.file_size(path) >= self.parser_config.min_code_lenght
+        ]
+        plan.files += len(paths)
+        contents: Dict[str, Optional[dict]] = {
+            path: self.file_data(path) for path in paths
+        }
+        plan.exact_files += sum(data is not None for data in contents.values())
+        pending: List[str] = paths
+        if len(paths) > 1:
+            # Reused descriptions are left out of the batch, see FileBatchParser.read
+            pending = []
+            for path in paths:
+                data: Optional[dict] = contents[path]
+                description: Optional[str] = None
+                if data is not None:
+                    description = self.previous_description(
+                        path, data
+                    ) or self.cached_description(data, NodeType.FILE)
+                if description is None:
+                    pending.append(path)
+                else:
+                    plan.reused += 1
+                    self.descriptions[path] = description
+
+        if len(pending) > 1:
+            # A single request for the batch, see FileBatchParser
+            overhead: int = TokenCounter.count_tokens(
+                SYSTEM_PROMPT + render_batch_prompt([], self.parser_config.prompt)
+            )
+            self.add_request(
+                plan,
+                NodeType.FILE,
+                0,
+                overhead
+                + sum(self.data_tokens(path, contents[path]) for path in pending),
+                outputs=len(pending),
+            )
+            self.descriptions.update(dict.fromkeys(pending, PLACEHOLDER))
+        else:
+            for path in pending:
+                self.descriptions[path] = self.plan_file(plan, path, contents[path])
+
+        return [
+            Node(
+                name=os.path.basename(path),
+                description=self.descriptions[path],
+                node_type=NodeType.FILE,
+            )
+            for path in paths
+        ]
+
+    def plan_folder(
+        self, plan: Plan, folder_parser: FolderParser, children: List[Node], phase: int
+    ) -> Node:
+        node: Node = folder_parser.make_node(children)
+        node.description = PLACEHOLDER
+        if node.children and not self.parser_config.skip_folder_readme:
+            node.description = self.plan_summary(
+                plan,
+                folder_parser.folder_full_name,
+                node.name,
+                folder_parser.prompt_data(node),
+                NodeType.FOLDER,
+                phase,
+            )
+        return node
+
+    def plan(self) -> Plan:
+        project_parser = self.project_parser
+        tree: Dict[str, List[str]] = project_parser.get_folder_tree()
+        folder_parsers: Dict[str, FolderParser] = project_parser.get_folder_parsers(
+            tree
+        )
+        depths: Dict[str, int] = {ROOT_FOLDER: 0}
+        for folder_name, subfolders in tree.items():
+            for subfolder in subfolders:
+                depths[subfolder] = depths[folder_name] + 1
+        max_depth: int = max(depths.values())
+
+        plan = Plan(node=project_parser.make_node([]))
+        self.phases = {}
+        self.descriptions = {}
+        # Files first, so duplicates get the description of the file they reuse
+        file_nodes: Dict[str, List[Node]] = {}
+        for folder_name in reversed(tree):
+            file_nodes[folder_name] = []
+            for paths in folder_parsers[folder_name].get_file_tasks():
+                file_nodes[folder_name] += self.plan_files(
+                    plan,
+                    [os.path.relpath(path, project_parser.root_path) for path in paths],
+                )
+
+        folder_nodes: Dict[str, Node] = {}
+        root_children: List[Node] = []
+        # Children before their parents
+        for folder_name in reversed(tree):
+            folder_parser = folder_parsers[folder_name]
+            children: List[Node] = file_nodes[folder_name]
+            for path, representative in folder_parser.get_duplicates():
+                plan.duplicates += 1
+                children.append(
+                    Node(
+                        name=os.path.basename(path),
+                        description=self.descriptions.get(representative, PLACEHOLDER),
+                        node_type=NodeType.FILE,
+                    )
+                )
+            children += [
+                folder_nodes[subfolder]
+                for subfolder in tree[folder_name]
+                if subfolder in folder_nodes
+            ]
+            if folder_name == ROOT_FOLDER:
+                root_children = children
+                continue
+            folder_nodes[folder_name] = self.plan_folder(
+                plan, folder_parser, children, phase=1 + max_depth - depths[folder_name]
+            )
+
+        plan.node = project_parser.make_node(root_children)
+        if plan.node.children and not self.parser_config.skip_folder_readme:
+            self.plan_summary(
+                plan,
+                "",
+                "",
+                project_parser.prompt_data(plan.node),
+                NodeType.REPOSITORY,
+                phase=max_depth + 1,
+            )
+
+        self.estimate_wall_time(plan)
+        for node in plan.node.index().values():
+            node.description = ""
+        return plan
+
+    def estimate_wall_time(self, plan: Plan) -> None:
+        config = self.parser_config
+        file_concurrency: int = config.max_concurrency
+        folder_concurrency: int = config.max_concurrency
+        if config.engine == ENGINE_ASYNC:
+            file_concurrency = config.max_async_file_requests
+            folder_concurrency = config.max_async_folder_requests
+
+        plan.concurrency = file_concurrency
+        plan.request_latency = config.request_latency
+        plan.wall_seconds = sum(
+            math.ceil(
+                requests / (file_concurrency if phase == 0 else folder_concurrency)
+            )
+            * config.request_latency
+            for phase, requests in self.phases.items()
+        )
+        # Never faster than the provider quota allows
+        if config.requests_per_minute:
+            plan.wall_seconds = max(
+                plan.wall_seconds, plan.requests / config.requests_per_minute * 60
+            )
+        if config.tokens_per_minute:
+            plan.wall_seconds = max(
+                plan.wall_seconds, plan.input_tokens / config.tokens_per_minute * 60
+            )
@@ -0,0 +1,168 @@
+import concurrent.futures
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+# Lower values run first. Rollups are preferred over new file summaries so
+# that every folder is summarized as soon as its children are done.
+PRIORITY_ROLLUP: int = 0
+PRIORITY_FILE: int = 1
+
+_STOP = object()
+
+
+class Scheduler:
+    """
+    Repository-wide task scheduler.
+
+    A fixed number of worker threads consume a single priority queue, so the
+    concurrency limit applies to the whole run instead of to each folder.
+    Tasks can depend on other tasks: they are only queued once every future
+    they depend on has finished.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers: int = max(1, max_workers)
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.running: int = 0
+        self.max_running: int = 0
+        # Set when the run is aborted, tasks queued from then on are cancelled
+        self._cancelled: bool = False
+        self._workers: List[threading.Thread] = [
+            threading.Thread(target=self._work, name=f"llm_devtale-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self) -> "Scheduler":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        # On errors and Ctrl-C the queued requests are not sent
+        self.shutdown(cancel_futures=exc_type is not None)
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        after: Sequence[concurrent.futures.Future] = (),
+        priority: int = PRIORITY_FILE,
+    ) -> concurrent.futures.Future:
+        """
+        Schedule fn(*args) once all the futures in after are done.
+
+        The dependencies may fail, fn is responsible of checking their results.
+
+        Returns:
+            A future with the result of fn
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        task = (fn, args, future)
+        if not after:
+            self._enqueue(priority, task)
+            return future
+
+        pending = [len(after)]
+
+        def on_dependency_done(_: concurrent.futures.Future) -> None:
+            with self._lock:
+                pending[0] -= 1
+                ready = pending[0] == 0
+            if ready:
+                self._enqueue(priority, task)
+
+        for dependency in after:
+            dependency.add_done_callback(on_dependency_done)
+
+        return future
+
+    def map(
+        self,
+        fn: Callable[[Any], Any],
+        items: Sequence[Any],
+        priority: int = PRIORITY_ROLLUP,
+    ) -> List[Any]:
+        """
+        Results of fn for every item, in order, from a task of the scheduler.
+
+        The items are queued for the idle workers, and the calling thread runs
+        those no worker has started instead of waiting for them, so it never
+        blocks on queued work and no thread is added. A failed item fails the
+        whole map, the items not started are then cancelled.
+        """
+        futures: List[concurrent.futures.Future] = [
+            self.submit(fn, item, priority=priority) for item in items
+        ]
+        results: Dict[int, Any] = {}
+        try:
+            for i, future in enumerate(futures):
+                if self._cancelled:
+                    raise concurrent.futures.CancelledError()
+                # Still queued, the worker that dequeues it skips it
+                if future.cancel():
+                    results[i] = fn(items[i])
+            return [
+                results[i] if i in results else future.result()
+                for i, future in enumerate(futures)
+            ]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def shutdown(self, cancel_futures: bool = False) -> None:
+        """
+        Wait for the queued tasks and stop the workers. With cancel_futures,
+        the tasks not started yet, and those waiting for their dependencies,
+        are cancelled and only the running ones are waited for.
+        """
+        if cancel_futures:
+            queued: List[Tuple] = []
+            with self._lock:
+                self._cancelled = True
+                while True:
+                    try:
+                        queued.append(self._queue.get_nowait()[2])
+                    except queue.Empty:
+                        break
+            # Outside the lock, their dependents are cancelled from callbacks
+            for _, _, future in queued:
+                future.cancel()
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._counter), _STOP))
+        for worker in self._workers:
+            worker.join()
+
+    def _enqueue(self, priority: int, task: Tuple) -> None:
+        with self._lock:
+            if not self._cancelled:
+                self._queue.put((priority, next(self._counter), task))
+                return
+        task[2].cancel()
+
+    def _work(self) -> None:
+        while True:
+            _, _, task = self._queue.get()
+            if task is _STOP:
+                return
+
+            fn, args, future = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            with self._lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                with self._lock:
+                    self.running -= 1
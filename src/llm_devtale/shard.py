@@ -0,0 +1,59 @@
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .cache import hash_content
+from .config import SHARD_FOLDER
+from .node import Node, NodeType, load_tree
+
+logger = logging.getLogger("llm_devtale")
+
+ROOT_SHARD_KEY: str = "."
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Shard index from 0 and count of a K/N option value, K from 1 to N."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"{value!r} is not K/N, e.g. 2/8") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"{value!r} is not a shard, K goes from 1 to N")
+    return index - 1, count
+
+
+def shard_of(path: str, shard_count: int, shard_by: str = SHARD_FOLDER) -> int:
+    """
+    Shard of a file by relative path. With SHARD_FOLDER every top level
+    folder goes to a single shard, with SHARD_HASH files are spread by path.
+
+    The same on every machine, sha256 instead of hash() which is salted per
+    process.
+    """
+    key: str = path
+    if shard_by == SHARD_FOLDER:
+        parts: List[str] = os.path.normpath(path).split(os.sep)
+        key = parts[0] if len(parts) > 1 else ROOT_SHARD_KEY
+    return int(hash_content(key)[:16], 16) % shard_count
+
+
+def load_shards(paths: List[Path]) -> Dict[str, Node]:
+    """
+    Summarized file nodes of the partial trees written by --shard runs, by
+    path as in Node.index.
+    """
+    nodes: Dict[str, Node] = {}
+    for path in paths:
+        tree = load_tree(path)
+        if tree is None:
+            raise ValueError(f"Shard {path} does not exist")
+        shard_nodes: Dict[str, Node] = {
+            node_path: node
+            for node_path, node in tree.index().items()
+            if node.node_type == NodeType.FILE and node.description
+        }
+        if nodes.keys() & shard_nodes.keys():
+            logger.warning(f"Shard {path} overlaps the previous shards")
+        nodes.update(shard_nodes)
+    return nodes
@@ -0,0 +1,191 @@
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from rich.table import Table
+
+R = TypeVar("R")
+
+PERCENTILES: List[int] = [50, 90, 99]
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    # Added up across threads, so parallel stages can exceed the wall time
+    seconds: float = 0.0
+
+
+@dataclass
+class RequestStats:
+    latencies: List[float] = field(default_factory=list)
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Texts of the requests without usage from the model, see Stats.count_tokens
+    uncounted_inputs: List[str] = field(default_factory=list)
+    uncounted_outputs: List[str] = field(default_factory=list)
+
+
+def percentile(values: List[float], q: int) -> float:
+    """Nearest-rank percentile of values, 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered: List[float] = sorted(values)
+    rank: int = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Stats:
+    """
+    Time spent in every stage of a run, model requests by summary type and
+    counters (cache hits, retries), recorded from any thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Counts the tokens of the requests whose model does not report them,
+        # in a batch when the stats are reported. Unset, they are not counted
+        # and their texts are not kept.
+        self.count_tokens: Optional[Callable[[List[str]], List[int]]] = None
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started: float = time.perf_counter()
+            self.stages: Dict[str, StageStats] = {}
+            self.requests: Dict[str, RequestStats] = {}
+            self.counters: Dict[str, int] = {}
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stage = self.stages.setdefault(name, StageStats())
+            stage.calls += 1
+            stage.seconds += seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def timed(self, name: str) -> Callable[[Callable[..., R]], Callable[..., R]]:
+        """Decorator recording every call of the function as the stage name."""
+
+        def decorator(fn: Callable[..., R]) -> Callable[..., R]:
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> R:
+                with self.stage(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def add_request(
+        self,
+        kind: str,
+        seconds: float,
+        input_tokens: Optional[int],
+        output_tokens: Optional[int],
+        input_text: str = "",
+        output_text: str = "",
+    ) -> None:
+        """Record a request, the texts are counted when its tokens are None."""
+        with self._lock:
+            request = self.requests.setdefault(kind, RequestStats())
+            request.latencies.append(seconds)
+            if input_tokens is not None:
+                request.input_tokens += input_tokens
+            elif self.count_tokens is not None:
+                request.uncounted_inputs.append(input_text)
+            if output_tokens is not None:
+                request.output_tokens += output_tokens
+            elif self.count_tokens is not None:
+                request.uncounted_outputs.append(output_text)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _count_uncounted(self) -> None:
+        if self.count_tokens is None:
+            return
+        for request in self.requests.values():
+            if request.uncounted_inputs:
+                request.input_tokens += sum(self.count_tokens(request.uncounted_inputs))
+                request.uncounted_inputs = []
+            if request.uncounted_outputs:
+                request.output_tokens += sum(
+                    self.count_tokens(request.uncounted_outputs)
+                )
+                request.uncounted_outputs = []
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            self._count_uncounted()
+            return {
+                "wall_seconds": round(time.perf_counter() - self.started, 3),
+                "stages": {
+                    name: {"calls": stage.calls, "seconds": round(stage.seconds, 3)}
+                    for name, stage in self.stages.items()
+                },
+                "requests": {
+                    kind: {
+                        "count": len(request.latencies),
+                        "input_tokens": request.input_tokens,
+                        "output_tokens": request.output_tokens,
+                        **{
+                            f"p{q}_seconds": round(percentile(request.latencies, q), 3)
+                            for q in PERCENTILES
+                        },
+                        "max_seconds": round(max(request.latencies, default=0.0), 3),
+                    }
+                    for kind, request in self.requests.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def to_tables(self) -> List[Table]:
+        report: Dict[str, Any] = self.to_json()
+
+        stages = Table(title=f"Stages ({report['wall_seconds']:.2f}s wall time)")
+        stages.add_column("Stage")
+        stages.add_column("Calls", justify="right")
+        stages.add_column("Seconds", justify="right")
+        for name, stage in report["stages"].items():
+            stages.add_row(name, str(stage["calls"]), f"{stage['seconds']:.2f}")
+
+        requests = Table(title="Model requests")
+        requests.add_column("Type")
+        for column in ["Count", "Input tokens", "Output tokens"] + [
+            f"p{q}" for q in PERCENTILES
+        ]:
+            requests.add_column(column, justify="right")
+        requests.add_column("Max", justify="right")
+        for kind, request in report["requests"].items():
+            requests.add_row(
+                kind,
+                str(request["count"]),
+                str(request["input_tokens"]),
+                str(request["output_tokens"]),
+                *[f"{request[f'p{q}_seconds']:.2f}s" for q in PERCENTILES],
+                f"{request['max_seconds']:.2f}s",
+            )
+
+        counters = Table(title="Counters")
+        counters.add_column("Counter")
+        counters.add_column("Value", justify="right")
+        for name, value in report["counters"].items():
+            counters.add_row(name, str(value))
+
+        return [stages, requests, counters]
+
+
+# Shared by every module of the run, see --stats
+stats = Stats()
@@ -0,0 +1,64 @@
+import json
+import threading
+from typing import Callable, Optional, TextIO
+
+from .config import STREAM_JSONL, STREAM_MARKDOWN
+from .node import Node, NodeType
+
+
+class NodeStream:
+    """
+    Writes every summary as soon as it is generated, as a JSONL event or a
+    Markdown section, and flushes it so a pipeline can consume it right away.
+
+    Used as the on_node callback of the parsers, from any thread.
+    """
+
+    def __init__(self, out: TextIO, stream_format: str = STREAM_JSONL) -> None:
+        if stream_format not in (STREAM_JSONL, STREAM_MARKDOWN):
+            raise ValueError(f"Unknown stream format {stream_format}")
+        self.out: TextIO = out
+        self.stream_format: str = stream_format
+        self.count: int = 0
+        self._lock = threading.Lock()
+
+    def format(self, node_path: str, node: Node) -> str:
+        if self.stream_format == STREAM_JSONL:
+            event = {
+                "event": "summary",
+                "path": node_path or ".",
+                "name": node.name,
+                "node_type": node.node_type.value,
+                "description": node.description,
+            }
+            return json.dumps(event) + "\n"
+
+        heading: str = "#" if node.node_type == NodeType.REPOSITORY else "##"
+        return (
+            f"{heading} {node_path or node.name} ({node.node_type.value})\n\n"
+            f"{node.description.strip()}\n\n"
+        )
+
+    def __call__(self, node_path: str, node: Node) -> None:
+        text: str = self.format(node_path, node)
+        with self._lock:
+            self.out.write(text)
+            self.out.flush()
+            self.count += 1
+
+
+def fan_out(
+    *callbacks: Optional[Callable[[str, Node], None]],
+) -> Optional[Callable[[str, Node], None]]:
+    """Single on_node callback calling every callback that is not None."""
+    active = [callback for callback in callbacks if callback is not None]
+    if not active:
+        return None
+    if len(active) == 1:
+        return active[0]
+
+    def on_node(node_path: str, node: Node) -> None:
+        for callback in active:
+            callback(node_path, node)
+
+    return on_node
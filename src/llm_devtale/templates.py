@@ -11,6 +11,20 @@ Ensure your final summary is no longer than three sentences.
 """
 
 
+FILE_BATCH_TEMPLATE = """
+Using the data of the following files enclosed within the <<< >>> delimeters \
+write, for every file, a top-file level concise summary that effectively captures \
+the overall purpose and functionality of the file.
+
+files data: <<< {data} >>>
+
+Ensure every summary is no longer than three sentences. Answer only with a JSON \
+object whose keys are the file_name of every file and whose values are their summaries.
+
+{additional_prompt}
+"""
+
+
 ROOT_LEVEL_TEMPLATE = """
 Provide a concise summary that describes the primary \
 purpose of the code, utilizing all the contextual details \
@@ -24,7 +38,7 @@ Repository data: <<< {data} >>>
 
 FOLDER_SHORT_DESCRIPTION_TEMPLATE = """
 Generate a one-line description of the folder's purpose based on \
-the summaries of the files contained in the folder enclosed within the <<< >>> delimiters
+the summaries of the files and subfolders contained in the folder enclosed within the <<< >>> delimiters
 
 File summaries: <<< {data} >>>
 
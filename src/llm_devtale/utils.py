@@ -1,14 +1,24 @@
 import concurrent.futures
+import json
 import logging
 import os
-from typing import Callable, Dict, Iterable, List, TypeVar
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
 
 import llm
 import tiktoken
+from tiktoken.load import load_tiktoken_bpe
 
 from .node import NodeType
-from .templates import (FILE_TEMPLATE, FOLDER_SHORT_DESCRIPTION_TEMPLATE,
-                        ROOT_LEVEL_TEMPLATE, SYSTEM_PROMPT)
+from .stats import stats
+from .templates import (
+    FILE_BATCH_TEMPLATE,
+    FILE_TEMPLATE,
+    FOLDER_SHORT_DESCRIPTION_TEMPLATE,
+    ROOT_LEVEL_TEMPLATE,
+    SYSTEM_PROMPT,
+)
 
 # Configure default logger
 logger = logging.getLogger("llm_devtale")
@@ -23,10 +33,122 @@ prompts: Dict[NodeType, str] = {
 }
 
 
+# Kind of the requests of generate_file_batch in the stats
+BATCH_REQUEST: str = "file batch"
+
+ENCODING_NAME: str = "cl100k_base"
+# Definition of cl100k_base, to build the encoding from a local BPE file
+# without tiktoken downloading it
+CL100K_PAT_STR: str = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+CL100K_SPECIAL_TOKENS: Dict[str, int] = {
+    "<|endoftext|>": 100257,
+    "<|fim_prefix|>": 100258,
+    "<|fim_middle|>": 100259,
+    "<|fim_suffix|>": 100260,
+    "<|endofprompt|>": 100276,
+}
+# Environment variable with the path of the BPE file
+TOKENIZER_FILE_ENV: str = "LLM_DEVTALE_TOKENIZER_FILE"
+# Estimate used when the encoding is not available
+CHARS_PER_TOKEN: int = 4
+# Encoding id of the counts estimated with CHARS_PER_TOKEN
+ESTIMATE_ENCODING: str = "estimate"
+
+
+def load_encoding(bpe_file: Optional[str] = None) -> Optional[tiktoken.Encoding]:
+    """
+    Load the cl100k_base encoding, from bpe_file if set, otherwise from the
+    tiktoken cache (TIKTOKEN_CACHE_DIR), downloading it the first time.
+
+    Returns:
+        The encoding, None if it can not be downloaded
+    """
+    if bpe_file:
+        return tiktoken.Encoding(
+            name=ENCODING_NAME,
+            pat_str=CL100K_PAT_STR,
+            mergeable_ranks=load_tiktoken_bpe(bpe_file),
+            special_tokens=CL100K_SPECIAL_TOKENS,
+        )
+
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        logger.warning(
+            f"Could not load the {ENCODING_NAME} tokenizer ({e!r}), token counts "
+            f"are estimated. Set {TOKENIZER_FILE_ENV} or --tokenizer-file to a "
+            "local copy of the BPE file"
+        )
+        return None
+
+
 class TokenCounter:
+    """
+    Token counts with an encoding loaded once per process and shared by all
+    threads.
+    """
+
+    bpe_file: Optional[str] = None
+    num_threads: int = 8
+    _encoding: Optional[tiktoken.Encoding] = None
+    _loaded: bool = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(
+        cls,
+        bpe_file: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        estimate: bool = False,
+    ) -> None:
+        """
+        Set where the encoding is loaded from, discarding the loaded one. With
+        estimate, it is not loaded and counts are estimated.
+        """
+        with cls._lock:
+            cls.bpe_file = bpe_file
+            if num_threads:
+                cls.num_threads = num_threads
+            cls._encoding = None
+            cls._loaded = estimate
+
+    @classmethod
+    def get_encoding(cls) -> Optional[tiktoken.Encoding]:
+        if not cls._loaded:
+            with cls._lock:
+                if not cls._loaded:
+                    cls._encoding = load_encoding(
+                        cls.bpe_file or os.environ.get(TOKENIZER_FILE_ENV)
+                    )
+                    cls._loaded = True
+        return cls._encoding
+
+    @classmethod
+    def encoding_id(cls) -> str:
+        """Identifies the counts produced, to key persisted token counts."""
+        encoding = cls.get_encoding()
+        return encoding.name if encoding is not None else ESTIMATE_ENCODING
+
     @staticmethod
     def count_tokens(text: str) -> int:
-        return len(tiktoken.get_encoding("cl100k_base").encode(text))
+        encoding = TokenCounter.get_encoding()
+        if encoding is None:
+            return len(text) // CHARS_PER_TOKEN
+        # Special tokens in the text are counted as plain text
+        return len(encoding.encode_ordinary(text))
+
+    @classmethod
+    def count_tokens_batch(cls, texts: List[str]) -> List[int]:
+        """Count the tokens of many texts, encoded in parallel by tiktoken."""
+        encoding = cls.get_encoding()
+        if encoding is None:
+            return [len(text) // CHARS_PER_TOKEN for text in texts]
+        return [
+            len(tokens)
+            for tokens in encoding.encode_ordinary_batch(
+                texts, num_threads=cls.num_threads
+            )
+        ]
 
 
 def get_prompt(summary_type: NodeType) -> str:
@@ -37,16 +159,110 @@ def get_prompt(summary_type: NodeType) -> str:
     return prompt
 
 
+def render_prompt(
+    data: dict, summary_type: NodeType, additional_prompt: str = ""
+) -> str:
+    return get_prompt(summary_type).format(
+        data=data, additional_prompt=additional_prompt
+    )
+
+
+def record_request(kind: str, started: float, response, prompt: str, text: str) -> None:
+    """
+    Latency and tokens of a request. When the model does not report its
+    tokens, the texts are counted by the stats report, see Stats.count_tokens.
+    """
+    input_tokens = getattr(response, "input_tokens", None)
+    output_tokens = getattr(response, "output_tokens", None)
+    stats.add_request(
+        kind,
+        time.perf_counter() - started,
+        input_tokens if isinstance(input_tokens, int) else None,
+        output_tokens if isinstance(output_tokens, int) else None,
+        input_text=SYSTEM_PROMPT + prompt,
+        output_text=text,
+    )
+
+
 def generate_summary(
     llm_model: llm.Model,
     data: dict,
     summary_type: NodeType,
     additional_prompt: str = "",
 ) -> str:
-    prompt: str = get_prompt(summary_type).format(
-        data=data, additional_prompt=additional_prompt
-    )
-    return llm_model.prompt(prompt, system=SYSTEM_PROMPT).text()
+    prompt: str = render_prompt(data, summary_type, additional_prompt)
+    started: float = time.perf_counter()
+    response = llm_model.prompt(prompt, system=SYSTEM_PROMPT)
+    text: str = response.text()
+    record_request(summary_type.value, started, response, prompt, text)
+    return text
+
+
+async def agenerate_summary(
+    llm_model: llm.AsyncModel,
+    data: dict,
+    summary_type: NodeType,
+    additional_prompt: str = "",
+) -> str:
+    prompt: str = render_prompt(data, summary_type, additional_prompt)
+    started: float = time.perf_counter()
+    response = llm_model.prompt(prompt, system=SYSTEM_PROMPT)
+    text: str = await response.text()
+    record_request(summary_type.value, started, response, prompt, text)
+    return text
+
+
+def render_batch_prompt(files: List[dict], additional_prompt: str = "") -> str:
+    return FILE_BATCH_TEMPLATE.format(data=files, additional_prompt=additional_prompt)
+
+
+def generate_file_batch(
+    llm_model: llm.Model, files: List[dict], additional_prompt: str = ""
+) -> str:
+    prompt: str = render_batch_prompt(files, additional_prompt)
+    started: float = time.perf_counter()
+    response = llm_model.prompt(prompt, system=SYSTEM_PROMPT)
+    text: str = response.text()
+    record_request(BATCH_REQUEST, started, response, prompt, text)
+    return text
+
+
+async def agenerate_file_batch(
+    llm_model: llm.AsyncModel, files: List[dict], additional_prompt: str = ""
+) -> str:
+    prompt: str = render_batch_prompt(files, additional_prompt)
+    started: float = time.perf_counter()
+    response = llm_model.prompt(prompt, system=SYSTEM_PROMPT)
+    text: str = await response.text()
+    record_request(BATCH_REQUEST, started, response, prompt, text)
+    return text
+
+
+def parse_batch_response(response: str, names: Iterable[str]) -> Dict[str, str]:
+    """
+    Summaries by file name from the JSON object answered to a batch prompt.
+    Code fences or text around the object are ignored, and so are unknown
+    names and empty summaries.
+
+    Returns:
+        The summaries found, empty if the response is not valid JSON
+    """
+    start: int = response.find("{")
+    end: int = response.rfind("}")
+    if start == -1 or end < start:
+        return {}
+    try:
+        summaries = json.loads(response[start : end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(summaries, dict):
+        return {}
+
+    return {
+        name: summaries[name].strip()
+        for name in names
+        if isinstance(summaries.get(name), str) and summaries[name].strip()
+    }
 
 
 def get_llm_model(model_name: str) -> llm.Model:
@@ -56,6 +272,17 @@ def get_llm_model(model_name: str) -> llm.Model:
     return llm.get_model(model_name)
 
 
+def get_async_llm_model(model_name: str) -> Optional[llm.AsyncModel]:
+    """Async implementation of the model, None if the model has none."""
+    if not model_name:
+        model_name = llm.get_default_model()
+
+    try:
+        return llm.get_async_model(model_name)
+    except llm.UnknownModelError:
+        return None
+
+
 def parallel_process(
     items: Iterable[T], process_func: Callable[[T], R], max_workers: int = 0
 ) -> List[R]:
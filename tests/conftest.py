@@ -1,7 +1,59 @@
 from pathlib import Path
+from typing import Dict, List, Optional
 
 import pytest
+from llm_devtale.config import ParserConfig
 from llm_devtale.files import FileRepo
+from llm_devtale.parser import ProjectParser
+
+# Files of the default project of make_project
+PROJECT_FILES: Dict[str, str] = {
+    "src/app/main.py": "def main(): pass",
+    "src/app/utils.py": "def util(): pass",
+    "lib/core.py": "def core(): pass",
+}
+
+
+class Project:
+    """
+    Files written to a temporary directory, parsed without a model: the tests
+    patch generate_summary and the other llm_devtale.parser requests.
+    """
+
+    def __init__(self, directory: Path, files: Dict[str, str], **config) -> None:
+        self.directory: Path = directory
+        self.files: Dict[str, str] = dict(files)
+        self.write(files)
+        config.setdefault("min_code_lenght", 1)
+        self.parser_config = ParserConfig(directory=directory, **config)
+
+    def write(self, files: Dict[str, str]) -> None:
+        for file_path, content in files.items():
+            path = self.directory / file_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content)
+
+    def parser(
+        self, valid_files: Optional[List[str]] = None, **kwargs
+    ) -> ProjectParser:
+        return ProjectParser(
+            parser_config=self.parser_config,
+            model=None,  # type: ignore
+            valid_files=list(self.files) if valid_files is None else valid_files,
+            **kwargs,
+        )
+
+
+@pytest.fixture
+def make_project(tmp_path):
+    """Project of files, PROJECT_FILES by default, in tmp_path or a subfolder."""
+
+    def make(
+        files: Dict[str, str] = PROJECT_FILES, folder: str = "", **config
+    ) -> Project:
+        return Project(tmp_path / folder if folder else tmp_path, files, **config)
+
+    return make
 
 
 @pytest.fixture
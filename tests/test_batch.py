@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+from llm_devtale.batch import PromptExporter, import_results
+from llm_devtale.cache import SummaryCache
+from llm_devtale.node import NodeType
+from llm_devtale.templates import SYSTEM_PROMPT
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def batch_backend(prompts_path, results_path):
+    """Stand-in for the batch endpoint, answers every exported prompt."""
+    with open(results_path, "w") as f:
+        for prompt in read_jsonl(prompts_path):
+            summary = f"{prompt['summary_type']} summary"
+            f.write(json.dumps({"id": prompt["id"], "summary": summary}) + "\n")
+
+
+def test_export(tmp_path):
+    exporter = PromptExporter(tmp_path / "prompts.jsonl", model_id="model")
+    exporter.add("a", NodeType.FILE, "prompt a")
+    exporter.add("b", NodeType.FOLDER, "prompt b")
+    exporter.add("a", NodeType.FILE, "prompt a")
+    exporter.close()
+
+    assert read_jsonl(tmp_path / "prompts.jsonl") == [
+        {
+            "id": "a",
+            "model": "model",
+            "summary_type": "file",
+            "system": SYSTEM_PROMPT,
+            "prompt": "prompt a",
+        },
+        {
+            "id": "b",
+            "model": "model",
+            "summary_type": "folder",
+            "system": SYSTEM_PROMPT,
+            "prompt": "prompt b",
+        },
+    ]
+
+
+def test_failed_export_is_not_kept(tmp_path):
+    exporter = PromptExporter(tmp_path / "prompts.jsonl")
+    exporter.add("a", NodeType.FILE, "prompt a")
+    assert exporter.partial_path.exists()
+
+    exporter.close(complete=False)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_export_nothing(tmp_path):
+    PromptExporter(tmp_path / "prompts.jsonl").close()
+
+    assert not (tmp_path / "prompts.jsonl").exists()
+
+
+def test_import_results(tmp_path):
+    results_path = tmp_path / "results.jsonl"
+    results_path.write_text(
+        '{"id": "a", "summary": "A"}\n\n{"id": "b", "summary": "B"}\n'
+    )
+    cache = SummaryCache(tmp_path / "summaries.db")
+
+    assert import_results(results_path, cache) == 2
+    assert cache.get("a") == "A"
+    assert cache.get("b") == "B"
+
+
+def test_import_invalid_results(tmp_path):
+    results_path = tmp_path / "results.jsonl"
+    results_path.write_text('{"id": "a"}\n')
+
+    with pytest.raises(ValueError, match="results.jsonl:1"):
+        import_results(results_path, SummaryCache(tmp_path / "summaries.db"))
+
+
+@pytest.mark.parametrize("engine", ["thread", "async"])
+def test_phases(mocker, tmp_path, make_project, engine):
+    project = make_project(folder="project")
+    cache = SummaryCache(tmp_path / "summaries.db")
+    mock_generate = mocker.patch("llm_devtale.parser.generate_summary")
+    mock_agenerate = mocker.patch("llm_devtale.parser.agenerate_summary")
+
+    def run(phase):
+        exporter = PromptExporter(tmp_path / f"prompts{phase}.jsonl")
+        project_parser = project.parser(cache=cache, exporter=exporter)
+        if engine == "async":
+            project_parser.semaphores = {
+                NodeType.FILE: asyncio.Semaphore(2),
+                NodeType.FOLDER: asyncio.Semaphore(2),
+                NodeType.REPOSITORY: asyncio.Semaphore(1),
+            }
+            node = asyncio.run(project_parser.aparse())
+        else:
+            node = project_parser.parse()
+        exporter.close()
+        return node, exporter.exported
+
+    exported_types = []
+    phase = 0
+    node, exported = run(phase)
+    while exported:
+        prompts = read_jsonl(tmp_path / f"prompts{phase}.jsonl")
+        exported_types.append(sorted({prompt["summary_type"] for prompt in prompts}))
+        batch_backend(
+            tmp_path / f"prompts{phase}.jsonl", tmp_path / f"results{phase}.jsonl"
+        )
+        import_results(tmp_path / f"results{phase}.jsonl", cache)
+        phase += 1
+        node, exported = run(phase)
+
+    # Files, then folders, then the project
+    assert exported_types == [["file"], ["folder"], ["project"]]
+    mock_generate.assert_not_called()
+    mock_agenerate.assert_not_called()
+    assert node.description == "project summary"
+    assert [child.description for child in node.children] == [
+        "folder summary",
+        "folder summary",
+    ]
+    assert all(
+        child.description == "file summary" for child in node.children[1].children
+    )
@@ -0,0 +1,92 @@
+import time
+
+from llm_devtale.cache import SummaryCache, TokenCache
+from llm_devtale.utils import parallel_process
+
+
+def test_get_set(tmp_path):
+    cache = SummaryCache(tmp_path / "summaries.db")
+    key = SummaryCache.make_key("model", "template", "", {"file_content": "a"})
+
+    assert cache.get(key) is None
+    cache.set(key, "summary")
+    assert cache.get(key) == "summary"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_persists_between_instances(tmp_path):
+    key = SummaryCache.make_key("model", "template", "", {"file_content": "a"})
+    SummaryCache(tmp_path / "summaries.db").set(key, "summary")
+
+    assert SummaryCache(tmp_path / "summaries.db").get(key) == "summary"
+
+
+def test_make_key():
+    data = {"file_name": "a.py", "file_content": "print(1)"}
+    key = SummaryCache.make_key("model", "template", "", data)
+
+    assert key == SummaryCache.make_key("model", "template", "", dict(data))
+    assert key != SummaryCache.make_key("other-model", "template", "", data)
+    assert key != SummaryCache.make_key("model", "other template", "", data)
+    assert key != SummaryCache.make_key("model", "template", "uppercase", data)
+    assert key != SummaryCache.make_key(
+        "model", "template", "", {"file_name": "a.py", "file_content": "print(2)"}
+    )
+
+
+def test_evict_max_entries(tmp_path):
+    cache = SummaryCache(tmp_path / "summaries.db", max_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.set(key, key)
+        time.sleep(0.01)
+    cache.get("a")
+
+    assert cache.evict() == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == "a"
+    assert cache.get("c") == "c"
+
+
+def test_evict_max_age(tmp_path):
+    cache = SummaryCache(tmp_path / "summaries.db", max_age_days=0)
+    cache.set("a", "a")
+
+    assert cache.get("a") is None
+    assert cache.evict() == 1
+    assert len(cache) == 0
+
+
+def test_threads(tmp_path):
+    cache = SummaryCache(tmp_path / "summaries.db")
+
+    def roundtrip(i):
+        cache.set(str(i), f"summary {i}")
+        return cache.get(str(i))
+
+    results = parallel_process(range(100), roundtrip, max_workers=8)
+    assert sorted(results) == sorted(f"summary {i}" for i in range(100))
+
+
+def test_token_cache(tmp_path):
+    cache = TokenCache(tmp_path / "tokens.db")
+    cache.set_many({"blob1": 10, "blob2": 20}, "cl100k_base")
+
+    assert cache.get_many(["blob1", "blob2", "blob3"], "cl100k_base") == {
+        "blob1": 10,
+        "blob2": 20,
+    }
+    assert cache.get_many(["blob1"], "estimate") == {}
+    assert cache.hits == 2
+    assert cache.misses == 2
+    assert TokenCache(tmp_path / "tokens.db").get_many(["blob2"], "cl100k_base") == {
+        "blob2": 20
+    }
+
+
+def test_token_cache_large_lookup(tmp_path):
+    cache = TokenCache(tmp_path / "tokens.db")
+    counts = {f"blob{i}": i for i in range(1234)}
+    cache.set_many(counts, "cl100k_base")
+
+    assert cache.get_many(counts, "cl100k_base") == counts
@@ -0,0 +1,88 @@
+import pytest
+from llm_devtale.chunker import boundaries, split_code
+
+PYTHON_CODE = '''import os
+
+
+def a():
+    return 1
+
+
+@decorator
+def b():
+    """
+Docstring at column 0
+    """
+    return 2
+
+
+class C:
+    def method(self):
+        pass
+'''
+
+GO_CODE = """package main
+
+func a() {
+    return
+}
+
+func b() {
+    return
+}
+"""
+
+
+@pytest.fixture(autouse=True)
+def characters_as_tokens(mocker):
+    mocker.patch(
+        "llm_devtale.chunker.TokenCounter.count_tokens_batch",
+        side_effect=lambda texts: [len(text) for text in texts],
+    )
+
+
+def test_python_boundaries():
+    lines = PYTHON_CODE.splitlines(keepends=True)
+    assert boundaries(lines, "a.py") == [0, 3, 7, 15]
+
+
+def test_python_syntax_error_uses_indentation():
+    lines = ["def a(:\n", "    pass\n", "def b():\n"]
+    assert boundaries(lines, "a.py") == [0, 2]
+
+
+def test_indentation_boundaries():
+    lines = GO_CODE.splitlines(keepends=True)
+    assert boundaries(lines, "main.go") == [0, 2, 6]
+
+
+def test_split_on_definitions():
+    chunks = split_code(PYTHON_CODE, "a.py", max_tokens=80)
+
+    assert [(chunk.start_line, chunk.end_line) for chunk in chunks] == [
+        (1, 7),
+        (8, 15),
+        (16, 18),
+    ]
+    assert "".join(chunk.content for chunk in chunks) == PYTHON_CODE
+    assert all(len(chunk.content) <= 80 for chunk in chunks)
+
+
+def test_small_definitions_are_packed():
+    chunks = split_code(GO_CODE, "main.go", max_tokens=1000)
+
+    assert len(chunks) == 1
+    assert chunks[0].content == GO_CODE
+
+
+def test_large_definition_is_split_by_lines():
+    code = "def a():\n" + "    x = 1\n" * 20
+    chunks = split_code(code, "a.py", max_tokens=50)
+
+    assert len(chunks) > 1
+    assert "".join(chunk.content for chunk in chunks) == code
+    assert all(len(chunk.content) <= 50 for chunk in chunks)
+
+
+def test_empty_code():
+    assert split_code("", "a.py", max_tokens=10) == []
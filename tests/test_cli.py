@@ -1,3 +1,5 @@
+import builtins
+
 from click.testing import CliRunner
 from llm.cli import cli
 
@@ -7,3 +9,27 @@ def test_devtale_help():
     result = runner.invoke(cli, ["devtale", "--help"])
     assert result.exit_code == 0
     assert "Usage: cli devtale" in result.output
+
+
+def test_stream_output_is_closed_when_the_run_fails(mocker, tmp_path):
+    mocker.patch("llm_devtale.cli.select_files", return_value=([], 0))
+    mocker.patch("llm_devtale.cli.get_llm_model")
+    mocker.patch("llm_devtale.cli.Planner", side_effect=RuntimeError("failed"))
+    opened = []
+    real_open = builtins.open
+
+    def record_open(*args, **kwargs):
+        opened.append(real_open(*args, **kwargs))
+        return opened[-1]
+
+    mocker.patch("builtins.open", side_effect=record_open)
+    output = tmp_path / "summaries.jsonl"
+
+    result = CliRunner().invoke(
+        cli,
+        ["devtale", str(tmp_path), "--dry-run", "--no-cache"]
+        + ["--stream", "jsonl", "--output", str(output)],
+    )
+
+    assert result.exit_code != 0
+    assert [file.closed for file in opened if file.name == str(output)] == [True]
@@ -0,0 +1,122 @@
+import asyncio
+import random
+
+import pytest
+from llm_devtale.dedup import find_duplicates, minhash, shingle_hashes, similarity
+from llm_devtale.files import FileRepo, FileSelector
+from llm_devtale.node import NodeType
+
+WORDS = ["def", "return", "value", "self", "node", "path", "cache", "token", "x"]
+
+
+def make_code(seed, words=400):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 50)) for _ in range(words))
+
+
+def edit(content, changes, seed=0):
+    rng = random.Random(seed)
+    words = content.split()
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = "changed"
+    return " ".join(words)
+
+
+def test_similarity():
+    code = make_code(0)
+    signature = minhash(shingle_hashes(code))
+
+    assert similarity(signature, minhash(shingle_hashes(code))) == 1
+    assert similarity(signature, minhash(shingle_hashes(edit(code, 5)))) > 0.7
+    assert similarity(signature, minhash(shingle_hashes(make_code(1)))) < 0.1
+    assert minhash(shingle_hashes("")) is None
+
+
+def test_find_duplicates():
+    code = make_code(0)
+    contents = [code, make_code(1), code, edit(code, 2), make_code(2), ""]
+    keys = ["a", "b", "a", "c", "d", "e"]
+
+    assert find_duplicates(keys, contents.__getitem__, threshold=1) == {2: 0}
+    assert find_duplicates(keys, contents.__getitem__, threshold=0.8) == {
+        2: 0,
+        3: 0,
+    }
+
+
+def test_mark_duplicates(make_project):
+    code = make_code(0)
+    project = make_project({"a.py": code, "vendor_a.py": code, "b.py": edit(code, 2)})
+    file_selector = FileSelector(
+        FileRepo(project.directory, {"a.py": 3, "vendor_a.py": 2, "b.py": 1}),
+        allowed_extensions=[".py"],
+        dedup_threshold=0.8,
+    )
+
+    records, _ = file_selector.select_files(10**6)
+
+    assert [record.duplicate_of for record in records] == [None, "a.py", "a.py"]
+    assert file_selector.budget_report.duplicates == 2
+
+
+@pytest.fixture
+def project(make_project):
+    code = make_code(0)
+    project = make_project(
+        {
+            "src/a.py": code,
+            "src/b.py": make_code(1),
+            "vendor/lib/a.py": code,
+            "vendor/lib/c.py": edit(code, 2),
+        },
+        use_cache=False,
+    )
+    effort = {path: len(project.files) - i for i, path in enumerate(project.files)}
+    records, _ = FileSelector(
+        FileRepo(project.directory, effort),
+        allowed_extensions=[".py"],
+        dedup_threshold=0.8,
+    ).select_files(10**6)
+    return project.parser(
+        [record.path for record in records],
+        records={record.path: record for record in records},
+    )
+
+
+def summarize(data, summary_type, **kwargs):
+    return data.get("file_name", summary_type.value) + " summary"
+
+
+def test_duplicates_reuse_the_summary(mocker, project):
+    mock_generate = mocker.patch(
+        "llm_devtale.parser.generate_summary",
+        side_effect=lambda _, *a, **k: summarize(*a, **k),
+    )
+
+    node = project.parse()
+
+    files = [
+        call.args[1]["file_name"]
+        for call in mock_generate.call_args_list
+        if call.kwargs["summary_type"] == NodeType.FILE
+    ]
+    assert sorted(files) == ["a.py", "b.py"]
+    nodes = node.index()
+    assert nodes["vendor/lib/a.py"].description == "a.py summary"
+    assert nodes["vendor/lib/c.py"].description == "a.py summary"
+    assert nodes["vendor/lib"].description == "folder summary"
+
+
+def test_duplicates_reuse_the_summary_async(mocker, project):
+    async def agenerate(_, *args, **kwargs):
+        return summarize(*args, **kwargs)
+
+    mock_generate = mocker.patch(
+        "llm_devtale.parser.agenerate_summary", side_effect=agenerate
+    )
+    project.async_model = object()  # type: ignore
+
+    node = asyncio.run(project.aparse())
+
+    assert mock_generate.call_count == 2 + 3
+    assert node.index()["vendor/lib/c.py"].description == "a.py summary"
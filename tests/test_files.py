@@ -1,13 +1,21 @@
+from pathlib import Path
 
-from llm_devtale.files import FileRepo, FileSelector
+import pytest
+from llm_devtale import files
+from llm_devtale.cache import TokenCache, hash_content
+from llm_devtale.files import FileRecord, FileRepo, FileSelector
+from llm_devtale.utils import ESTIMATE_ENCODING, TokenCounter
 
 
 class TestGetFilesByToken:
     def test_get_files_by_token(self, mocker, test_repository):
         file_selector = FileSelector(test_repository)
         file_selector.allowed_extensions = [".py"]
-        mocker.patch("builtins.open")
-        mocker.patch("llm_devtale.files.TokenCounter.count_tokens", return_value=100)
+        mocker.patch("builtins.open", mocker.mock_open(read_data="code"))
+        mocker.patch(
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [100] * len(texts),
+        )
 
         token_count = 0
         hot_files, total_token_count = file_selector.get_files_by_token(token_count)
@@ -27,8 +35,11 @@ class TestGetFilesByToken:
     def test_get_files_by_token_0_tokens(self, mocker, test_repository):
         file_selector = FileSelector(test_repository)
         file_selector.allowed_extensions = [".py"]
-        mocker.patch("builtins.open")
-        mocker.patch("llm_devtale.files.FileSelector.count_tokens", return_value=0)
+        mocker.patch("builtins.open", mocker.mock_open(read_data="code"))
+        mocker.patch(
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [0] * len(texts),
+        )
         token_count = 10000
         hot_files, total_token_count = file_selector.get_files_by_token(token_count)
         assert hot_files == []
@@ -40,10 +51,10 @@ class TestGetFilesByToken:
 
         max_tokens_per_file = 20000
 
-        mocker.patch("builtins.open")
+        mocker.patch("builtins.open", mocker.mock_open(read_data="code"))
         mocker.patch(
-            "llm_devtale.files.TokenCounter.count_tokens",
-            side_effect=[
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            return_value=[
                 100,
                 max_tokens_per_file + 1,
                 100,
@@ -57,6 +68,152 @@ class TestGetFilesByToken:
         assert hot_files == ["src/file1.py", "src/file3.py"]
         assert total_token_count == 200
 
+    def test_get_files_by_token_chunk_large_files(self, mocker, test_repository):
+        file_selector = FileSelector(
+            test_repository, allowed_extensions=[".py"], chunk_large_files=True
+        )
+        mocker.patch("builtins.open", mocker.mock_open(read_data="code"))
+        mocker.patch(
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            return_value=[100, 30000, 100],
+        )
+
+        hot_files, total_token_count = file_selector.get_files_by_token(100000)
+
+        assert hot_files == ["src/file1.py", "src/file2.py", "src/file3.py"]
+        assert total_token_count == 30200
+
+
+def test_get_files_by_token_batches(mocker, test_repository):
+    file_selector = FileSelector(test_repository, selection="effort")
+    file_selector.allowed_extensions = [".py"]
+    mocker.patch("llm_devtale.files.TOKEN_BATCH_SIZE", 2)
+    mocker.patch("builtins.open", mocker.mock_open(read_data="code"))
+    count_tokens_batch = mocker.patch(
+        "llm_devtale.files.TokenCounter.count_tokens_batch",
+        side_effect=lambda texts: [100] * len(texts),
+    )
+
+    hot_files, total_token_count = file_selector.get_files_by_token(150)
+
+    assert hot_files == ["src/file1.py"]
+    assert total_token_count == 100
+    # The last batch is not tokenized once the budget is full
+    assert count_tokens_batch.call_count == 1
+
+
+class TestTokenCache:
+    @pytest.fixture
+    def file_selector(self, tmp_path):
+        for name in ("a.py", "b.py", "c.py"):
+            (tmp_path / name).write_text(name)
+        file_repo = FileRepo(tmp_path, {"a.py": 1, "b.py": 1, "c.py": 1})
+        return FileSelector(
+            file_repo,
+            allowed_extensions=[".py"],
+            token_cache=TokenCache(tmp_path / "cache" / "tokens.db"),
+            # c.py is modified in the working tree
+            blob_ids={"a.py": "blob_a", "b.py": "blob_b"},
+        )
+
+    def test_only_new_blobs_are_read(self, file_selector, mocker):
+        file_selector.token_cache.set_many({"blob_a": 7}, "cl100k_base")
+        mocker.patch(
+            "llm_devtale.files.TokenCounter.encoding_id", return_value="cl100k_base"
+        )
+        count_tokens_batch = mocker.patch(
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [len(text) for text in texts],
+        )
+        read_file = mocker.spy(file_selector, "read_file")
+
+        assert file_selector.count_tokens_batch(["a.py", "b.py", "c.py"]) == [7, 4, 4]
+        assert [call.args[0] for call in read_file.call_args_list] == ["b.py", "c.py"]
+        count_tokens_batch.assert_called_once_with(["b.py", "c.py"])
+
+        # The new blob is stored, the modified file is not
+        assert file_selector.token_cache.get_many(
+            ["blob_a", "blob_b"], "cl100k_base"
+        ) == {"blob_a": 7, "blob_b": 4}
+        assert len(file_selector.token_cache) == 2
+
+
+class TestSelectFiles:
+    @pytest.fixture
+    def file_selector(self, tmp_path):
+        for name, content in {"a.py": "a" * 10, "b.py": "b" * 20}.items():
+            (tmp_path / name).write_text(content)
+        file_repo = FileRepo(tmp_path, {"a.py": 2, "b.py": 1})
+        return FileSelector(file_repo, allowed_extensions=[".py"])
+
+    def test_records(self, file_selector, mocker):
+        mocker.patch(
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [len(text) for text in texts],
+        )
+
+        records, total_token_count = file_selector.select_files(1000)
+
+        assert total_token_count == 30
+        assert [record.path for record in records] == ["a.py", "b.py"]
+        assert records[0].content == "a" * 10
+        assert records[0].size == 10
+        assert records[0].tokens == 10
+        assert records[0].content_hash == hash_content("a" * 10)
+
+    def test_memory_cap(self, file_selector, mocker):
+        mocker.patch(
+            "llm_devtale.files.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [len(text) for text in texts],
+        )
+        file_selector.max_content_bytes = 15
+
+        records, _ = file_selector.select_files(1000)
+
+        assert records[0].content == "a" * 10
+        # Read again by the parser
+        assert records[1].content is None
+        assert records[1].tokens == 20
+
+
+class TestKnapsackSelection:
+    @pytest.fixture
+    def file_selector(self):
+        # A hot large file first, then files that fill the budget together
+        effort = {"hot.py": 10, "a.py": 5, "b.py": 5, "c.py": 5}
+        return FileSelector(FileRepo(Path("."), effort), allowed_extensions=[".py"])
+
+    @pytest.fixture(autouse=True)
+    def tokens(self, mocker):
+        tokens = {"hot.py": 80, "a.py": 40, "b.py": 30, "c.py": 30}
+        mocker.patch.object(
+            FileSelector,
+            "read_records",
+            side_effect=lambda file_paths: [
+                FileRecord(path, 0, path, tokens[path]) for path in file_paths
+            ],
+        )
+
+    def test_knapsack(self, file_selector):
+        hot_files, total_token_count = file_selector.get_files_by_token(100)
+
+        assert hot_files == ["a.py", "b.py", "c.py"]
+        assert total_token_count == 100
+        report = file_selector.budget_report
+        assert report.effort == 15
+        assert report.candidates == 4
+        assert str(report) == (
+            "Selected 3 of 4 files: 100 of 100 tokens (100.0%), 15 of 25 commits"
+        )
+
+    def test_effort(self, file_selector):
+        file_selector.selection = "effort"
+        hot_files, total_token_count = file_selector.get_files_by_token(100)
+
+        assert hot_files == ["hot.py"]
+        assert total_token_count == 80
+        assert file_selector.budget_report.effort == 10
+
 
 def test_valid_extension(test_repository: FileRepo):
     file_selector = FileSelector(test_repository)
@@ -96,3 +253,55 @@ def test_valid_file(mocker, test_repository: FileRepo):
     # Test case 5: Invalid file with no code extension
     file = "src/file"
     assert file_selector.valid_file(file) is False
+
+
+class TestSelectionWorkers:
+    @pytest.fixture
+    def file_selector(self, tmp_path, mocker):
+        mocker.patch("llm_devtale.files.TOKEN_BATCH_SIZE", 4)
+        effort = {}
+        for i in range(20):
+            name = f"file{i}.py" if i % 5 else f"file{i}.txt"
+            (tmp_path / name).write_text("x" * (i + 1) * 8)
+            effort[name] = 20 - i
+        return FileSelector(
+            FileRepo(tmp_path, effort),
+            allowed_extensions=[".py"],
+            token_cache=TokenCache(tmp_path / "cache" / "tokens.db"),
+            blob_ids={name: f"blob_{name}" for name in effort},
+            workers=2,
+        )
+
+    def test_same_selection_as_in_place(self, file_selector):
+        records, total_token_count = file_selector.select_files(1000)
+
+        assert len(records) == 16
+        # Counted by the workers, stored by the selector
+        assert len(file_selector.token_cache) == 16
+        file_selector.workers = 1
+        file_selector.token_cache = None
+        assert (records, total_token_count) == file_selector.select_files(1000)
+
+    def test_counts_of_another_encoding_are_not_cached(self, file_selector, mocker):
+        # Not an encoding the workers can load
+        mocker.patch.object(TokenCounter, "encoding_id", return_value="other")
+
+        records, _ = file_selector.select_files(1000)
+
+        assert len(records) == 16
+        assert len(file_selector.token_cache) == 0
+
+
+def test_estimate_in_workers(tmp_path, mocker, monkeypatch):
+    for name in ["bpe_file", "num_threads", "_encoding", "_loaded"]:
+        monkeypatch.setattr(TokenCounter, name, getattr(TokenCounter, name))
+    monkeypatch.setattr(files, "_worker_selector", None)
+    load_encoding = mocker.patch("llm_devtale.utils.load_encoding")
+    (tmp_path / "a.py").write_text("x" * 40)
+
+    files.init_worker(tmp_path, [], [".py"], None, ESTIMATE_ENCODING)
+    records, encoding_id = files.scan_batch(["a.py"], {}, {})
+
+    assert [record.tokens for record in records] == [10]
+    assert encoding_id == ESTIMATE_ENCODING
+    load_encoding.assert_not_called()
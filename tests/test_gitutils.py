@@ -1,6 +1,28 @@
 from pathlib import Path
 
-from llm_devtale.gitutils import GitRepository
+import pytest
+from git import Actor, Repo
+from llm_devtale.gitutils import COMMIT_MARKER, GitRepository
+
+AUTHOR = Actor("Test", "test@example.com")
+
+
+def commit(repo: Repo, files: dict, message: str = "commit"):
+    for name, content in files.items():
+        path = Path(repo.working_dir) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        repo.index.add([name])
+    repo.index.commit(message, author=AUTHOR, committer=AUTHOR)
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    repo = Repo.init(tmp_path)
+    commit(repo, {"src/file1.py": "1", "src/file2.py": "1", "README.md": "1"})
+    commit(repo, {"src/file1.py": "2", "src/file2.py": "2"})
+    commit(repo, {"src/file1.py": "3"})
+    return repo
 
 
 class TestGitEffort:
@@ -10,22 +32,142 @@ class TestGitEffort:
         mocker.patch.object(git_stats.repo.git, "rev_list", return_value="42")
         assert git_stats.get_commit_count() == 42
 
-    def test_get_git_effort(self, mocker):
-        mocker.patch("llm_devtale.gitutils.Repo")
-        git_stats = GitRepository(Path("."))
-        mocker.patch.object(
-            git_stats.repo.git,
-            "effort",
-            return_value="file commits days\nsrc/file1.py..... 10 2\nsrc/file2.py..... 5 1",
-        )
-        assert git_stats.get_git_effort() == {"src/file1.py": 10, "src/file2.py": 5}
+    def test_get_git_effort(self, git_repo):
+        git_stats = GitRepository(Path(git_repo.working_dir))
+        effort = git_stats.get_git_effort()
 
-    def test_get_git_effort_bad_commit_count(self, mocker):
-        mocker.patch("llm_devtale.gitutils.Repo")
-        git_stats = GitRepository(Path("."))
-        mocker.patch.object(
-            git_stats.repo.git,
-            "effort",
-            return_value="src/file1.py..... dog 2\nsrc/file2.py..... 5 1",
+        assert effort == {"src/file1.py": 3, "src/file2.py": 2, "README.md": 1}
+        assert list(effort) == ["src/file1.py", "src/file2.py", "README.md"]
+
+    def test_get_git_effort_ties_sorted_by_path(self, tmp_path):
+        repo = Repo.init(tmp_path)
+        commit(repo, {"b.py": "1", "a.py": "1", "c.py": "1"})
+        git_stats = GitRepository(tmp_path)
+
+        assert list(git_stats.get_git_effort()) == ["a.py", "b.py", "c.py"]
+
+    def test_get_git_effort_only_tracked_files(self, git_repo):
+        git_repo.index.remove(["src/file2.py"], working_tree=True)
+        git_repo.index.commit("delete", author=AUTHOR, committer=AUTHOR)
+        git_stats = GitRepository(Path(git_repo.working_dir))
+
+        assert git_stats.get_git_effort() == {"src/file1.py": 3, "README.md": 1}
+
+    def test_get_git_effort_renames(self, git_repo):
+        git_repo.index.move(["src/file1.py", "src/main.py"])
+        git_repo.index.commit("rename", author=AUTHOR, committer=AUTHOR)
+        git_stats = GitRepository(Path(git_repo.working_dir))
+
+        assert git_stats.get_git_effort()["src/main.py"] == 1
+        assert git_stats.get_git_effort(follow_renames=True)["src/main.py"] == 4
+
+    def test_get_git_effort_unusual_paths(self, tmp_path):
+        repo = Repo.init(tmp_path)
+        commit(repo, {"dir with space/é.py": "1"})
+        git_stats = GitRepository(tmp_path)
+
+        assert git_stats.get_git_effort() == {"dir with space/é.py": 1}
+
+    def test_get_git_effort_no_commits(self, tmp_path):
+        Repo.init(tmp_path)
+        assert GitRepository(tmp_path).get_git_effort() == {}
+
+
+def test_get_blob_ids(git_repo):
+    git_stats = GitRepository(Path(git_repo.working_dir))
+    blob_ids = git_stats.get_blob_ids()
+
+    assert set(blob_ids) == {"src/file1.py", "src/file2.py", "README.md"}
+    assert blob_ids["src/file1.py"] == git_repo.head.commit.tree["src/file1.py"].hexsha
+
+    # Files changed in the working tree have no blob id yet
+    (Path(git_repo.working_dir) / "src/file2.py").write_text("changed")
+    assert set(git_stats.get_blob_ids()) == {"src/file1.py", "README.md"}
+
+
+def test_count_changes():
+    tokens = [
+        f"{COMMIT_MARKER}aaa",
+        "A",
+        "a.py",
+        "A",
+        "b.py",
+        f"{COMMIT_MARKER}bbb",
+        "R100",
+        "a.py",
+        "c.py",
+        "M",
+        "b.py",
+        f"{COMMIT_MARKER}ccc",
+    ]
+    counts: dict = {}
+
+    assert GitRepository.count_changes(tokens, counts, follow_renames=True) == "ccc"
+    assert counts == {"b.py": 2, "c.py": 2}
+
+
+class TestEffortIndex:
+    def test_index_is_saved(self, git_repo, tmp_path):
+        git_stats = GitRepository(Path(git_repo.working_dir), cache_dir=tmp_path)
+        git_stats.get_git_effort()
+
+        index = git_stats.load_effort_index(follow_renames=False)
+        assert index is not None
+        assert index["commit"] == git_repo.head.commit.hexsha
+        assert index["counts"] == {"src/file1.py": 3, "src/file2.py": 2, "README.md": 1}
+
+    def test_only_new_commits_are_walked(self, git_repo, tmp_path, mocker):
+        git_stats = GitRepository(Path(git_repo.working_dir), cache_dir=tmp_path)
+        git_stats.get_git_effort()
+        indexed_commit = git_repo.head.commit.hexsha
+        commit(git_repo, {"src/file2.py": "3"})
+        commit(git_repo, {"src/file2.py": "4", "src/file3.py": "1"})
+
+        iter_log = mocker.spy(git_stats, "iter_log")
+        effort = git_stats.get_git_effort()
+
+        iter_log.assert_called_once_with(
+            "--no-renames", f"{indexed_commit}..{git_repo.head.commit.hexsha}"
         )
-        assert git_stats.get_git_effort() == {"src/file1.py": 1, "src/file2.py": 5}
+        assert effort == {
+            "src/file2.py": 4,
+            "src/file1.py": 3,
+            "README.md": 1,
+            "src/file3.py": 1,
+        }
+
+    def test_up_to_date_index_walks_nothing(self, git_repo, tmp_path, mocker):
+        git_stats = GitRepository(Path(git_repo.working_dir), cache_dir=tmp_path)
+        effort = git_stats.get_git_effort()
+
+        iter_log = mocker.spy(git_stats, "iter_log")
+        assert git_stats.get_git_effort() == effort
+        iter_log.assert_not_called()
+
+    def test_rebuild_after_force_push(self, git_repo, tmp_path):
+        git_stats = GitRepository(Path(git_repo.working_dir), cache_dir=tmp_path)
+        git_stats.get_git_effort()
+        # Rewrite the last commit: the indexed commit is no longer an ancestor
+        git_repo.head.reset("HEAD~1", index=True, working_tree=True)
+        commit(git_repo, {"src/file2.py": "3"})
+
+        assert git_stats.get_git_effort() == {
+            "src/file2.py": 3,
+            "src/file1.py": 2,
+            "README.md": 1,
+        }
+
+    def test_rebuild_unknown_commit(self, git_repo, tmp_path):
+        git_stats = GitRepository(Path(git_repo.working_dir), cache_dir=tmp_path)
+        git_stats.save_effort_index(False, "0" * 40, {"src/file1.py": 100})
+
+        assert git_stats.get_git_effort()["src/file1.py"] == 3
+
+    def test_renames_are_indexed_separately(self, git_repo, tmp_path):
+        git_stats = GitRepository(Path(git_repo.working_dir), cache_dir=tmp_path)
+        git_stats.get_git_effort()
+        git_repo.index.move(["src/file1.py", "src/main.py"])
+        git_repo.index.commit("rename", author=AUTHOR, committer=AUTHOR)
+
+        assert git_stats.get_git_effort(follow_renames=True)["src/main.py"] == 4
+        assert git_stats.get_git_effort()["src/main.py"] == 1
@@ -0,0 +1,100 @@
+import pytest
+from llm_devtale.config import ParserConfig
+from llm_devtale.ignore import IgnoreMatcher, translate_pattern
+
+
+@pytest.mark.parametrize(
+    "pattern, path, expected",
+    [
+        ("*.pyc", "a.pyc", True),
+        ("*.pyc", "src/deep/a.pyc", True),
+        ("*.pyc", "a.py", False),
+        ("tests", "tests", True),
+        ("tests", "src/tests", True),
+        ("tests", "src/tests_old", False),
+        ("/build", "build", True),
+        ("/build", "src/build", False),
+        ("src/*.py", "src/a.py", True),
+        ("src/*.py", "src/deep/a.py", False),
+        ("src/*.py", "lib/src/a.py", False),
+        ("**/node_modules", "node_modules", True),
+        ("**/node_modules", "web/app/node_modules", True),
+        ("**/*test*", "src/test_file.py", True),
+        ("**/*test*", "src/latest", True),
+        ("src/**/gen", "src/gen", True),
+        ("src/**/gen", "src/a/b/gen", True),
+        ("logs/**", "logs/a/b.txt", True),
+        ("logs/**", "logs", False),
+        ("file?.py", "file1.py", True),
+        ("file?.py", "file10.py", False),
+        ("file[0-9].py", "file1.py", True),
+        ("file[!0-9].py", "file1.py", False),
+        ("file[!0-9].py", "filea.py", True),
+        ("\\#notes", "#notes", True),
+        ("a.b", "aXb", False),
+    ],
+)
+def test_translate_pattern(pattern, path, expected):
+    rule = translate_pattern(pattern)
+    assert rule is not None
+    target = path.rpartition("/")[2] if rule.basename else path
+    assert (rule.regex.fullmatch(target) is not None) == expected
+
+
+@pytest.mark.parametrize("pattern", ["", "   ", "# comment", "/"])
+def test_translate_pattern_empty(pattern):
+    assert translate_pattern(pattern) is None
+
+
+def test_ignored_folder_prunes_children():
+    matcher = IgnoreMatcher(["vendor"])
+
+    assert matcher.is_ignored("vendor/lib/a.py")
+    assert matcher.is_ignored("src/vendor/a.py")
+    assert not matcher.is_ignored("src/vendored.py")
+
+
+def test_dir_only_patterns():
+    matcher = IgnoreMatcher(["docs/"])
+
+    assert matcher.is_ignored("docs/index.md")
+    assert matcher.is_ignored("src/docs/index.md")
+    assert not matcher.is_ignored("src/docs")
+
+
+def test_negation():
+    matcher = IgnoreMatcher(["*.json", "!package.json"])
+
+    assert matcher.is_ignored("data/a.json")
+    assert not matcher.is_ignored("web/package.json")
+    assert not matcher.is_ignored("src/a.py")
+
+
+def test_negation_does_not_reinclude_ignored_folder():
+    matcher = IgnoreMatcher(["build/", "!build/keep.py"])
+
+    assert matcher.is_ignored("build/keep.py")
+
+
+def test_no_patterns():
+    assert not IgnoreMatcher([]).is_ignored("src/a.py")
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("src/llm_devtale/parser.py", False),
+        ("README.md", False),
+        ("tests/test_parser.py", True),
+        ("node_modules/react/index.js", True),
+        ("web/node_modules/react/index.js", True),
+        ("src/migrations/0001_initial.py", True),
+        ("static/app.min.js", True),
+        ("app/app.min.js", True),
+        ("package-lock.json", True),
+        ("lib/pkg.egg-info/PKG-INFO", True),
+    ],
+)
+def test_default_patterns(path, expected):
+    matcher = IgnoreMatcher(ParserConfig().ignore_patterns)
+    assert matcher.is_ignored(path) == expected
@@ -0,0 +1,116 @@
+from llm_devtale.config import ParserConfig
+from llm_devtale.journal import Journal
+from llm_devtale.node import Node, NodeType
+
+
+def make_journal(tmp_path, model_id="model"):
+    config = ParserConfig(directory=tmp_path / "project", cache_dir=tmp_path / "cache")
+    return Journal.from_config(config, model_id=model_id)
+
+
+def file_node(description="A"):
+    return Node(
+        name="a.py", description=description, node_type=NodeType.FILE, content_hash="h"
+    )
+
+
+def test_resume(tmp_path):
+    journal = make_journal(tmp_path)
+    assert journal.open() == {}
+    journal("src/a.py", file_node())
+    journal.close()
+
+    assert make_journal(tmp_path).open(resume=True) == {"src/a.py": file_node()}
+
+
+def test_open_without_resume_starts_over(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.open()
+    journal("src/a.py", file_node())
+    journal.close()
+
+    assert make_journal(tmp_path).open() == {}
+    assert make_journal(tmp_path).open(resume=True) == {}
+
+
+def test_incomplete_line_is_skipped(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.open()
+    journal("src/a.py", file_node())
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('{"path": "src/b.py", "na')
+
+    resumed = make_journal(tmp_path)
+    assert resumed.open(resume=True) == {"src/a.py": file_node()}
+    resumed("src/b.py", file_node("B"))
+    resumed.close()
+
+    assert list(make_journal(tmp_path).load()) == ["src/a.py", "src/b.py"]
+
+
+def test_other_settings_are_not_resumed(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.open()
+    journal("src/a.py", file_node())
+    journal.close()
+
+    assert make_journal(tmp_path, model_id="other").open(resume=True) == {}
+
+
+def test_remove(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.open()
+    journal.remove()
+
+    assert not journal.path.exists()
+
+
+FILES = {"src/a.py": "def a(): pass", "src/b.py": "def b(): pass"}
+
+
+def test_resumed_nodes_are_not_summarized_again(mocker, tmp_path, make_project):
+    project = make_project(FILES, folder="project", cache_dir=tmp_path / "cache")
+    mock_generate = mocker.patch(
+        "llm_devtale.parser.generate_summary", return_value="summary"
+    )
+
+    def run(resume):
+        journal = Journal.from_config(project.parser_config, model_id="")
+        node = project.parser(
+            previous_nodes=journal.open(resume=resume), on_node=journal
+        ).parse()
+        journal.close()
+        return node
+
+    first = run(resume=False)
+    assert mock_generate.call_count == 4
+    mock_generate.reset_mock()
+
+    assert run(resume=True) == first
+    mock_generate.assert_not_called()
+
+
+def test_failed_files_are_summarized_on_resume(mocker, tmp_path, make_project):
+    project = make_project(FILES, folder="project", cache_dir=tmp_path / "cache")
+
+    def summarize(_, data, **kwargs):
+        if data.get("file_name") == "b.py":
+            raise ValueError("outage")
+        return "summary"
+
+    mock_generate = mocker.patch(
+        "llm_devtale.parser.generate_summary", side_effect=summarize
+    )
+    journal = Journal.from_config(project.parser_config, model_id="")
+    project_parser = project.parser(previous_nodes=journal.open(), on_node=journal)
+    project_parser.parse()
+    journal.close()
+
+    assert project_parser.failed == ["src/b.py"]
+    mock_generate.side_effect = None
+    mock_generate.return_value = "summary"
+    mock_generate.reset_mock()
+    project.parser(previous_nodes=journal.open(resume=True)).parse()
+    # b.py, and src which now includes it
+    assert mock_generate.call_count == 2
@@ -0,0 +1,59 @@
+import itertools
+import random
+
+import pytest
+from llm_devtale.knapsack import knapsack
+
+
+def brute_force(values, weights, capacity):
+    best = 0
+    for size in range(len(values) + 1):
+        for items in itertools.combinations(range(len(values)), size):
+            if sum(weights[i] for i in items) <= capacity:
+                best = max(best, sum(values[i] for i in items))
+    return best
+
+
+def test_large_item_does_not_end_selection():
+    assert knapsack([10, 5, 5, 5], [80, 40, 30, 30], 100) == [1, 2, 3]
+
+
+def test_everything_fits():
+    assert knapsack([1, 2, 3], [10, 10, 10], 100) == [0, 1, 2]
+
+
+def test_items_over_capacity_are_skipped():
+    assert knapsack([100, 1], [101, 1], 100) == [1]
+    assert knapsack([1], [0], 100) == []
+
+
+def test_best_single_item():
+    assert knapsack([1, 1, 50], [1, 1, 100], 100) == [2]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_optimal_on_small_instances(seed):
+    rng = random.Random(seed)
+    values = [rng.randint(1, 20) for _ in range(12)]
+    weights = [rng.randint(1, 50) for _ in range(12)]
+    capacity = rng.randint(20, 200)
+
+    chosen = knapsack(values, weights, capacity, resolution=capacity)
+
+    assert sum(weights[i] for i in chosen) <= capacity
+    assert sum(values[i] for i in chosen) == brute_force(values, weights, capacity)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_never_overflows(seed):
+    rng = random.Random(seed)
+    values = [rng.randint(1, 100) for _ in range(5000)]
+    weights = [rng.randint(1, 20000) for _ in range(5000)]
+    capacity = 200000
+
+    chosen = knapsack(values, weights, capacity)
+    used = sum(weights[i] for i in chosen)
+
+    assert used <= capacity
+    # The budget is nearly full with many small items
+    assert used > capacity * 0.99
@@ -0,0 +1,168 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from llm_devtale.limiter import (
+    PROBE_POLL_INTERVAL,
+    RateLimiter,
+    TokenBucket,
+    is_throttle,
+    is_transient,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_limiter(clock, **kwargs):
+    return RateLimiter(clock=clock, sleep=clock.sleep, backoff_base=0.5, **kwargs)
+
+
+def test_error_classification():
+    assert is_throttle(RateLimitError())
+    assert is_throttle(Exception("Rate limit reached for requests"))
+    assert is_transient(RateLimitError())
+    assert is_transient(ServerError())
+    assert is_transient(TimeoutError())
+    assert not is_throttle(ServerError())
+    assert not is_transient(ValueError("bad prompt"))
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(per_minute=60, clock=clock)
+
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1)
+    assert bucket.reserve(1) == pytest.approx(2)
+    clock.now += 2
+    assert bucket.reserve(1) == pytest.approx(1)
+
+
+def test_token_bucket_unlimited(clock):
+    bucket = TokenBucket(per_minute=0, clock=clock)
+
+    assert bucket.reserve(1000000) == 0
+
+
+def test_call_requests_per_minute(clock):
+    limiter = make_limiter(clock, requests_per_minute=60)
+    for _ in range(62):
+        limiter.call(lambda: None)
+
+    assert clock.now == pytest.approx(2)
+
+
+def test_call_tokens_per_minute(clock):
+    limiter = make_limiter(clock, tokens_per_minute=1000)
+    limiter.call(lambda: None, tokens=1000)
+    limiter.call(lambda: None, tokens=500)
+
+    assert clock.now == pytest.approx(30)
+
+
+def test_call_retries_transient_errors(clock):
+    fn = mock.Mock(side_effect=[ServerError(), TimeoutError(), "summary"])
+    limiter = make_limiter(clock)
+
+    with mock.patch("llm_devtale.limiter.random.uniform", side_effect=lambda a, b: b):
+        assert limiter.call(fn, "data", summary_type="file") == "summary"
+
+    fn.assert_called_with("data", summary_type="file")
+    assert fn.call_count == 3
+    assert limiter.retries == 2
+    assert clock.sleeps == [0, 0.5, 0, 1.0, 0]
+
+
+def test_call_does_not_retry_other_errors(clock):
+    fn = mock.Mock(side_effect=ValueError("bad prompt"))
+    limiter = make_limiter(clock)
+
+    with pytest.raises(ValueError):
+        limiter.call(fn)
+    assert fn.call_count == 1
+
+
+def test_call_gives_up_after_max_retries(clock):
+    fn = mock.Mock(side_effect=ServerError())
+    limiter = make_limiter(clock, max_retries=2, failure_threshold=10)
+
+    with pytest.raises(ServerError):
+        limiter.call(fn)
+    assert fn.call_count == 3
+
+
+def test_aimd_concurrency(clock):
+    limiter = make_limiter(clock, max_concurrency=8)
+    fn = mock.Mock(side_effect=[RateLimitError(), RateLimitError(), "summary"])
+
+    limiter.call(fn)
+
+    assert limiter.throttles == 2
+    assert limiter.concurrency == pytest.approx(2 + 1 / 2)
+    for _ in range(100):
+        limiter.call(lambda: None)
+    assert limiter.concurrency == 8
+
+
+def test_circuit_breaker(clock):
+    limiter = make_limiter(clock, max_retries=10, failure_threshold=3, reset_timeout=30)
+    fn = mock.Mock(side_effect=[ServerError()] * 3 + ["summary"])
+
+    # Waits for the breaker instead of failing
+    assert limiter.call(fn) == "summary"
+    assert fn.call_count == 4
+    assert clock.now >= 30
+    assert limiter.opened_at is None
+    assert limiter.consecutive_failures == 0
+
+
+def test_circuit_breaker_single_probe(clock):
+    limiter = make_limiter(clock, max_retries=0, failure_threshold=3, reset_timeout=30)
+    limiter.opened_at = clock()
+    clock.now += 30
+
+    with pytest.raises(ServerError):
+        limiter.call(mock.Mock(side_effect=ServerError()))
+    # The failed probe opens it again
+    assert limiter.opened_at == 30
+    assert not limiter.probing
+    assert limiter._circuit_wait() == 30
+
+    clock.now += 30
+    # The first caller probes, the others wait for its result
+    assert limiter._circuit_wait() == 0
+    assert limiter._circuit_wait() == PROBE_POLL_INTERVAL
+
+
+def test_acall_retries(clock):
+    fn = mock.AsyncMock(side_effect=[RateLimitError(), "summary"])
+    limiter = make_limiter(clock)
+
+    with mock.patch("llm_devtale.limiter.asyncio.sleep", new=mock.AsyncMock()):
+        assert asyncio.run(limiter.acall(fn, "data")) == "summary"
+
+    assert fn.await_count == 2
+    assert limiter.in_flight == 0
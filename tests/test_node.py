@@ -1,5 +1,7 @@
+import json
+
 from llm_devtale.node import (  # Assuming Node and NodeType are in 'your_module.py'
-    Node, NodeType)
+    Node, NodeType, load_tree, save_tree)
 
 
 def test_add_children_multiple_nodes():
@@ -85,3 +87,62 @@ def test_to_string_with_nested_children():
         "    main.py (file): Main script"
     )
     assert root.to_string() == expected_string
+
+
+def test_to_json_round_trip():
+    """Test that from_json restores a tree serialized with to_json."""
+    root = Node(
+        name="my_project",
+        description="Root project",
+        node_type=NodeType.REPOSITORY,
+        content_hash="abc",
+        children=[
+            Node(
+                name="src",
+                description="Sources",
+                node_type=NodeType.FOLDER,
+                children=[
+                    Node(name="main.py", description="Main", node_type=NodeType.FILE)
+                ],
+            )
+        ],
+    )
+
+    assert Node.from_json(json.loads(json.dumps(root.to_json()))) == root
+
+
+def test_save_and_load_tree(tmp_path):
+    """Test that a saved tree can be loaded again."""
+    root = Node(name="my_project", description="", node_type=NodeType.REPOSITORY)
+
+    assert load_tree(tmp_path / "tree.json") is None
+    save_tree(root, tmp_path / "tree.json")
+    assert load_tree(tmp_path / "tree.json") == root
+
+
+def test_index():
+    """Test that index maps every node to its path in the repository."""
+    main = Node(name="main.py", description="", node_type=NodeType.FILE)
+    utils = Node(name="utils.py", description="", node_type=NodeType.FILE)
+    setup = Node(name="setup.py", description="", node_type=NodeType.FILE)
+    src = Node(name="src/app", description="", node_type=NodeType.FOLDER)
+    src.add_children(main)
+    src.add_children(utils)
+    root_folder = Node(
+        name=".", description="", node_type=NodeType.FOLDER, children=[setup]
+    )
+    root = Node(
+        name="my_project",
+        description="",
+        node_type=NodeType.REPOSITORY,
+        children=[root_folder, src],
+    )
+
+    assert root.index() == {
+        "": root,
+        ".": root_folder,
+        "setup.py": setup,
+        "src/app": src,
+        "src/app/main.py": main,
+        "src/app/utils.py": utils,
+    }
@@ -1,9 +1,15 @@
+import asyncio
+import threading
+import time
 from typing import Optional
 
 import pytest
+from llm_devtale.cache import SummaryCache, hash_data
 from llm_devtale.config import ParserConfig
+from llm_devtale.files import FileRecord
+from llm_devtale.limiter import RateLimiter
 from llm_devtale.node import Node, NodeType
-from llm_devtale.parser import FileParser, FolderParser, ProjectParser
+from llm_devtale.parser import FileParser, FolderParser, Parser, ProjectParser
 
 
 class TestParser:
@@ -44,7 +50,7 @@ class TestProjectParser:
         )
         mocker.patch.object(
             FolderParser,
-            "parse",
+            "build",
             return_value=Node(
                 name="folder1", node_type=NodeType.FOLDER, description="folder1 summary"
             ),
@@ -66,7 +72,7 @@ class TestProjectParser:
         )
         mocker.patch.object(
             FolderParser,
-            "parse",
+            "build",
             return_value=Node(
                 name="folder1", node_type=NodeType.FOLDER, description="folder1 summary"
             ),
@@ -85,7 +91,7 @@ class TestProjectParser:
         )
         mocker.patch.object(
             FolderParser,
-            "parse",
+            "build",
             return_value=Node(
                 name="folder1", node_type=NodeType.FOLDER, description="folder1 summary"
             ),
@@ -215,3 +221,562 @@ class TestFileParser:
         assert isinstance(node, Node)
         assert node.description == ""
         assert len(node.children) == 0
+
+    def test_parse_file_cached(self, mocker, tmp_path):
+        parser_config = ParserConfig(min_code_lenght=1)
+        cache = SummaryCache(tmp_path / "summaries.db")
+        file_parser = FileParser(
+            parser_config=parser_config,
+            model=None,  # type: ignore
+            item_path="/path/to/project/src/file1.py",
+            cache=cache,
+        )
+
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", return_value="summary"
+        )
+        mocker.patch("builtins.open", mocker.mock_open(read_data="def a(): pass"))
+        first: Optional[Node | None] = file_parser.parse()
+        second: Optional[Node | None] = file_parser.parse()
+
+        assert first and second
+        assert first.description == second.description == "summary"
+        assert mock_generate.call_count == 1
+        assert cache.hits == 1
+
+    def test_parse_file_retries(self, mocker):
+        parser_config = ParserConfig(min_code_lenght=1)
+        file_parser = FileParser(
+            parser_config=parser_config,
+            model=None,  # type: ignore
+            item_path="/path/to/project/src/file1.py",
+            limiter=RateLimiter(sleep=lambda seconds: None),
+        )
+
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary",
+            side_effect=[TimeoutError(), "summary"],
+        )
+        mocker.patch("builtins.open", mocker.mock_open(read_data="def a(): pass"))
+        node: Optional[Node | None] = file_parser.parse()
+
+        assert node and node.description == "summary"
+        assert mock_generate.call_count == 2
+
+    def test_parse_file_from_record(self, mocker):
+        parser_config = ParserConfig(directory="/path/to/project", min_code_lenght=1)
+        record = FileRecord(
+            path="src/file1.py",
+            size=13,
+            content_hash="blob",
+            tokens=4,
+            content="def a(): pass",
+        )
+        file_parser = FileParser(
+            parser_config=parser_config,
+            model=None,  # type: ignore
+            item_path="/path/to/project/src/file1.py",
+            records={"src/file1.py": record},
+        )
+
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", return_value="summary"
+        )
+        mock_open = mocker.patch("builtins.open")
+        node: Optional[Node | None] = file_parser.parse()
+
+        assert node and node.description == "summary"
+        assert mock_generate.call_args.args[1]["file_content"] == "def a(): pass"
+        mock_open.assert_not_called()
+        # The content is released once the prompt data is built
+        assert record.content is None
+
+
+class TestFileRecords:
+    def test_folders_are_not_listed(self, mocker, make_project):
+        project = make_project(
+            {"src/a.py": "def a(): pass", "src/b.py": "def b(): pass"}
+        )
+        mocker.patch("llm_devtale.parser.generate_summary", return_value="summary")
+        listdir = mocker.patch("llm_devtale.parser.os.listdir")
+
+        node: Node = project.parser().parse()
+
+        listdir.assert_not_called()
+        assert [child.name for child in node.children[0].children] == [
+            "a.py",
+            "b.py",
+        ]
+
+
+class TestNestedFolders:
+    def test_get_folder_tree(self):
+        project_parser = ProjectParser(
+            parser_config=ParserConfig(),
+            model=None,  # type: ignore
+            valid_files=[
+                "README.md",
+                "src/pkg/a.py",
+                "src/pkg/sub/b.py",
+                "src/other/c.py",
+                "java/src/main/com/x/D.java",
+            ],
+        )
+
+        assert project_parser.get_folder_tree() == {
+            ".": ["java/src/main/com/x", "src"],
+            "java/src/main/com/x": [],
+            "src": ["src/other", "src/pkg"],
+            "src/other": [],
+            "src/pkg": ["src/pkg/sub"],
+            "src/pkg/sub": [],
+        }
+
+    @pytest.mark.parametrize("engine", ["thread", "async"])
+    def test_parse_nested(self, mocker, make_project, engine):
+        project = make_project(
+            {
+                "main.py": "def main(): pass",
+                "src/app/views.py": "def view(): pass",
+                "src/app/api/routes.py": "def route(): pass",
+                "src/lib/core.py": "def core(): pass",
+            }
+        )
+        prompts = []
+
+        def summary(model, data, summary_type, additional_prompt):
+            prompts.append((summary_type, data))
+            name = data.get("file_name") or data.get("folder_name") or "project"
+            return f"summary of {name}"
+
+        async def asummary(*args, **kwargs):
+            return summary(*args, **kwargs)
+
+        mocker.patch("llm_devtale.parser.generate_summary", side_effect=summary)
+        mocker.patch("llm_devtale.parser.agenerate_summary", side_effect=asummary)
+        project_parser = project.parser()
+        if engine == "async":
+            node: Node = asyncio.run(project_parser.aparse())
+        else:
+            node: Node = project_parser.parse()
+
+        assert [child.name for child in node.children] == ["main.py", "src"]
+        src = node.children[1]
+        assert [child.name for child in src.children] == ["src/app", "src/lib"]
+        assert [child.name for child in src.children[0].children] == [
+            "src/app/api",
+            "views.py",
+        ]
+        # 4 files, 4 folders and the project
+        assert len(prompts) == 9
+        # Folders only see the descriptions of their direct children
+        folder_data = next(
+            data for _, data in prompts if data.get("folder_name") == "src"
+        )
+        assert folder_data["folder_content"] == [
+            {
+                "name": "src/app",
+                "description": "summary of src/app",
+                "node_type": "folder",
+            },
+            {
+                "name": "src/lib",
+                "description": "summary of src/lib",
+                "node_type": "folder",
+            },
+        ]
+        assert node.index()["src/app/api/routes.py"].description == (
+            "summary of routes.py"
+        )
+
+
+class TestRollup:
+    @pytest.fixture
+    def parser(self, mocker):
+        # Every prompt costs 100 tokens plus 100 per child
+        mocker.patch.object(Parser, "prompt_tokens", return_value=100)
+        mocker.patch(
+            "llm_devtale.parser.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [100] * len(texts),
+        )
+        return Parser(
+            parser_config=ParserConfig(max_tokens_per_prompt=450),
+            model=None,  # type: ignore
+        )
+
+    @staticmethod
+    def folder_data(children):
+        return {
+            "folder_name": "src",
+            "folder_content": [
+                {"name": f"file{i}.py", "description": "summary", "node_type": "file"}
+                for i in range(children)
+            ],
+        }
+
+    def test_small_folder_is_not_split(self, parser, mocker):
+        summarize = mocker.patch.object(Parser, "summarize")
+        data = self.folder_data(3)
+
+        assert parser.reduce("src", data, NodeType.FOLDER) == data
+        summarize.assert_not_called()
+
+    def test_map_reduce(self, parser, mocker):
+        summarize = mocker.patch.object(
+            Parser,
+            "summarize",
+            side_effect=lambda data, summary_type: f"summary of {data['folder_name']}",
+        )
+
+        data = parser.reduce("src", self.folder_data(10), NodeType.FOLDER)
+
+        # 10 children in 4 parts of at most 3, then 4 parts in 2
+        assert summarize.call_count == 6
+        assert data["folder_content"] == [
+            {
+                "name": "src (part 1 of 2)",
+                "description": "summary of src (part 1 of 2)",
+                "node_type": "folder",
+            },
+            {
+                "name": "src (part 2 of 2)",
+                "description": "summary of src (part 2 of 2)",
+                "node_type": "folder",
+            },
+        ]
+
+    def test_amap_reduce(self, parser, mocker):
+        async def asummarize(data, summary_type):
+            return f"summary of {data['folder_name']}"
+
+        mocker.patch.object(Parser, "asummarize", side_effect=asummarize)
+
+        data = asyncio.run(parser.areduce("src", self.folder_data(10), NodeType.FOLDER))
+
+        assert [entry["name"] for entry in data["folder_content"]] == [
+            "src (part 1 of 2)",
+            "src (part 2 of 2)",
+        ]
+
+    def test_children_too_large(self, parser, mocker):
+        mocker.patch(
+            "llm_devtale.parser.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [1000] * len(texts),
+        )
+        summarize = mocker.patch.object(Parser, "summarize")
+        data = self.folder_data(3)
+
+        assert parser.reduce("src", data, NodeType.FOLDER) == data
+        summarize.assert_not_called()
+
+    def test_files_are_not_split(self, parser):
+        data = {"file_name": "a.py", "file_content": "x"}
+        assert parser.reduce("a.py", data, NodeType.FILE) == data
+
+
+class TestChunkLargeFiles:
+    CODE = "".join(f"def f{i}():\n    return {i}\n\n\n" for i in range(4))
+
+    @pytest.fixture(autouse=True)
+    def characters_as_tokens(self, mocker):
+        mocker.patch(
+            "llm_devtale.parser.TokenCounter.count_tokens",
+            side_effect=lambda text: len(text),
+        )
+        mocker.patch(
+            "llm_devtale.chunker.TokenCounter.count_tokens_batch",
+            side_effect=lambda texts: [len(text) for text in texts],
+        )
+
+    def file_parser(self, **kwargs):
+        return FileParser(
+            parser_config=ParserConfig(
+                min_code_lenght=1, max_tokens_per_file=50, **kwargs
+            ),
+            model=None,  # type: ignore
+            item_path="/path/to/project/src/core.py",
+        )
+
+    def test_chunks_are_summarized_and_reduced(self, mocker):
+        prompts = []
+
+        def summary(model, data, summary_type, additional_prompt):
+            prompts.append(data)
+            return f"summary of {data['file_name']}"
+
+        mocker.patch("llm_devtale.parser.generate_summary", side_effect=summary)
+        mocker.patch("builtins.open", mocker.mock_open(read_data=self.CODE))
+
+        node = self.file_parser(chunk_large_files=True).parse()
+
+        assert node and node.description == "summary of core.py"
+        assert [data["file_name"] for data in prompts[:-1]] == [
+            "core.py (lines 1-8)",
+            "core.py (lines 9-16)",
+        ]
+        assert prompts[-1] == {
+            "file_name": "core.py",
+            "file_parts": [
+                {"lines": "1-8", "description": "summary of core.py (lines 1-8)"},
+                {"lines": "9-16", "description": "summary of core.py (lines 9-16)"},
+            ],
+        }
+
+    def test_achunks(self, mocker):
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.agenerate_summary", return_value="summary"
+        )
+        mocker.patch("builtins.open", mocker.mock_open(read_data=self.CODE))
+        file_parser = self.file_parser(chunk_large_files=True)
+        file_parser.semaphores = {NodeType.FILE: asyncio.Semaphore(2)}
+
+        node = asyncio.run(file_parser.aparse())
+
+        assert node and node.description == "summary"
+        assert mock_generate.await_count == 3
+
+    def test_without_chunking(self, mocker):
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", return_value="summary"
+        )
+        mocker.patch("builtins.open", mocker.mock_open(read_data=self.CODE))
+
+        self.file_parser().parse()
+
+        assert mock_generate.call_count == 1
+
+    def test_chunks_share_the_run_concurrency(self, mocker, make_project):
+        lock = threading.Lock()
+        in_flight = [0, 0]  # Current and peak requests
+
+        def summary(model, data, summary_type, additional_prompt):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return "summary"
+
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", side_effect=summary
+        )
+        project = make_project(
+            {f"src/core{i}.py": self.CODE for i in range(4)},
+            chunk_large_files=True,
+            max_tokens_per_file=50,
+            max_concurrency=2,
+        )
+
+        node = project.parser().parse()
+
+        assert node and node.description == "summary"
+        # 2 chunks and the file for each file, the folder and the project
+        assert mock_generate.call_count == 4 * 3 + 2
+        assert in_flight[1] == 2
+
+
+class TestIncrementalParse:
+    def test_only_changed_nodes_are_summarized(self, mocker, make_project):
+        project = make_project()
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary",
+            side_effect=lambda model, data, summary_type, additional_prompt: (
+                f"summary of {hash_data(data)}"
+            ),
+        )
+
+        first: Node = project.parser().parse()
+        # 3 files, 2 folders and the project
+        assert mock_generate.call_count == 6
+
+        project.write({"src/app/main.py": "def main(): return 1"})
+        mock_generate.reset_mock()
+        second: Node = project.parser(previous_nodes=first.index()).parse()
+
+        # The changed file, its folder and the project
+        assert mock_generate.call_count == 3
+        previous, current = first.index(), second.index()
+        assert current["lib"].description == previous["lib"].description
+        assert current["lib/core.py"].description == previous["lib/core.py"].description
+        assert (
+            current["src/app/main.py"].description
+            != previous["src/app/main.py"].description
+        )
+        assert current[""].content_hash != previous[""].content_hash
+
+    def test_unchanged_project_is_not_summarized(self, mocker, make_project):
+        project = make_project({"src/main.py": "def main(): pass"})
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", return_value="summary"
+        )
+        first: Node = project.parser().parse()
+        mock_generate.reset_mock()
+
+        second: Node = project.parser(previous_nodes=first.index()).parse()
+
+        mock_generate.assert_not_called()
+        assert second == first
+
+
+class TestAsyncParse:
+    def test_aparse_project(self, mocker, make_project):
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.agenerate_summary", return_value="summary"
+        )
+        project_parser = make_project().parser()
+
+        node: Node = asyncio.run(project_parser.aparse())
+
+        assert mock_generate.await_count == 6
+        assert node.description == "summary"
+        assert [child.name for child in node.children] == ["lib", "src/app"]
+        assert [child.name for child in node.children[1].children] == [
+            "main.py",
+            "utils.py",
+        ]
+
+    def test_aparse_semaphores(self, mocker, make_project):
+        project = make_project(
+            {f"src/file{i}.py": f"def f{i}(): pass" for i in range(10)},
+            max_async_file_requests=3,
+        )
+        in_flight = {"current": 0, "max": 0}
+
+        async def summary(model, data, summary_type, additional_prompt):
+            in_flight["current"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["current"])
+            await asyncio.sleep(0.01)
+            in_flight["current"] -= 1
+            return "summary"
+
+        mocker.patch("llm_devtale.parser.agenerate_summary", side_effect=summary)
+        node: Node = asyncio.run(project.parser().aparse())
+
+        assert len(node.children[0].children) == 10
+        assert in_flight["max"] == 3
+
+
+class TestBatchSmallFiles:
+    files = {
+        "src/a.py": "def a(): pass",
+        "src/b.py": "def b(): pass",
+        "src/c.py": "def c(): pass",
+    }
+
+    @pytest.fixture
+    def parser_config(self, make_project):
+        return make_project(
+            self.files, batch_small_files=True, use_cache=False
+        ).parser_config
+
+    def folder_parser(self, parser_config, **kwargs) -> FolderParser:
+        return FolderParser(
+            item_path=str(parser_config.directory / "src"),
+            parser_config=parser_config,
+            model=None,  # type: ignore
+            valid_files=list(self.files),
+            file_paths=list(self.files),
+            **kwargs,
+        )
+
+    def test_get_file_tasks(self, parser_config):
+        parser_config.max_files_per_batch = 2
+        records = {
+            "src/a.py": FileRecord("src/a.py", 13, "a", 5),
+            "src/b.py": FileRecord("src/b.py", 13, "b", 5),
+            "src/c.py": FileRecord("src/c.py", 13, "c", 5000),
+        }
+        folder_parser = self.folder_parser(parser_config, records=records)
+
+        tasks = [
+            [path.rpartition("/")[2] for path in task]
+            for task in folder_parser.get_file_tasks()
+        ]
+
+        assert tasks == [["c.py"], ["a.py", "b.py"]]
+
+    def test_get_file_tasks_disabled(self, parser_config):
+        parser_config.batch_small_files = False
+        folder_parser = self.folder_parser(parser_config)
+
+        assert [len(task) for task in folder_parser.get_file_tasks()] == [1, 1, 1]
+
+    def test_single_request(self, mocker, parser_config):
+        mock_batch = mocker.patch(
+            "llm_devtale.parser.generate_file_batch",
+            return_value='```json\n{"a.py": "A", "b.py": "B", "c.py": "C"}\n```',
+        )
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", return_value="folder"
+        )
+
+        node: Node = self.folder_parser(parser_config).parse()
+
+        mock_batch.assert_called_once()
+        assert [file["file_name"] for file in mock_batch.call_args.args[1]] == [
+            "a.py",
+            "b.py",
+            "c.py",
+        ]
+        # Only the folder summary
+        mock_generate.assert_called_once()
+        assert [(child.name, child.description) for child in node.children] == [
+            ("a.py", "A"),
+            ("b.py", "B"),
+            ("c.py", "C"),
+        ]
+
+    def test_missing_files_are_summarized_alone(self, mocker, parser_config):
+        mocker.patch(
+            "llm_devtale.parser.generate_file_batch",
+            return_value='{"a.py": "A", "b.py": ""}',
+        )
+        mock_generate = mocker.patch(
+            "llm_devtale.parser.generate_summary", return_value="summary"
+        )
+
+        node: Node = self.folder_parser(parser_config).parse()
+
+        # b.py, c.py and the folder
+        assert mock_generate.call_count == 3
+        assert [child.description for child in node.children] == [
+            "A",
+            "summary",
+            "summary",
+        ]
+
+    def test_summaries_are_cached_per_file(self, mocker, parser_config, tmp_path):
+        parser_config.use_cache = True
+        cache = SummaryCache(tmp_path / "cache.db")
+        mock_batch = mocker.patch(
+            "llm_devtale.parser.generate_file_batch",
+            return_value='{"a.py": "A", "b.py": "B", "c.py": "C"}',
+        )
+        mocker.patch("llm_devtale.parser.generate_summary", return_value="folder")
+        self.folder_parser(parser_config, cache=cache).parse()
+        mock_batch.reset_mock()
+
+        parser_config.batch_small_files = False
+        node: Node = self.folder_parser(parser_config, cache=cache).parse()
+
+        mock_batch.assert_not_called()
+        assert [child.description for child in node.children] == ["A", "B", "C"]
+
+    def test_aparse(self, mocker, parser_config):
+        mock_batch = mocker.patch(
+            "llm_devtale.parser.agenerate_file_batch",
+            return_value='{"a.py": "A", "b.py": "B", "c.py": "C"}',
+        )
+        mocker.patch("llm_devtale.parser.agenerate_summary", return_value="folder")
+
+        folder_parser = self.folder_parser(parser_config)
+        folder_parser.semaphores = {
+            NodeType.FILE: asyncio.Semaphore(2),
+            NodeType.FOLDER: asyncio.Semaphore(2),
+        }
+
+        node: Node = asyncio.run(folder_parser.aparse())
+
+        mock_batch.assert_awaited_once()
+        assert [child.description for child in node.children] == ["A", "B", "C"]
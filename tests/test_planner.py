@@ -0,0 +1,131 @@
+import builtins
+
+import pytest
+from llm_devtale.cache import SummaryCache
+from llm_devtale.files import FileRecord
+from llm_devtale.node import NodeType
+from llm_devtale.planner import Planner
+
+
+@pytest.fixture
+def project(make_project):
+    return make_project(dry_run=True, request_latency=2.0)
+
+
+@pytest.fixture
+def parser_config(project):
+    return project.parser_config
+
+
+def make_planner(project, with_content: bool = True):
+    records = {
+        path: FileRecord(
+            path=path,
+            size=len(content),
+            content_hash=path,
+            tokens=100,
+            content=content if with_content else None,
+        )
+        for path, content in project.files.items()
+    }
+    return Planner(project.parser(records=records))
+
+
+def test_plan(project):
+    plan = make_planner(project).plan()
+
+    assert plan.files == 3
+    assert plan.exact_files == 3
+    assert [plan.levels[node_type].requests for node_type in NodeType] == [3, 2, 1]
+    assert plan.requests == 6
+    # Files, src/app and lib, then the project
+    assert plan.wall_seconds == 3 * 2.0
+    assert [child.name for child in plan.node.children] == ["lib", "src/app"]
+    assert all(not node.description for node in plan.node.index().values())
+
+
+def test_exact_file_prompt(project):
+    planner = make_planner(project)
+    plan = planner.plan()
+
+    expected = sum(
+        planner.project_parser.prompt_tokens(
+            {"file_name": path.rpartition("/")[2], "file_content": content},
+            NodeType.FILE,
+        )
+        for path, content in project.files.items()
+    )
+    assert plan.levels[NodeType.FILE].input_tokens == expected
+
+
+def test_files_are_not_read(project, mocker):
+    open_spy = mocker.spy(builtins, "open")
+
+    plan = make_planner(project, with_content=False).plan()
+
+    assert not any(
+        str(call.args[0]).endswith(".py") for call in open_spy.call_args_list
+    )
+    assert plan.exact_files == 0
+    # Content tokens come from the records
+    assert plan.levels[NodeType.FILE].input_tokens > 3 * 100
+
+
+def test_batch_small_files(project, parser_config):
+    parser_config.batch_small_files = True
+
+    plan = make_planner(project).plan()
+
+    # main.py and utils.py in a batch
+    assert plan.levels[NodeType.FILE].requests == 2
+    assert plan.levels[NodeType.FILE].output_tokens == 3 * 80
+
+
+def test_large_files_are_chunked(project, parser_config):
+    parser_config.chunk_large_files = True
+    parser_config.max_tokens_per_file = 40
+
+    plan = make_planner(project, with_content=False).plan()
+
+    # 3 chunks and their reduce per file
+    assert plan.levels[NodeType.FILE].requests == 3 * 4
+
+
+def test_rate_limits_bound_wall_time(project, parser_config):
+    parser_config.requests_per_minute = 2
+
+    plan = make_planner(project).plan()
+
+    assert plan.wall_seconds == 6 / 2 * 60
+
+
+def test_reused_summaries_are_not_planned(project, make_project, mocker):
+    mocker.patch("llm_devtale.parser.generate_summary", return_value="summary")
+    previous_nodes = make_project().parser().parse()
+    planner = make_planner(project)
+    planner.project_parser.previous_nodes = previous_nodes.index()
+
+    plan = planner.plan()
+
+    assert plan.requests == 0
+    assert plan.reused == 3 + 2 + 1
+
+
+def test_cached_summaries_are_not_planned(project, parser_config, tmp_path):
+    parser_config.cache_dir = tmp_path / "cache"
+    planner = make_planner(project)
+    cache = SummaryCache.from_config(parser_config)
+    planner.project_parser.cache = cache
+    cache.set(
+        planner.project_parser.cache_key(
+            {"file_name": "core.py", "file_content": project.files["lib/core.py"]},
+            NodeType.FILE,
+        ),
+        "summary",
+    )
+
+    plan = planner.plan()
+
+    assert plan.reused == 1
+    assert [plan.levels[node_type].requests for node_type in NodeType] == [2, 2, 1]
+    cache.close()
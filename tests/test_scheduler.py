@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from llm_devtale.scheduler import PRIORITY_ROLLUP, Scheduler
+
+
+def test_submit():
+    with Scheduler(max_workers=2) as scheduler:
+        futures = [scheduler.submit(lambda x: x * x, i) for i in range(5)]
+
+    assert [future.result() for future in futures] == [0, 1, 4, 9, 16]
+
+
+def test_submit_error():
+    def fail():
+        raise ValueError("Test error")
+
+    with Scheduler(max_workers=2) as scheduler:
+        future = scheduler.submit(fail)
+
+    with pytest.raises(ValueError):
+        future.result()
+
+
+def test_dependencies():
+    done = []
+
+    def child(name):
+        time.sleep(0.01)
+        done.append(name)
+        return name
+
+    def parent(futures):
+        assert len(done) == len(futures)
+        return [future.result() for future in futures]
+
+    with Scheduler(max_workers=4) as scheduler:
+        children = [scheduler.submit(child, name) for name in "abc"]
+        rollup = scheduler.submit(parent, children, after=children)
+
+    assert rollup.result() == ["a", "b", "c"]
+
+
+def test_dependency_error():
+    def fail():
+        raise ValueError("Test error")
+
+    with Scheduler(max_workers=2) as scheduler:
+        child = scheduler.submit(fail)
+        rollup = scheduler.submit(lambda: child.exception() is not None, after=[child])
+
+    assert rollup.result() is True
+
+
+def test_max_workers():
+    with Scheduler(max_workers=3) as scheduler:
+        for _ in range(20):
+            scheduler.submit(time.sleep, 0.01)
+
+    assert scheduler.max_running == 3
+
+
+def test_rollups_run_before_queued_files():
+    order = []
+    gate = threading.Event()
+
+    with Scheduler(max_workers=1) as scheduler:
+        blocker = scheduler.submit(gate.wait)
+        scheduler.submit(order.append, "file")
+        scheduler.submit(order.append, "rollup", priority=PRIORITY_ROLLUP)
+        gate.set()
+        blocker.result()
+
+    assert order == ["rollup", "file"]
+
+
+def test_error_cancels_queued_tasks():
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def task(name):
+        started.set()
+        release.wait()
+        done.append(name)
+
+    with pytest.raises(KeyboardInterrupt):
+        with Scheduler(max_workers=1) as scheduler:
+            running = scheduler.submit(task, "running")
+            queued = [scheduler.submit(task, name) for name in "ab"]
+            rollup = scheduler.submit(task, "rollup", after=[running])
+            started.wait()
+            threading.Timer(0.05, release.set).start()
+            raise KeyboardInterrupt
+
+    # Only the task already running is waited for
+    assert done == ["running"]
+    assert all(future.cancelled() for future in queued + [rollup])
+
+
+def test_map_from_task():
+    def parts(items):
+        return scheduler.map(lambda item: time.sleep(0.01) or item * 2, items)
+
+    with Scheduler(max_workers=2) as scheduler:
+        futures = [scheduler.submit(parts, range(5)) for _ in range(3)]
+
+    assert all(future.result() == [0, 2, 4, 6, 8] for future in futures)
+    # The tasks run their own parts instead of waiting for a free worker
+    assert scheduler.max_running == 2
+
+
+def test_map_error():
+    def part(item):
+        if item == 1:
+            raise ValueError("Test error")
+        return item
+
+    with Scheduler(max_workers=1) as scheduler:
+        future = scheduler.submit(scheduler.map, part, range(3))
+
+    with pytest.raises(ValueError):
+        future.result()
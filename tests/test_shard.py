@@ -0,0 +1,74 @@
+import pytest
+from llm_devtale.config import SHARD_FOLDER, SHARD_HASH
+from llm_devtale.node import NodeType, save_tree
+from llm_devtale.shard import load_shards, parse_shard, shard_of
+
+FILES = {
+    "src/app/main.py": "def main(): pass",
+    "src/app/utils.py": "def util(): pass",
+    "lib/core.py": "def core(): pass",
+    "setup.py": "setup()",
+}
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (0, 4)
+    assert parse_shard("4/4") == (3, 4)
+    for value in ["0/4", "5/4", "1/0", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+@pytest.mark.parametrize("shard_by", [SHARD_FOLDER, SHARD_HASH])
+def test_shard_of(shard_by):
+    paths = [f"folder{i}/file{j}.py" for i in range(20) for j in range(5)]
+    shards = [shard_of(path, 4, shard_by) for path in paths]
+
+    assert set(shards) == {0, 1, 2, 3}
+    assert shards == [shard_of(path, 4, shard_by) for path in paths]
+
+
+def test_folder_shards_keep_top_level_folders_together():
+    assert shard_of("src/a/x.py", 8) == shard_of("src/b/y.py", 8)
+    assert shard_of("setup.py", 8) == shard_of("README.md", 8)
+
+
+def test_load_missing_shard(tmp_path):
+    with pytest.raises(ValueError):
+        load_shards([tmp_path / "missing.json"])
+
+
+def test_merge(mocker, tmp_path, make_project):
+    project = make_project(FILES, use_cache=False)
+    mock_generate = mocker.patch(
+        "llm_devtale.parser.generate_summary", return_value="summary"
+    )
+
+    parts = []
+    # Folders and the project are summarized by the merge
+    project.parser_config.skip_folder_readme = True
+    for shard_index in range(2):
+        shard_files = [
+            path for path in FILES if shard_of(path, 2, SHARD_HASH) == shard_index
+        ]
+        parts.append(tmp_path / f"shard{shard_index}.json")
+        save_tree(project.parser(shard_files).parse(), parts[-1])
+    # Only the files of every shard
+    assert mock_generate.call_count == len(FILES)
+    mock_generate.reset_mock()
+
+    shard_nodes = load_shards(parts)
+    assert sorted(shard_nodes) == sorted(FILES)
+    project.parser_config.skip_folder_readme = False
+    node = project.parser(sorted(shard_nodes), previous_nodes=shard_nodes).parse()
+
+    # src/app, lib and the project
+    summary_types = [
+        call.kwargs["summary_type"] for call in mock_generate.call_args_list
+    ]
+    assert sorted(summary_types, key=lambda summary_type: summary_type.value) == [
+        NodeType.FOLDER,
+        NodeType.FOLDER,
+        NodeType.REPOSITORY,
+    ]
+    assert node.index().keys() == {"", "lib", "src/app", *FILES}
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+# llm imports the plugin on every command, see register_commands
+HEAVY_MODULES = ["git", "tiktoken", "rich", "llm_devtale.parser", "llm_devtale.cli"]
+# Microseconds, the modules of a run take hundreds of milliseconds
+MAX_IMPORT_TIME = 50_000
+
+
+def run_python(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout, result.stderr
+
+
+def import_time(importtime_output, module):
+    """Cumulative microseconds of module from the -X importtime output."""
+    for line in importtime_output.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise AssertionError(f"{module} not imported")
+
+
+def test_registering_the_command_does_not_import_a_run():
+    stdout, _ = run_python(
+        "import sys\n"
+        "from llm.cli import cli\n"
+        "assert 'devtale' in cli.commands\n"
+        f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    )
+    assert stdout.strip() == "[]"
+
+
+def test_import_time():
+    # llm first, it is already imported when the plugin is loaded
+    _, stderr = run_python("import llm; import llm_devtale")
+
+    assert import_time(stderr, "llm_devtale") < MAX_IMPORT_TIME
@@ -0,0 +1,121 @@
+from unittest import mock
+
+import pytest
+from llm_devtale.node import NodeType
+from llm_devtale.stats import Stats, percentile, stats
+from llm_devtale.utils import TokenCounter, generate_summary
+
+
+@pytest.mark.parametrize(
+    "values, q, expected",
+    [
+        ([], 50, 0.0),
+        ([3.0], 99, 3.0),
+        ([4.0, 1.0, 3.0, 2.0], 50, 2.0),
+        ([float(i) for i in range(1, 101)], 90, 90.0),
+        ([float(i) for i in range(1, 101)], 99, 99.0),
+    ],
+)
+def test_percentile(values, q, expected):
+    assert percentile(values, q) == expected
+
+
+def test_stages():
+    recorder = Stats()
+
+    @recorder.timed("work")
+    def work():
+        return 1
+
+    assert work() == 1
+    with recorder.stage("work"):
+        pass
+
+    report = recorder.to_json()
+    assert report["stages"]["work"]["calls"] == 2
+
+
+def test_requests_and_counters():
+    recorder = Stats()
+    recorder.add_request("file", 1.0, 100, 10)
+    recorder.add_request("file", 3.0, 50, 5)
+    recorder.count("retries", 2)
+    recorder.count("retries")
+
+    report = recorder.to_json()
+    assert report["requests"]["file"] == {
+        "count": 2,
+        "input_tokens": 150,
+        "output_tokens": 15,
+        "p50_seconds": 1.0,
+        "p90_seconds": 3.0,
+        "p99_seconds": 3.0,
+        "max_seconds": 3.0,
+    }
+    assert report["counters"] == {"retries": 3}
+    assert len(recorder.to_tables()) == 3
+
+    recorder.reset()
+    assert recorder.to_json()["requests"] == {}
+
+
+def test_generate_summary_records_usage():
+    stats.reset()
+    mock_llm_model = mock.MagicMock()
+    response = mock_llm_model.prompt.return_value
+    response.text.return_value = "summary"
+    response.input_tokens = 120
+    response.output_tokens = 7
+
+    generate_summary(mock_llm_model, {"file_content": "code"}, NodeType.FILE)
+
+    request = stats.to_json()["requests"]["file"]
+    assert request["count"] == 1
+    assert request["input_tokens"] == 120
+    assert request["output_tokens"] == 7
+
+
+def test_generate_summary_estimates_usage(monkeypatch):
+    stats.reset()
+    monkeypatch.setattr(stats, "count_tokens", TokenCounter.count_tokens_batch)
+    mock_llm_model = mock.MagicMock()
+    response = mock_llm_model.prompt.return_value
+    response.text.return_value = "x" * 40
+    response.input_tokens = None
+    response.output_tokens = None
+
+    generate_summary(mock_llm_model, {"file_content": "code"}, NodeType.FOLDER)
+
+    request = stats.to_json()["requests"]["folder"]
+    assert request["input_tokens"] > 0
+    assert request["output_tokens"] > 0
+
+
+def test_usage_is_not_estimated_without_a_report():
+    stats.reset()
+    mock_llm_model = mock.MagicMock()
+    response = mock_llm_model.prompt.return_value
+    response.text.return_value = "x" * 40
+    response.input_tokens = None
+    response.output_tokens = None
+
+    generate_summary(mock_llm_model, {"file_content": "code"}, NodeType.FOLDER)
+
+    assert not stats.requests["folder"].uncounted_inputs
+    assert stats.to_json()["requests"]["folder"]["input_tokens"] == 0
+
+
+def test_uncounted_requests_are_counted_in_a_batch():
+    count_tokens = mock.Mock(side_effect=lambda texts: [len(text) for text in texts])
+    recorder = Stats()
+    recorder.count_tokens = count_tokens
+    recorder.add_request("file", 1.0, None, 5, input_text="abc")
+    recorder.add_request("file", 1.0, None, None, input_text="de", output_text="f")
+
+    report = recorder.to_json()
+
+    assert report["requests"]["file"]["input_tokens"] == 5
+    assert report["requests"]["file"]["output_tokens"] == 6
+    assert count_tokens.call_count == 2
+    # Counted once
+    assert recorder.to_json() == {**report, "wall_seconds": mock.ANY}
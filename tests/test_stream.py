@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+from llm_devtale.node import Node, NodeType
+from llm_devtale.stream import NodeStream, fan_out
+
+
+def test_jsonl():
+    out = io.StringIO()
+    stream = NodeStream(out)
+
+    stream("src/a.py", Node(name="a.py", description="A", node_type=NodeType.FILE))
+    stream("", Node(name="project", description="P", node_type=NodeType.REPOSITORY))
+
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == [
+        {
+            "event": "summary",
+            "path": "src/a.py",
+            "name": "a.py",
+            "node_type": "file",
+            "description": "A",
+        },
+        {
+            "event": "summary",
+            "path": ".",
+            "name": "project",
+            "node_type": "project",
+            "description": "P",
+        },
+    ]
+    assert stream.count == 2
+
+
+def test_markdown():
+    out = io.StringIO()
+    stream = NodeStream(out, stream_format="markdown")
+
+    stream("src", Node(name="src", description="Sources\n", node_type=NodeType.FOLDER))
+    stream("", Node(name="project", description="P", node_type=NodeType.REPOSITORY))
+
+    assert (
+        out.getvalue() == "## src (folder)\n\nSources\n\n# project (project)\n\nP\n\n"
+    )
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        NodeStream(io.StringIO(), stream_format="xml")
+
+
+def test_fan_out():
+    calls = []
+    node = Node(name="a.py", description="A", node_type=NodeType.FILE)
+
+    fan_out(
+        lambda path, node: calls.append(1), None, lambda path, node: calls.append(2)
+    )("a.py", node)
+
+    assert calls == [1, 2]
+    assert fan_out(None, None) is None
+
+
+def test_summaries_are_streamed_as_generated(mocker, make_project):
+    project = make_project({"src/a.py": "def a(): pass", "src/b.py": "def b(): pass"})
+    out = io.StringIO()
+    stream = NodeStream(out)
+    streamed_before_call = []
+
+    def summary(model, data, summary_type, additional_prompt):
+        streamed_before_call.append(stream.count)
+        return f"{summary_type.value} summary"
+
+    mocker.patch("llm_devtale.parser.generate_summary", side_effect=summary)
+    project.parser(on_node=stream).parse()
+
+    events = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert sorted(event["path"] for event in events[:2]) == ["src/a.py", "src/b.py"]
+    assert [(event["path"], event["description"]) for event in events[2:]] == [
+        ("src", "folder summary"),
+        (".", "project summary"),
+    ]
+    # The folder and project are summarized after their children were streamed
+    assert streamed_before_call[-2:] == [2, 3]
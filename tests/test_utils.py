@@ -1,10 +1,16 @@
+import asyncio
+import base64
 from unittest import mock
 
+import llm
 import pytest
 from llm_devtale.node import NodeType
 from llm_devtale.templates import SYSTEM_PROMPT
-from llm_devtale.utils import (TokenCounter, generate_summary, get_prompt,
-                               parallel_process)
+from llm_devtale.utils import (TokenCounter, agenerate_summary,
+                               generate_file_batch, generate_summary,
+                               get_async_llm_model, get_prompt,
+                               parallel_process, parse_batch_response)
+from tiktoken.load import load_tiktoken_bpe
 
 
 class TestParallelProcess:
@@ -53,6 +59,71 @@ class TestPrompt:
         assert TokenCounter.count_tokens("This is my prompt") == 4
 
 
+@pytest.fixture
+def token_counter():
+    yield TokenCounter
+    TokenCounter.configure()
+
+
+@pytest.fixture
+def bpe_file(tmp_path):
+    """Byte level BPE file with a single merge of "ab"."""
+    ranks = [bytes([i]) for i in range(256)] + [b"ab"]
+    path = tmp_path / "test.tiktoken"
+    path.write_text(
+        "".join(
+            f"{base64.b64encode(token).decode()} {rank}\n"
+            for rank, token in enumerate(ranks)
+        )
+    )
+    return path
+
+
+class TestTokenCounter:
+    def test_bpe_file(self, token_counter, bpe_file, mocker):
+        get_encoding = mocker.patch("llm_devtale.utils.tiktoken.get_encoding")
+        token_counter.configure(bpe_file=str(bpe_file))
+
+        assert token_counter.count_tokens("abab") == 2
+        assert token_counter.count_tokens("abc") == 2
+        get_encoding.assert_not_called()
+
+    def test_bpe_file_from_env(self, token_counter, bpe_file, monkeypatch):
+        monkeypatch.setenv("LLM_DEVTALE_TOKENIZER_FILE", str(bpe_file))
+        token_counter.configure()
+
+        assert token_counter.count_tokens("ab") == 1
+
+    def test_encoding_loaded_once(self, token_counter, bpe_file, mocker):
+        token_counter.configure(bpe_file=str(bpe_file))
+        load = mocker.patch(
+            "llm_devtale.utils.load_tiktoken_bpe",
+            wraps=load_tiktoken_bpe,
+        )
+
+        for _ in range(3):
+            token_counter.count_tokens("ab")
+
+        assert load.call_count == 1
+
+    def test_count_tokens_batch(self, token_counter, bpe_file):
+        token_counter.configure(bpe_file=str(bpe_file))
+        texts = ["ab", "abc", "", "<|endoftext|>"]
+
+        assert token_counter.count_tokens_batch(texts) == [
+            token_counter.count_tokens(text) for text in texts
+        ]
+
+    def test_encoding_not_available(self, token_counter, mocker):
+        mocker.patch(
+            "llm_devtale.utils.tiktoken.get_encoding", side_effect=OSError("offline")
+        )
+        token_counter.configure()
+
+        assert token_counter.count_tokens("x" * 40) == 10
+        assert token_counter.count_tokens_batch(["x" * 8, ""]) == [2, 0]
+
+
 class TestSummary:
     def test_generate_summary(self):
         mock_llm_model = mock.MagicMock()
@@ -100,3 +171,63 @@ class TestSummary:
         )
 
         assert additional_instruction in mock_llm_model.prompt.call_args[0][0]
+
+    def test_agenerate_summary(self):
+        mock_llm_model = mock.MagicMock()
+        expected_llm_response = "This is a mocked summary."
+        mock_llm_model.prompt.return_value.text = mock.AsyncMock(
+            return_value=expected_llm_response
+        )
+        test_data = {"name": "test_file.txt", "content": "print('hello world')"}
+
+        with mock.patch(
+            "llm_devtale.utils.get_prompt", return_value="File content: {data[content]}"
+        ):
+            result_summary = asyncio.run(
+                agenerate_summary(mock_llm_model, test_data, NodeType.FILE)
+            )
+
+        mock_llm_model.prompt.assert_called_once_with(
+            "File content: print('hello world')", system=SYSTEM_PROMPT
+        )
+        assert result_summary == expected_llm_response
+
+
+class TestFileBatch:
+    def test_generate_file_batch(self):
+        mock_llm_model = mock.MagicMock()
+        mock_llm_model.prompt.return_value.text.return_value = '{"a.py": "A"}'
+        files = [{"file_name": "a.py", "file_content": "def a(): pass"}]
+
+        result = generate_file_batch(mock_llm_model, files, additional_prompt="EXTRA")
+
+        prompt = mock_llm_model.prompt.call_args[0][0]
+        assert "def a(): pass" in prompt
+        assert "EXTRA" in prompt
+        assert mock_llm_model.prompt.call_args[1] == {"system": SYSTEM_PROMPT}
+        assert result == '{"a.py": "A"}'
+
+    @pytest.mark.parametrize(
+        "response, expected",
+        [
+            ('{"a.py": "A", "b.py": "B"}', {"a.py": "A", "b.py": "B"}),
+            ('```json\n{"a.py": " A "}\n```', {"a.py": "A"}),
+            ('Summaries: {"a.py": "A"} Done.', {"a.py": "A"}),
+            ('{"a.py": "A", "other.py": "O"}', {"a.py": "A"}),
+            ('{"a.py": "", "b.py": ["B"]}', {}),
+            ('["A", "B"]', {}),
+            ("{not json}", {}),
+            ("", {}),
+        ],
+    )
+    def test_parse_batch_response(self, response, expected):
+        assert parse_batch_response(response, ["a.py", "b.py"]) == expected
+
+
+class TestModels:
+    def test_get_async_llm_model_unknown(self):
+        with mock.patch(
+            "llm_devtale.utils.llm.get_async_model",
+            side_effect=llm.UnknownModelError("Unknown async model"),
+        ):
+            assert get_async_llm_model("sync-only-model") is None